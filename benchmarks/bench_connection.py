@@ -0,0 +1,115 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Connection benchmarks
+    ~~~~~~~~~~~~~~~~~~~~~
+    Request overhead against the stand-in server, session setup
+    and the asyncio client layer
+"""
+
+import pytest
+
+from cloudify_ansible_tower import connection
+from cloudify_ansible_tower.connection import AsyncConnection, Connection
+from cloudify_ansible_tower.resources.organization import Organization
+
+
+@pytest.fixture(scope='module')
+def organizations(server):
+    """A full page of organizations on the stand-in server"""
+    if not server.collections['organizations']:
+        for i in range(200):
+            server.add('organizations', name='organization-{0}'.format(i),
+                       description='x' * 256)
+    return server.collections['organizations']
+
+
+def test_request_small(benchmark, ctx):
+    client = Connection()
+    res = benchmark(client.request, method='get', url='/api/v2/')
+    assert res.status_code == 200
+
+
+def test_request_page(benchmark, ctx, organizations):
+    client = Connection()
+    res = benchmark(
+        client.request, method='get', url='/api/v2/organizations/',
+        params=dict(page_size=200))
+    assert len(res.json()['results']) == 200
+
+
+def test_request_post(benchmark, ctx):
+    client = Connection()
+    res = benchmark(
+        client.request, method='post', url='/api/v2/labels/',
+        json=dict(name='label', organization=1))
+    assert res.status_code == 201
+
+
+def test_session_construction(benchmark, ctx):
+    client = Connection()
+
+    def construct():
+        client.get_session_connection().close()
+    benchmark(construct)
+
+
+def test_connection_pooled(benchmark, ctx):
+    Connection()
+    assert benchmark(Connection).session is not None
+
+
+def test_async_request_gather(benchmark, ctx):
+    client = AsyncConnection(Connection())
+
+    def fan_out():
+        return connection.gather(
+            [client.request(method='get', url='/api/v2/')
+             for _ in range(20)])
+    assert [res.status_code for res in benchmark(fan_out)] == [200] * 20
+
+
+def test_async_lookup_id(benchmark, ctx, organizations):
+    names = ['organization-{0}'.format(i) for i in range(0, 200, 10)]
+
+    def lookup():
+        return connection.gather(
+            [Organization().async_lookup_id(name) for name in names],
+            limit=5)
+    ids = benchmark(lookup)
+    assert None not in ids and len(set(ids)) == len(names)
+
+
+def test_async_exists(benchmark, ctx, organizations):
+    resource = Organization()
+    resource.resource_id = min(organizations)
+    assert connection.run_until_complete(resource.async_exists())
+    missing = Organization()
+    missing.resource_id = max(organizations) + 1000
+    assert not connection.run_until_complete(missing.async_exists())
+    assert benchmark(
+        lambda: connection.run_until_complete(resource.async_exists()))
+
+
+def test_async_create_delete(benchmark, ctx, server):
+    def create_delete():
+        resource = Organization()
+        created = connection.run_until_complete(
+            resource.async_create(dict(name='async-organization')))
+        resource.resource_id = created['id']
+        connection.run_until_complete(resource.async_delete())
+        return created['id']
+    object_id = benchmark.pedantic(create_delete, rounds=20)
+    assert object_id not in server.collections['organizations']
@@ -0,0 +1,84 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Resource benchmarks
+    ~~~~~~~~~~~~~~~~~~~
+    Name-to-ID resolution and collection walks over large collections
+"""
+
+import pytest
+
+from cloudify_ansible_tower.cache import RESOLUTION_CACHE
+from cloudify_ansible_tower.resources.project import Project
+
+COLLECTION_SIZE = 5000
+
+
+@pytest.fixture(scope='module')
+def projects(server):
+    """Large project collection on the stand-in server"""
+    if not server.collections['projects']:
+        for i in range(COLLECTION_SIZE):
+            server.add('projects', name='project-{0}'.format(i),
+                       description='x' * 256)
+    return server.collections['projects']
+
+
+def bench_lookup(benchmark, name):
+    resource = Project()
+    return benchmark.pedantic(
+        resource.lookup_id, args=(name,),
+        setup=RESOLUTION_CACHE.clear, rounds=100, warmup_rounds=5)
+
+
+def test_lookup_id_by_name(benchmark, ctx, projects):
+    assert bench_lookup(benchmark, 'project-4999') is not None
+
+
+def test_lookup_id_by_id(benchmark, ctx, projects):
+    assert bench_lookup(benchmark, max(projects)) == max(projects)
+
+
+def test_lookup_id_by_url(benchmark, ctx, projects):
+    project_id = max(projects)
+    assert bench_lookup(
+        benchmark, projects[project_id]['url']) == project_id
+
+
+def test_lookup_id_missing(benchmark, ctx, projects):
+    assert bench_lookup(benchmark, 'no-such-project') is None
+
+
+def test_lookup_id_cached(benchmark, ctx, projects):
+    resource = Project()
+    resource.lookup_id('project-4999')
+    assert benchmark(resource.lookup_id, 'project-4999') is not None
+
+
+def test_iter_pages(benchmark, ctx, projects):
+    resource = Project()
+
+    def walk():
+        return sum(len(page['results']) for page in resource.iter_pages(
+            resource.collection_url, dict(page_size=resource.page_size)))
+    assert benchmark.pedantic(walk, rounds=10) == len(projects)
+
+
+def test_iter_all(benchmark, ctx, projects):
+    resource = Project()
+
+    def walk():
+        return sum(1 for _ in resource.iter_all())
+    assert benchmark.pedantic(walk, rounds=10) == len(projects)
@@ -0,0 +1,131 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Tracing benchmark
+    ~~~~~~~~~~~~~~~~~
+    Per-request logging overhead of Connection.request, comparing the
+    former unconditional formatting with the Tracer settings. The
+    pytest benchmarks time batches of 50 requests.
+
+    Usage::
+        pytest benchmarks/bench_tracing.py
+        # or, standalone
+        python -m benchmarks.bench_tracing
+"""
+
+import json
+import timeit
+import random
+import logging
+from functools import partial
+
+import pytest
+import requests
+
+from cloudify_ansible_tower.tracing import Tracer
+
+# A collection page of 200 hosts, and a launch with large extra_vars
+PAGE = dict(count=200, next=None, results=[
+    dict(id=i, name='host-{0}'.format(i),
+         variables=json.dumps(dict(ansible_host='10.0.0.{0}'.format(i),
+                                   ansible_password='secret')))
+    for i in range(200)])
+KWARGS = dict(
+    method='post',
+    url='https://tower.example.com/api/v2/job_templates/1/launch/',
+    json=dict(extra_vars=dict(('var{0}'.format(i), 'x' * 64)
+                              for i in range(500))))
+
+
+def make_response():
+    res = requests.Response()
+    res.status_code = 200
+    res._content = json.dumps(PAGE).encode('utf-8')
+    res.headers['Content-Type'] = 'application/json'
+    return res
+
+
+def legacy(log, kwargs, res):
+    """Connection.request and Resource logging before the Tracer"""
+    log.info('request({0})'.format(kwargs))
+    log.debug('headers: {0}'.format(dict(res.headers)))
+    data = None
+    if res.text:
+        data = res.json()
+    log.debug('response: (status={0}, data={1})'.format(
+        res.status_code, json.dumps(data, indent=2)))
+
+
+def traced(tracer, kwargs, res):
+    if tracer.request(kwargs):
+        tracer.response(res)
+
+
+# Tracer settings compared with the former formatting
+CONFIGS = [
+    ('level=info', dict(level='info')),
+    ('level=warning', dict(level='warning')),
+    ('level=debug (default)', dict()),
+    ('level=debug sample_rate=0.1', dict(level='debug', sample_rate=0.1)),
+]
+
+
+def get_logger():
+    """Connection logger discarding its records"""
+    logger = logging.getLogger('bench')
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    log = logger.getChild('connection')
+    log.setLevel(logging.DEBUG)
+    return log
+
+
+def bench_requests(benchmark, func, batch=50):
+    """Benchmarks `func` on batches of fresh responses"""
+    def run(responses):
+        for res in responses:
+            func(KWARGS, res)
+    benchmark.pedantic(
+        run, setup=lambda: (([make_response() for _ in range(batch)],), {}),
+        rounds=50)
+
+
+def test_trace_legacy(benchmark):
+    bench_requests(benchmark, partial(legacy, get_logger()))
+
+
+@pytest.mark.parametrize('config', [c for _, c in CONFIGS],
+                         ids=[name for name, _ in CONFIGS])
+def test_trace(benchmark, config):
+    random.seed(0)
+    bench_requests(benchmark, partial(traced, Tracer(get_logger(), config)))
+
+
+def main(number=200):
+    log = get_logger()
+    cases = [('legacy', partial(legacy, log))] + [
+        ('tracer ' + name, partial(traced, Tracer(log, config)))
+        for name, config in CONFIGS]
+    for name, func in cases:
+        # Responses cache their decoded text, so build one per call
+        responses = [make_response() for _ in range(number)]
+        elapsed = timeit.timeit(
+            lambda: func(KWARGS, responses.pop()), number=number)
+        print('{0:<40} {1:>10.1f} us/request'.format(
+            name, elapsed / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Payload benchmarks
+    ~~~~~~~~~~~~~~~~~~
+    Payload sanitization and merging of large nested structures
+"""
+
+import copy
+import json
+
+import yaml
+
+from cloudify_ansible_tower import schema, utils
+from cloudify_ansible_tower.resources.base import Resource
+
+
+def make_payload(width=50, depth=3):
+    """Nested payload, like large extra_vars or inventory variables"""
+    if depth == 0:
+        return dict(('key{0}'.format(i), 'value {0} é'.format(i))
+                    for i in range(width))
+    return dict(('group{0}'.format(i), make_payload(width // 2, depth - 1))
+                for i in range(width // 5))
+
+
+PAYLOAD = dict(name='job', extra_vars=make_payload(),
+               hosts=['host-{0}'.format(i) for i in range(1000)])
+JOB_TEMPLATE = dict(name='deploy', job_type='run', inventory='3',
+                    project=7, playbook='site.yml', forks='10',
+                    verbosity=1, become_enabled='true',
+                    extra_vars=make_payload())
+
+
+def legacy_sanitize_json_input(us_data):
+    """The JSON to YAML round trip sanitize_json_input used to do"""
+    return yaml.safe_load(
+        json.dumps(us_data, ensure_ascii=True).encode('utf8'))
+
+
+def test_sanitize_json_input_legacy(benchmark):
+    assert benchmark(legacy_sanitize_json_input, PAYLOAD) == PAYLOAD
+
+
+def test_sanitize_json_input(benchmark):
+    assert benchmark(Resource.sanitize_json_input, PAYLOAD) == PAYLOAD
+
+
+def test_sanitize_json_input_schema(benchmark):
+    schema.get_schema('JobTemplate')
+    params = benchmark(Resource.sanitize_json_input,
+                       JOB_TEMPLATE, 'JobTemplate')
+    assert params['forks'] == 10 and params['become_enabled'] is True
+
+
+def test_dict_update(benchmark):
+    updates = make_payload()
+    assert benchmark.pedantic(
+        utils.dict_update,
+        setup=lambda: ((copy.deepcopy(PAYLOAD['extra_vars']), updates), {}),
+        rounds=100)
@@ -0,0 +1,62 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Benchmark fixtures
+    ~~~~~~~~~~~~~~~~~~
+    Stand-in Tower server and mocked Cloudify operation context
+"""
+
+import pytest
+
+from cloudify.state import current_ctx
+
+from cloudify_ansible_tower import connection
+from cloudify_ansible_tower.cache import RESOLUTION_CACHE
+
+from benchmarks.load import make_ctx
+from benchmarks.server import StandIn
+
+
+@pytest.fixture(scope='session')
+def server():
+    """Stand-in Tower server, shared by the whole session"""
+    stand_in = StandIn()
+    stand_in.start()
+    yield stand_in
+    stand_in.stop()
+
+
+@pytest.fixture
+def ctx(server):
+    """Operation context, set as the current Cloudify context"""
+    _ctx = make_ctx(server.endpoint)
+    current_ctx.set(_ctx)
+    yield _ctx
+    current_ctx.clear()
+
+
+@pytest.fixture(autouse=True)
+def cold_caches():
+    """Benchmarks start without cached lookups"""
+    RESOLUTION_CACHE.clear()
+    yield
+    RESOLUTION_CACHE.clear()
+
+
+@pytest.fixture(scope='session', autouse=True)
+def sessions():
+    """Closes the pooled sessions once the session is over"""
+    yield
+    connection.close_sessions()
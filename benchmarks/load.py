@@ -0,0 +1,364 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Load driver
+    ~~~~~~~~~~~
+    Runs plugin lifecycle operations, with mocked Cloudify contexts,
+    against the stand-in Tower server and reports their throughput
+    and the API calls they made.
+
+    Usage::
+        python -m benchmarks.load --size 20000 --threads 8 \\
+            --iterations 50 --latency 0.005 --error-rate 0.01 \\
+            --job-duration 2 project user role job
+"""
+
+import time
+import logging
+import argparse
+import tempfile
+import itertools
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from cloudify.state import current_ctx
+from cloudify.mocks import (
+    MockCloudifyContext,
+    MockNodeContext,
+    MockNodeInstanceContext,
+    MockRelationshipContext,
+    MockRelationshipSubjectContext)
+
+from cloudify_ansible_tower import connection
+from cloudify_ansible_tower.resources import (
+    inventory, job, job_template, project, role, user)
+from cloudify_ansible_tower.resources.project import Project
+
+from benchmarks.server import StandIn
+
+NODE_TYPE = 'cloudify.ansible_tower.nodes.{0}'
+RELATIONSHIP_TYPE = 'cloudify.ansible_tower.relationships.{0}'
+# client_config keys shared by every context, set from the command line
+CLIENT_CONFIG = dict()
+
+
+def get_client_config(endpoint, **client_config):
+    """Client configuration for the stand-in server"""
+    client_config = dict(CLIENT_CONFIG, **client_config)
+    client_config.update(
+        endpoint=endpoint, access_token='benchmark', endpoint_verify=False)
+    return client_config
+
+
+def make_ctx(endpoint, properties=None, relationships=None,
+             **client_config):
+    """
+        Builds a node instance context using the stand-in server
+    :param string endpoint: Stand-in endpoint
+    :param dict properties: Node properties, on top of the defaults
+    :param list relationships: Relationship contexts
+    :rtype: :class:`cloudify.mocks.MockCloudifyContext`
+    """
+    node_properties = dict(
+        client_config=get_client_config(endpoint, **client_config),
+        resource_id='',
+        use_external_resource=False,
+        resource_config=dict())
+    node_properties.update(properties or dict())
+    return MockCloudifyContext(
+        node_id='benchmark',
+        properties=node_properties,
+        runtime_properties=dict(),
+        relationships=relationships or list())
+
+
+def make_subject(endpoint, node_type, resource_id):
+    """Builds the context of an existing resource, on a relationship"""
+    return MockRelationshipSubjectContext(
+        MockNodeContext(
+            properties=dict(
+                client_config=get_client_config(endpoint),
+                resource_id='',
+                use_external_resource=True),
+            type=NODE_TYPE.format(node_type)),
+        MockNodeInstanceContext(
+            runtime_properties=dict(resource_id=resource_id)))
+
+
+def make_relationship(endpoint, rel_type, node_type, resource_id):
+    """Builds a relationship to an existing resource"""
+    rel = MockRelationshipContext(
+        make_subject(endpoint, node_type, resource_id),
+        type=RELATIONSHIP_TYPE.format(rel_type))
+    rel.type_hierarchy = [rel.type]
+    return rel
+
+
+def populate(server, size):
+    """
+        Fills the stand-in with `size` users and projects, and
+        proportionally fewer organizations, teams, inventories,
+        credentials and job templates
+    """
+    organizations = [
+        server.add('organizations', name='organization-{0}'.format(i))
+        for i in range(max(1, size // 1000))]
+    for i in range(size):
+        org = organizations[i % len(organizations)]['id']
+        server.add('users', username='user-{0}'.format(i))
+        server.add('projects', name='project-{0}'.format(i),
+                   organization=org, scm_type='git')
+    for i in range(max(1, size // 10)):
+        org = organizations[i % len(organizations)]['id']
+        server.add('teams', name='team-{0}'.format(i), organization=org)
+        server.add('inventories', name='inventory-{0}'.format(i),
+                   organization=org)
+        server.add('credentials', name='credential-{0}'.format(i),
+                   organization=org, credential_type=1)
+        server.add('job_templates', name='job-template-{0}'.format(i),
+                   organization=org, ask_variables_on_launch=True,
+                   ask_limit_on_launch=True, ask_inventory_on_launch=True)
+
+
+def pick(server, collection, index):
+    """Picks an existing object of a collection"""
+    objects = server.collections[collection]
+    return objects[sorted(objects)[index % len(objects)]]
+
+
+def run(func, _ctx):
+    """Runs an operation under a context"""
+    with current_ctx.push(_ctx):
+        func()
+
+
+def scenario_lookup(server, index):
+    """Resolves the name of an existing project"""
+    _ctx = make_ctx(server.endpoint)
+    name = pick(server, 'projects', index * 7919)['name']
+    run(lambda: Project().lookup_id(name), _ctx)
+
+
+def scenario_project(server, index):
+    """Creates, then deletes, a project of an existing organization"""
+    _ctx = make_ctx(server.endpoint, dict(resource_config=dict(
+        name='load-project-{0}'.format(index),
+        organization=pick(server, 'organizations', index)['name'],
+        scm_type='git')))
+    run(project.create, _ctx)
+    run(project.delete, _ctx)
+
+
+def scenario_user(server, index):
+    """Creates, then deletes, a user member of a team and organization"""
+    endpoint = server.endpoint
+    _ctx = make_ctx(endpoint, dict(resource_config=dict(
+        username='load-user-{0}'.format(index))), [
+        make_relationship(endpoint, 'connected_to_team', 'Team',
+                          pick(server, 'teams', index)['id']),
+        make_relationship(endpoint, 'contained_in_organization',
+                          'Organization',
+                          pick(server, 'organizations', index)['id'])])
+    run(user.create, _ctx)
+    run(user.delete, _ctx)
+
+
+def scenario_role(server, index):
+    """Grants, then revokes, a job template role to a user"""
+    endpoint = server.endpoint
+    _ctx = MockCloudifyContext(
+        source=make_subject(endpoint, 'JobTemplate',
+                            pick(server, 'job_templates', index)['id']),
+        target=make_subject(endpoint, 'User',
+                            pick(server, 'users', index)['id']))
+    run(lambda: role.add_user(role='Execute'), _ctx)
+    run(lambda: role.remove_user(role='Execute'), _ctx)
+
+
+def scenario_job(server, index):
+    """Launches a job template and waits for the job, with its events"""
+    _ctx = make_ctx(server.endpoint, dict(
+        resource_config=dict(
+            job_template=pick(server, 'job_templates', index)['name'],
+            extra_vars=dict(index=index)),
+        wait_for_completion=True,
+        wait_config=dict(poll_interval=0.5, max_poll_interval=2),
+        events_config=dict(enabled=True)))
+    run(job.create, _ctx)
+
+
+def scenario_inventory(server, index):
+    """Creates, then deletes, an inventory of 50 hosts"""
+    _ctx = make_ctx(server.endpoint, dict(
+        resource_config=dict(
+            name='load-inventory-{0}'.format(index),
+            organization=pick(server, 'organizations', index)['name']),
+        hosts=['host-{0}'.format(i) for i in range(50)]))
+    run(inventory.create, _ctx)
+    run(inventory.delete, _ctx)
+
+
+def scenario_template(server, index):
+    """Creates, then deletes, a job template of a project and inventory"""
+    _ctx = make_ctx(server.endpoint, dict(resource_config=dict(
+        name='load-job-template-{0}'.format(index),
+        job_type='run',
+        project=pick(server, 'projects', index)['name'],
+        inventory=pick(server, 'inventories', index)['name'],
+        playbook='site.yml')))
+    run(job_template.create, _ctx)
+    run(job_template.delete, _ctx)
+
+
+SCENARIOS = {
+    'lookup': scenario_lookup,
+    'project': scenario_project,
+    'template': scenario_template,
+    'user': scenario_user,
+    'role': scenario_role,
+    'job': scenario_job,
+    'inventory': scenario_inventory,
+}
+
+
+def drive(server, scenario, iterations, threads, counter):
+    """
+        Runs a scenario `iterations` times on `threads` threads
+    :returns: Scenario statistics
+    :rtype: dict
+    """
+    durations = list()
+    errors = Counter()
+    lock = threading.Lock()
+
+    def one():
+        index = next(counter)
+        started = time.time()
+        try:
+            SCENARIOS[scenario](server, index)
+        except Exception as ex:
+            with lock:
+                errors[type(ex).__name__] += 1
+        with lock:
+            durations.append(time.time() - started)
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for _ in range(iterations):
+            executor.submit(one)
+    elapsed = time.time() - started
+    durations.sort()
+    return dict(
+        scenario=scenario,
+        runs=len(durations),
+        errors=errors,
+        seconds=elapsed,
+        throughput=len(durations) / elapsed if elapsed else 0,
+        p50=durations[len(durations) // 2],
+        p95=durations[min(len(durations) - 1,
+                          int(len(durations) * 0.95))])
+
+
+def report(results, server, calls_by_scenario):
+    print('{0:<10} {1:>6} {2:>7} {3:>9} {4:>9} {5:>9} {6:>9}'.format(
+        'scenario', 'runs', 'errors', 'seconds', 'runs/s',
+        'p50 ms', 'p95 ms'))
+    for result in results:
+        print('{0:<10} {1:>6} {2:>7} {3:>9.2f} {4:>9.1f} {5:>9.1f} '
+              '{6:>9.1f}'.format(
+                  result['scenario'], result['runs'],
+                  sum(result['errors'].values()), result['seconds'],
+                  result['throughput'], result['p50'] * 1000,
+                  result['p95'] * 1000))
+        for name, count in sorted(result['errors'].items()):
+            print('    {0}: {1}'.format(name, count))
+    for scenario, calls in calls_by_scenario.items():
+        runs = next(r['runs'] for r in results if r['scenario'] == scenario)
+        print('\nAPI calls of "{0}" ({1} total, {2:.1f} per run):'.format(
+            scenario, sum(calls.values()),
+            sum(calls.values()) / float(runs or 1)))
+        for (method, path), count in calls.most_common():
+            print('    {0:>7} {1:<6} {2}'.format(count, method, path))
+    if server.faults:
+        print('\nInjected faults: {0}'.format(', '.join(
+            '{0}: {1}'.format(status, count)
+            for status, count in sorted(server.faults.items()))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[3])
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help='Scenarios to run, among: {0} (default: all)'
+                        .format(', '.join(sorted(SCENARIOS))))
+    parser.add_argument('--size', type=int, default=10000,
+                        help='Number of users and of projects to create')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--job-duration', type=float, default=1.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rate-limit', type=float, default=0,
+                        help='Client-side rate limit (requests per second)')
+    parser.add_argument('--verbose', action='store_true',
+                        help='Show the operations log')
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error('unknown scenarios: {0}'.format(
+            ', '.join(sorted(unknown))))
+    args.scenarios = args.scenarios or sorted(SCENARIOS)
+    if args.rate_limit:
+        CLIENT_CONFIG['rate_limit'] = dict(
+            enabled=True, rate=args.rate_limit, burst=args.rate_limit,
+            path=tempfile.mkdtemp(prefix='load-ratelimit-'))
+
+    server = StandIn(
+        latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+        job_duration=args.job_duration, failure_rate=args.failure_rate,
+        seed=args.seed)
+    started = time.time()
+    populate(server, args.size)
+    print('Populated {0} objects in {1:.1f}s'.format(
+        sum(len(c) for c in server.collections.values()),
+        time.time() - started))
+    server.start()
+    # Every mocked context logs to stdout; like an agent running at
+    # WARNING, this also spares the tracer from serializing requests
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    counter = itertools.count()
+    results = list()
+    calls_by_scenario = defaultdict(Counter)
+    try:
+        for scenario in args.scenarios:
+            before = Counter(server.calls)
+            results.append(drive(
+                server, scenario, args.iterations, args.threads, counter))
+            calls_by_scenario[scenario] = server.calls - before
+    finally:
+        connection.close_sessions()
+        server.stop()
+    report(results, server, calls_by_scenario)
+
+
+if __name__ == '__main__':
+    main()
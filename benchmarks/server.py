@@ -0,0 +1,521 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Stand-in server
+    ~~~~~~~~~~~~~~~
+    In-process fake of the Ansible Tower / AWX REST API (v2) covering
+    the endpoints used by the plugin: collections with server-side
+    filtering and pagination, object roles and their associations,
+    sub-collection associations (users, teams, credentials, hosts),
+    the bulk host API, job template launches (sliced or not) and jobs
+    running for a configurable time while producing events.
+    Latency, 5xx errors and 429 throttling can be injected.
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import threading
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit, parse_qsl
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+API_PREFIX = '/api/v2/'
+MAX_PAGE_SIZE = 200
+DEFAULT_PAGE_SIZE = 25
+# Roles created along with objects of a collection
+OBJECT_ROLES = {
+    'organizations': ['Admin', 'Member', 'Read', 'Execute', 'Auditor'],
+    'teams': ['Admin', 'Member', 'Read'],
+    'projects': ['Admin', 'Use', 'Update', 'Read'],
+    'inventories': ['Admin', 'Use', 'Ad Hoc', 'Update', 'Read'],
+    'credentials': ['Admin', 'Use', 'Read'],
+    'job_templates': ['Admin', 'Execute', 'Read'],
+}
+# Sub-collections that objects can be associated with
+ASSOCIATIONS = ['users', 'teams', 'credentials', 'roles', 'hosts']
+# Launch parameters and the template field allowing them
+ASK_ON_LAUNCH = {
+    'extra_vars': 'ask_variables_on_launch',
+    'inventory': 'ask_inventory_on_launch',
+    'limit': 'ask_limit_on_launch',
+    'job_tags': 'ask_tags_on_launch',
+    'skip_tags': 'ask_skip_tags_on_launch',
+    'job_type': 'ask_job_type_on_launch',
+    'verbosity': 'ask_verbosity_on_launch',
+    'diff_mode': 'ask_diff_mode_on_launch',
+    'credentials': 'ask_credential_on_launch',
+    'scm_branch': 'ask_scm_branch_on_launch',
+}
+JOB_EVENT_TYPES = ['playbook_on_start', 'playbook_on_task_start',
+                   'runner_on_ok', 'runner_on_changed', 'playbook_on_stats']
+JOB_FINISHED = ['successful', 'failed', 'canceled']
+
+
+def singular(collection):
+    """Object type of a collection (ie. "inventories" -> "inventory")"""
+    if collection.endswith('ies'):
+        return collection[:-3] + 'y'
+    return collection.rstrip('s')
+
+
+class StandIn(object):
+    """
+        Fake Tower API holding its objects in memory
+    Example::
+        server = StandIn(latency=0.01, error_rate=0.01, job_duration=5)
+        endpoint = server.start()
+        server.add('projects', name='web')
+        ...
+        server.stop()
+    :param float latency: Seconds added to every request
+    :param float jitter: Maximum random seconds added to `latency`
+    :param float error_rate: Fraction of requests failing with a 503
+    :param float throttle_rate: Fraction of requests failing with a 429
+    :param int retry_after: Retry-After header of the 429 responses
+    :param float job_duration: Seconds launched jobs run for
+    :param int events_per_job: Number of events produced by each job
+    :param float failure_rate: Fraction of jobs ending as "failed"
+    :param int seed: Seed of the fault injection and job outcomes
+    """
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0,
+                 throttle_rate=0.0, retry_after=1, job_duration=0.0,
+                 events_per_job=10, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.job_duration = job_duration
+        self.events_per_job = events_per_job
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.collections = defaultdict(dict)
+        # Associated object IDs by (collection, ID, sub-collection)
+        self.members = defaultdict(set)
+        self.calls = Counter()
+        self.faults = Counter()
+        self.next_id = 1
+        self.lock = threading.RLock()
+        self.httpd = None
+        self.endpoint = None
+
+    def add(self, collection, **obj):
+        """Adds an object (and its roles) to a collection"""
+        with self.lock:
+            obj.setdefault('id', self.next_id)
+            self.next_id = max(self.next_id, obj['id']) + 1
+            url = '{0}{1}/{2}/'.format(API_PREFIX, collection, obj['id'])
+            obj['url'] = url
+            obj['type'] = singular(collection)
+            obj.setdefault('related', dict())
+            obj.setdefault('summary_fields', dict())
+            obj['_created'] = time.time()
+            self.collections[collection][obj['id']] = obj
+            if collection in OBJECT_ROLES:
+                obj['related']['object_roles'] = url + 'object_roles/'
+                object_roles = dict()
+                for name in OBJECT_ROLES[collection]:
+                    role = self.add_role(name, collection, obj['id'])
+                    object_roles[role['_field']] = dict(
+                        id=role['id'], name=name,
+                        description=role['description'])
+                obj['summary_fields']['object_roles'] = object_roles
+        return obj
+
+    def add_role(self, name, collection, object_id):
+        """Adds a role of an object"""
+        role_id = self.next_id
+        url = '{0}roles/{1}/'.format(API_PREFIX, role_id)
+        return self.add(
+            'roles', id=role_id, name=name,
+            description='Can {0} the {1}'.format(
+                name.lower(), singular(collection)),
+            related=dict(users=url + 'users/', teams=url + 'teams/'),
+            summary_fields=dict(resource_type=singular(collection),
+                                resource_id=object_id),
+            _field=name.lower().replace(' ', '') + '_role',
+            _object=(collection, object_id))
+
+    def start(self):
+        """
+            Starts serving on a random local port
+        :returns: Endpoint URL of the stand-in
+        :rtype: string
+        """
+        handler = type('Handler', (Handler,), dict(server_state=self))
+        self.httpd = Server(('127.0.0.1', 0), handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(
+            target=self.httpd.serve_forever, daemon=True).start()
+        self.endpoint = 'http://127.0.0.1:{0}'.format(
+            self.httpd.server_address[1])
+        return self.endpoint
+
+    def stop(self):
+        """Stops serving"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    @staticmethod
+    def public(obj):
+        """Strips the stand-in's private fields from an object"""
+        return {k: v for k, v in obj.items() if not k.startswith('_')}
+
+    def fault(self):
+        """
+            Waits for the configured latency and draws an
+            injected fault for a request
+        :returns: (status, body, headers), or None
+        :rtype: tuple
+        """
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+        draw = self.random.random()
+        if draw < self.throttle_rate:
+            self.faults[429] += 1
+            return 429, dict(detail='Request was throttled.'), {
+                'Retry-After': str(self.retry_after)}
+        if draw < self.throttle_rate + self.error_rate:
+            self.faults[503] += 1
+            return 503, dict(detail='Service unavailable.'), None
+        return None
+
+    @staticmethod
+    def matches(obj, key, value):
+        """Applies a Django-style query filter to an object"""
+        field, _, lookup = key.partition('__')
+        actual = obj.get(field)
+        if lookup == 'gt':
+            return actual is not None and actual > int(value)
+        if lookup == 'lte':
+            return actual is not None and actual <= int(value)
+        if lookup == 'in':
+            return str(actual) in value.split(',')
+        if isinstance(actual, bool):
+            return str(actual).lower() == value.lower()
+        return str(actual) == value
+
+    def list(self, items, path, query):
+        """Filters, orders and paginates objects"""
+        query = dict(query)
+        page = int(query.pop('page', 1))
+        page_size = min(
+            int(query.pop('page_size', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        order_by = query.pop('order_by', 'id')
+        for key, value in query.items():
+            items = [i for i in items if self.matches(i, key, value)]
+        field = order_by.lstrip('-')
+        items = sorted(items, key=lambda i: (i.get(field) is None,
+                                             i.get(field)),
+                       reverse=order_by.startswith('-'))
+        start = (page - 1) * page_size
+        next_url = None
+        if start + page_size < len(items):
+            next_url = '{0}?page={1}&page_size={2}&order_by={3}'.format(
+                path, page + 1, page_size, order_by)
+            next_url += ''.join(
+                '&{0}={1}'.format(k, v) for k, v in query.items())
+        return dict(count=len(items), next=next_url, previous=None,
+                    results=[self.public(i)
+                             for i in items[start:start + page_size]])
+
+    def create(self, collection, body, parent=None):
+        """
+            Creates an object from a POSTed body
+        :param tuple parent: (collection, ID) of the object the new
+            one is created under, if any
+        :returns: (status, body)
+        :rtype: tuple
+        """
+        if not isinstance(body, dict):
+            return 400, dict(detail='JSON object expected.')
+        key = 'username' if collection == 'users' else 'name'
+        if not body.get(key):
+            return 400, {key: ['This field is required.']}
+        if parent:
+            body[singular(parent[0])] = parent[1]
+        return 201, self.public(self.add(collection, **body))
+
+    def associate(self, collection, object_id, sub, body):
+        """
+            Associates (or disassociates) an object with a
+            sub-collection of another
+        :returns: (status, body)
+        :rtype: tuple
+        """
+        child = self.collections[sub].get(body.get('id'))
+        if child is None:
+            return 400, dict(msg='Object not found.')
+        members = self.members[(collection, object_id, sub)]
+        if body.get('disassociate'):
+            members.discard(child['id'])
+        else:
+            members.add(child['id'])
+        # Role membership, as seen from the role
+        if sub == 'roles':
+            self.associate('roles', child['id'], collection, dict(
+                id=object_id, disassociate=body.get('disassociate')))
+        return 204, None
+
+    def bulk_host_create(self, body):
+        """Creates many hosts of an inventory at once"""
+        inventory = self.collections['inventories'].get(body.get('inventory'))
+        if inventory is None:
+            return 400, dict(inventory=['Invalid inventory.'])
+        hosts = body.get('hosts') or list()
+        names = [h.get('name') for h in hosts]
+        existing = set(h['name'] for h in self.collections['hosts'].values()
+                       if h.get('inventory') == inventory['id'])
+        if not all(names) or len(set(names)) != len(names) or \
+                existing.intersection(names):
+            return 400, dict(hosts=['Invalid or duplicate host names.'])
+        created = list()
+        for host in hosts:
+            _, obj = self.create(
+                'hosts', dict(host), ('inventories', inventory['id']))
+            self.members[('inventories', inventory['id'], 'hosts')].add(
+                obj['id'])
+            created.append(obj)
+        return 201, dict(
+            url='{0}inventories/{1}/hosts/'.format(
+                API_PREFIX, inventory['id']),
+            hosts=created)
+
+    def launch(self, template_id, params):
+        """Launches a job template, sliced or not"""
+        template = self.collections['job_templates'][template_id]
+        ignored = {k: v for k, v in params.items()
+                   if k in ASK_ON_LAUNCH and
+                   not template.get(ASK_ON_LAUNCH[k])}
+        slices = int(template.get('job_slice_count') or 1)
+        if slices > 1:
+            workflow_job = self.add(
+                'workflow_jobs', name=template.get('name'),
+                status='pending', job_template=template_id)
+            for index in range(slices):
+                job = self.add_job(template, params, index + 1, slices)
+                self.add('workflow_job_nodes', job=job['id'],
+                         workflow_job=workflow_job['id'],
+                         summary_fields=dict(job=dict(id=job['id'])))
+            return 201, dict(
+                self.public(workflow_job), workflow_job=workflow_job['id'],
+                ignored_fields=ignored)
+        job = self.add_job(template, params)
+        return 201, dict(self.public(job), job=job['id'],
+                         ignored_fields=ignored)
+
+    def add_job(self, template, params, job_slice=0, slices=1):
+        """Adds a job running for `job_duration` seconds"""
+        return self.add(
+            'jobs', name=template.get('name'), status='pending',
+            job_template=template['id'], launch_type='manual',
+            extra_vars=json.dumps(params.get('extra_vars') or dict()),
+            limit=params.get('limit', ''), job_slice_number=job_slice,
+            job_slice_count=slices, failed=False, started=None,
+            finished=None, elapsed=0.0,
+            _fail=self.random.random() < self.failure_rate)
+
+    def refresh_job(self, job):
+        """Moves a job along its lifecycle, based on its age"""
+        if job['status'] in JOB_FINISHED:
+            return job
+        elapsed = time.time() - job['_created']
+        if elapsed < self.job_duration * 0.1:
+            job['status'] = 'pending'
+        elif elapsed < self.job_duration:
+            job['status'] = 'running'
+            job['started'] = job['started'] or time.time()
+        else:
+            job['status'] = 'failed' if job['_fail'] else 'successful'
+            job['failed'] = job['_fail']
+            job['finished'] = time.time()
+        job['elapsed'] = round(elapsed, 3)
+        return job
+
+    def refresh_workflow_job(self, workflow_job):
+        """Aggregates the status of the jobs of a workflow job"""
+        statuses = [node['summary_fields']['job']['status']
+                    for node in self.workflow_nodes(workflow_job)]
+        if all(status in JOB_FINISHED for status in statuses):
+            workflow_job['status'] = 'successful' if all(
+                status == 'successful' for status in statuses) \
+                else 'failed'
+        elif any(status != 'pending' for status in statuses):
+            workflow_job['status'] = 'running'
+        return workflow_job
+
+    def workflow_nodes(self, workflow_job):
+        """Gets the nodes of a workflow job, with their job status"""
+        nodes = [n for n in self.collections['workflow_job_nodes'].values()
+                 if n['workflow_job'] == workflow_job['id']]
+        for node in nodes:
+            node['summary_fields']['job']['status'] = self.refresh_job(
+                self.collections['jobs'][node['job']])['status']
+        return nodes
+
+    def job_events(self, job):
+        """Gets the events a job has produced so far"""
+        if self.refresh_job(job)['status'] in JOB_FINISHED:
+            produced = self.events_per_job
+        else:
+            produced = int(self.events_per_job * min(
+                1, (time.time() - job['_created']) / self.job_duration))
+        events = list()
+        for counter in range(1, produced + 1):
+            event = JOB_EVENT_TYPES[counter % len(JOB_EVENT_TYPES)]
+            if job['_fail'] and event == 'runner_on_changed':
+                event = 'runner_on_failed'
+            events.append(dict(
+                id=job['id'] * 100000 + counter, counter=counter,
+                job=job['id'], event=event, verbosity=0,
+                failed=event == 'runner_on_failed',
+                stdout='\x1b[0;32m{0}: {1}\x1b[0m'.format(event, counter)))
+        return events
+
+
+class Server(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Clients timing out and closing their connection are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            ThreadingHTTPServer.handle_error(
+                self, request, client_address)
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Request handler of the stand-in"""
+    protocol_version = 'HTTP/1.1'
+    # Replies are written in two parts, don't wait for delayed ACKs
+    disable_nagle_algorithm = True
+    server_state = None
+    route = re.compile(r'^/api/v2/(?:(\w+)/(?:(\d+)/(?:(\w+)/)?)?)?$')
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=None, headers=None):
+        data = b'' if body is None else json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or dict()).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'null')
+
+    def dispatch(self):
+        """
+            Handles a request
+        :returns: (status, body, headers)
+        :rtype: tuple
+        """
+        state = self.server_state
+        url = urlsplit(self.path)
+        body = self.read_body() if self.command == 'POST' else None
+        with state.lock:
+            state.calls[(self.command,
+                         re.sub(r'/\d+/', '/{id}/', url.path))] += 1
+        fault = state.fault()
+        if fault:
+            return fault
+        with state.lock:
+            status, body = self.route_request(
+                url.path, parse_qsl(url.query), body)
+        return status, body, None
+
+    def route_request(self, path, query, body):
+        state = self.server_state
+        if path == API_PREFIX + 'bulk/host_create/' and \
+                self.command == 'POST':
+            return state.bulk_host_create(body or dict())
+        match = self.route.match(path)
+        if not match:
+            return 404, dict(detail='Not found.')
+        collection, object_id, sub = match.groups()
+        if collection is None:
+            return 200, dict(
+                (name, '{0}{1}/'.format(API_PREFIX, name))
+                for name in ['ping', 'bulk', 'users', 'organizations',
+                             'teams', 'credentials', 'credential_types',
+                             'projects', 'inventories', 'hosts',
+                             'job_templates', 'jobs', 'workflow_jobs',
+                             'roles'])
+        if collection == 'ping':
+            return 200, dict(ha=False, version='22.0.0', active_node='fake',
+                             instances=[dict(node='fake', capacity=100)])
+        objects = state.collections[collection]
+        if object_id is None:
+            if self.command == 'GET':
+                return 200, state.list(list(objects.values()), path, query)
+            if self.command == 'POST':
+                return state.create(collection, body)
+            return 405, dict(detail='Method not allowed.')
+        obj = objects.get(int(object_id))
+        if obj is None:
+            return 404, dict(detail='Not found.')
+        if collection == 'jobs':
+            state.refresh_job(obj)
+        elif collection == 'workflow_jobs':
+            state.refresh_workflow_job(obj)
+        if sub is None:
+            if self.command == 'GET':
+                return 200, state.public(obj)
+            if self.command == 'DELETE':
+                del objects[obj['id']]
+                return 204, None
+            return 405, dict(detail='Method not allowed.')
+        return self.route_sub(collection, obj, sub, path, query, body)
+
+    def route_sub(self, collection, obj, sub, path, query, body):
+        state = self.server_state
+        if sub == 'launch' and self.command == 'POST':
+            return state.launch(obj['id'], body or dict())
+        if self.command == 'GET':
+            if sub == 'object_roles':
+                items = [r for r in state.collections['roles'].values()
+                         if r['_object'] == (collection, obj['id'])]
+            elif sub == 'job_events':
+                items = state.job_events(obj)
+            elif sub == 'workflow_nodes':
+                items = state.workflow_nodes(obj)
+            else:
+                items = [state.collections[sub][i] for i in sorted(
+                    state.members[(collection, obj['id'], sub)])
+                    if i in state.collections[sub]]
+            return 200, state.list(items, path, query)
+        if self.command == 'POST' and sub in ASSOCIATIONS:
+            body = body or dict()
+            if set(body) <= {'id', 'disassociate'}:
+                return state.associate(collection, obj['id'], sub, body)
+            status, created = state.create(
+                sub, body, (collection, obj['id']))
+            if status == 201:
+                state.members[(collection, obj['id'], sub)].add(
+                    created['id'])
+            return status, created
+        return 405, dict(detail='Method not allowed.')
+
+    def do_GET(self):
+        self.reply(*self.dispatch())
+
+    do_POST = do_GET
+    do_DELETE = do_GET
@@ -0,0 +1,183 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Circuit breaker
+    ~~~~~~~~~~~~~~~
+    Fail-fast handling of an unavailable Ansible Tower endpoint,
+    shared by every operation process on an agent
+"""
+
+import os
+import math
+import time
+import hashlib
+
+from cloudify.exceptions import RecoverableError
+
+from cloudify_ansible_tower import constants, utils
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+def get_circuit_breaker(endpoint, client_config, probe, logger):
+    """
+        Gets the circuit breaker configured in `client_config`
+    :param string endpoint: Tower endpoint the requests are sent to
+        (the comma-separated node endpoints, for a cluster)
+    :param dict client_config: Node client configuration
+    :param callable probe: Called without arguments to check if the
+        endpoint recovered, returns True if it did
+    :param `logging.Logger` logger: Logger to report state changes with
+    :returns: Circuit breaker, or None if it is disabled
+    :rtype: :class:`cloudify_ansible_tower.breaker.CircuitBreaker`
+    """
+    config = client_config.get('circuit_breaker') or dict()
+    if not config.get('enabled'):
+        return None
+    path = utils.make_private(
+        config.get('path') or constants.CIRCUIT_BREAKER_PATH,
+        directory=True)
+    return CircuitBreaker(
+        endpoint,
+        os.path.join(path, hashlib.sha1(
+            endpoint.encode('utf-8')).hexdigest()[:16] + '.breaker'),
+        probe, logger,
+        failure_threshold=config.get(
+            'failure_threshold', constants.CIRCUIT_BREAKER_THRESHOLD),
+        reset_timeout=config.get(
+            'reset_timeout', constants.CIRCUIT_BREAKER_RESET_TIMEOUT))
+
+
+class CircuitBreaker(object):
+    """
+        Circuit breaker for one Tower endpoint, whose state is kept in
+        a file shared by every process on the agent.
+
+        After `failure_threshold` consecutive failures (connection
+        errors, timeouts, exhausted retries or 5xx responses) the
+        circuit opens, and requests fail immediately with a
+        RecoverableError for `reset_timeout` seconds. A single process
+        then probes the endpoint (half-open state): the circuit closes
+        if the probe succeeds and opens again otherwise.
+    :param string endpoint: Tower endpoint
+    :param string path: Path to the state file
+    :param callable probe: Returns True if the endpoint is available
+    :param `logging.Logger` logger: Logger to report state changes with
+    :param int failure_threshold: Consecutive failures opening the circuit
+    :param int reset_timeout: Seconds the circuit stays open
+    """
+    def __init__(self, endpoint, path, probe, logger,
+                 failure_threshold=constants.CIRCUIT_BREAKER_THRESHOLD,
+                 reset_timeout=constants.CIRCUIT_BREAKER_RESET_TIMEOUT):
+        self.endpoint = endpoint
+        self.path = path
+        self.probe = probe
+        self.log = logger
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+
+    def update(self, func):
+        """Applies `func(state, now)` to the breaker state, under lock"""
+        def _update(state):
+            if not isinstance(state, dict):
+                state = dict(state=CLOSED, failures=0, until=0)
+            return state, func(state, time.time())
+        return utils.update_state_file(self.path, _update)
+
+    def unavailable(self, retry_after, reason):
+        return RecoverableError(
+            'Tower endpoint {0} is unavailable ({1}), failing fast'.format(
+                self.endpoint, reason),
+            retry_after=max(1, int(math.ceil(retry_after))))
+
+    def allow(self):
+        """
+            Checks if a request may be sent, probing the endpoint
+            when the circuit has been open long enough
+        :raises: :exc:`cloudify.exceptions.RecoverableError`, with
+            a retry_after hint, if the circuit is open
+        """
+        # Lock-free fast path, the circuit is closed most of the time
+        state = utils.read_state_file(self.path)
+        if not state or state.get('state') == CLOSED:
+            return
+
+        def _allow(state, now):
+            if state['state'] == CLOSED:
+                return None
+            if state['until'] > now:
+                return state['state'], state['until'] - now
+            # This process probes, the others keep failing fast
+            state['state'] = HALF_OPEN
+            state['until'] = now + constants.CIRCUIT_BREAKER_PROBE_TIMEOUT
+            return HALF_OPEN, 0
+        result = self.update(_allow)
+        if result is None:
+            return
+        state, remaining = result
+        if state == OPEN:
+            raise self.unavailable(remaining, 'circuit open')
+        if remaining:
+            raise self.unavailable(remaining, 'probe in progress')
+        self.log.info('Probing Tower endpoint {0}'.format(self.endpoint))
+        if self.probe():
+            self.success()
+            return
+        self.trip(force=True)
+        raise self.unavailable(self.reset_timeout, 'probe failed')
+
+    def success(self):
+        """Records a successful request"""
+        state = utils.read_state_file(self.path)
+        if not state or (state.get('state') == CLOSED and
+                         not state.get('failures')):
+            return
+
+        def _success(state, now):
+            previous = state['state']
+            state.update(state=CLOSED, failures=0, until=0)
+            return previous
+        if self.update(_success) != CLOSED:
+            self.log.info('Tower endpoint {0} is available again'.format(
+                self.endpoint))
+
+    def trip(self, force=False):
+        """
+            Records a failed request, opening the circuit once
+            `failure_threshold` consecutive requests failed
+        :param bool force: Open the circuit regardless of the count
+        """
+        def _trip(state, now):
+            state['failures'] += 1
+            if not force and state['failures'] < self.failure_threshold:
+                return False
+            opened = state['state'] != OPEN
+            state.update(state=OPEN, until=now + self.reset_timeout)
+            return opened and state['failures']
+        failures = self.update(_trip)
+        if failures:
+            self.log.warning(
+                'Tower endpoint {0} failed {1} times in a row, failing '
+                'fast for {2}s'.format(
+                    self.endpoint, failures, self.reset_timeout))
+
+    def record(self, status_code):
+        """Records the status code of a received response"""
+        if status_code in constants.CIRCUIT_BREAKER_STATUSES:
+            self.trip()
+        else:
+            self.success()
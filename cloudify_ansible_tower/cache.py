@@ -0,0 +1,283 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Cache
+    ~~~~~
+    In-process caches of Ansible Tower name-to-ID resolutions
+    and API responses
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+from requests.compat import urlsplit
+
+from cloudify_ansible_tower import constants
+
+
+class ResolutionCache(object):
+    """
+        LRU cache of resource name-to-ID resolutions. Entries are
+        grouped by namespace (one per connection and collection) so
+        that writes to a collection can drop everything known about it.
+    Example::
+        # Import
+        from cloudify_ansible_tower.cache import RESOLUTION_CACHE
+        # See how many lookups were served without a round trip
+        RESOLUTION_CACHE.stats()
+    :param int maxsize: Maximum number of entries to keep
+    :param dict ttls: Seconds to keep an entry for, per collection
+        endpoint (ie. "/jobs"). A TTL of 0 disables caching
+    :param int default_ttl: TTL for collections missing from `ttls`
+    :param int negative_ttl: TTL for "not found" results
+    """
+    def __init__(self,
+                 maxsize=constants.RESOLUTION_CACHE_MAXSIZE,
+                 ttls=None,
+                 default_ttl=constants.RESOLUTION_CACHE_DEFAULT_TTL,
+                 negative_ttl=constants.RESOLUTION_CACHE_NEGATIVE_TTL):
+        self.maxsize = maxsize
+        self.ttls = constants.RESOLUTION_CACHE_TTLS if ttls is None else ttls
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = dict(
+            hits=0, negative_hits=0, misses=0,
+            evictions=0, invalidations=0)
+
+    def ttl(self, namespace, value):
+        """Seconds an entry for `value` in `namespace` is valid for"""
+        ttl = self.ttls.get(namespace[-1], self.default_ttl)
+        if value is None:
+            return min(ttl, self.negative_ttl)
+        return ttl
+
+    def get(self, namespace, name):
+        """
+            Gets a cached resolution
+        :param tuple namespace: Connection and collection identity
+        :param string name: Name/ID that was resolved
+        :returns: (found, resource ID) tuple. The ID is None for
+            cached "not found" results
+        :rtype: tuple
+        """
+        key = (namespace, name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.time():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self._counters['misses'] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            if entry[0] is None:
+                self._counters['negative_hits'] += 1
+            else:
+                self._counters['hits'] += 1
+            return True, entry[0]
+
+    def set(self, namespace, name, value):
+        """
+            Caches a resolution
+        :param tuple namespace: Connection and collection identity
+        :param string name: Name/ID that was resolved
+        :param int value: Resource ID, or None if it doesn't exist
+        """
+        ttl = self.ttl(namespace, value)
+        if ttl <= 0:
+            return
+        key = (namespace, name)
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def invalidate(self, namespace):
+        """Drops every cached resolution in `namespace`"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == namespace]:
+                del self._entries[key]
+                self._counters['invalidations'] += 1
+
+    def clear(self):
+        """Drops every cached resolution"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+            Gets the cache counters
+        :returns: Hit, miss, eviction and invalidation counters
+            along with the current number of entries
+        :rtype: dict
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['size'] = len(self._entries)
+        return stats
+
+
+# Process-wide cache used by every Resource
+RESOLUTION_CACHE = ResolutionCache()
+# Process-wide cache of object role indexes, by target object. Roles
+# live and die with their object, so entries are never invalidated.
+OBJECT_ROLE_CACHE = ResolutionCache(ttls=dict())
+
+
+class ResponseCache(object):
+    """
+        LRU cache of GET responses, bounded by the total size of the
+        cached bodies. Responses carrying an ETag or Last-Modified
+        header can be revalidated once their TTL is over instead of
+        being fetched again.
+    Example::
+        # Import
+        from cloudify_ansible_tower.connection import Connection
+        # See how many bytes were served from the cache
+        Connection().response_cache.stats()
+    :param int max_bytes: Maximum total size of the cached bodies
+    :param int ttl: Seconds a response is served without a request
+    """
+    def __init__(self,
+                 max_bytes=constants.RESPONSE_CACHE_MAX_BYTES,
+                 ttl=constants.RESPONSE_CACHE_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._counters = dict(
+            hits=0, revalidations=0, misses=0, stores=0,
+            evictions=0, invalidations=0, bytes_saved=0)
+
+    @staticmethod
+    def validators(response):
+        """
+            Builds the conditional request headers for a response
+        :param `requests.Response` response: Cached response
+        :returns: If-None-Match/If-Modified-Since headers, empty
+            if the response can't be revalidated
+        :rtype: dict
+        """
+        headers = dict()
+        if response.headers.get('ETag'):
+            headers['If-None-Match'] = response.headers['ETag']
+        if response.headers.get('Last-Modified'):
+            headers['If-Modified-Since'] = response.headers['Last-Modified']
+        return headers
+
+    def get(self, url):
+        """
+            Gets a cached response
+        :param string url: Full request URL, including the query
+        :returns: (response, fresh) tuple. The response is None on
+            a miss, and fresh is False once its TTL is over
+        :rtype: tuple
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None, False
+            self._entries.move_to_end(url)
+            return entry[0], entry[2] > time.time()
+
+    def put(self, url, response):
+        """
+            Caches a (successful) response
+        :param string url: Full request URL, including the query
+        :param `requests.Response` response: Response to cache
+        """
+        size = len(response.content)
+        with self._lock:
+            self._discard(url)
+            if size > self.max_bytes:
+                return
+            self._entries[url] = (response, size, time.time() + self.ttl)
+            self._size += size
+            self._counters['stores'] += 1
+            while self._size > self.max_bytes:
+                _, entry = self._entries.popitem(last=False)
+                self._size -= entry[1]
+                self._counters['evictions'] += 1
+
+    def refresh(self, url):
+        """Restarts the TTL of a revalidated response"""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries[url] = (
+                    entry[0], entry[1], time.time() + self.ttl)
+
+    def discard(self, url):
+        """Drops a cached response"""
+        with self._lock:
+            self._discard(url)
+
+    def _discard(self, url):
+        entry = self._entries.pop(url, None)
+        if entry is not None:
+            self._size -= entry[1]
+
+    def invalidate(self, url):
+        """
+            Drops every cached response for `url`, the URLs under it
+            and its parent collections (ie. a POST to /projects/5/
+            drops /projects/5/, /projects/5/teams/ and /projects/)
+        :param string url: URL written to
+        """
+        path = urlsplit(url).path
+        with self._lock:
+            for key in list(self._entries):
+                cached = urlsplit(key).path
+                if cached.startswith(path) or path.startswith(cached):
+                    self._discard(key)
+                    self._counters['invalidations'] += 1
+
+    def record(self, counter, response=None):
+        """
+            Counts a cache lookup
+        :param string counter: "hits", "revalidations" or "misses"
+        :param `requests.Response` response: Response served from
+            the cache, if any
+        """
+        with self._lock:
+            self._counters[counter] += 1
+            if response is not None:
+                self._counters['bytes_saved'] += len(response.content)
+
+    def clear(self):
+        """Drops every cached response"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """
+            Gets the cache counters
+        :returns: Hit, revalidation, miss, store, eviction and
+            invalidation counters, the bytes served from the cache
+            along with the current number of entries and their size
+        :rtype: dict
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['size'] = len(self._entries)
+            stats['bytes'] = self._size
+        return stats
@@ -0,0 +1,260 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Cluster
+    ~~~~~~~
+    Request routing across the nodes of an Ansible Tower cluster
+"""
+
+import time
+import threading
+
+import requests
+from requests.packages import urllib3
+
+from cloudify_ansible_tower import constants
+
+# Methods routed to the least loaded node, the others stick to one node
+READ_METHODS = ['GET', 'HEAD', 'OPTIONS']
+
+
+def is_connect_error(ex):
+    """
+        Checks if a request failed before reaching Tower, in which
+        case it can be sent to another node whatever its method
+    :param `requests.RequestException` ex: Request error
+    :rtype: boolean
+    """
+    if isinstance(ex, requests.ConnectTimeout):
+        return True
+    if not isinstance(ex, requests.ConnectionError) or not ex.args:
+        return False
+    reason = getattr(ex.args[0], 'reason', None)
+    return isinstance(reason, (urllib3.exceptions.NewConnectionError,
+                               urllib3.exceptions.ConnectTimeoutError))
+
+
+def is_node_error(ex):
+    """
+        Checks if a request failed because its node couldn't be
+        reached or didn't answer in time, rather than because of
+        the request itself
+    :param `requests.RequestException` ex: Request error
+    :rtype: boolean
+    """
+    return isinstance(ex, (requests.ConnectionError, requests.Timeout))
+
+
+class Node(object):
+    """
+        Tower cluster node, with its health and load
+    :param string url: Node endpoint, ie. https://tower-1.example.com
+    """
+    def __init__(self, url):
+        self.url = url
+        self.healthy = True
+        # Exponentially weighted moving average of request latencies
+        self.latency = None
+        self.outstanding = 0
+        self.failed_at = 0
+
+    def observe(self, elapsed):
+        """Records the latency of a request or health check"""
+        if self.latency is None:
+            self.latency = elapsed
+        else:
+            self.latency += constants.CLUSTER_LATENCY_WEIGHT * (
+                elapsed - self.latency)
+
+    def __repr__(self):
+        return 'Node({0}, healthy={1}, latency={2}, outstanding={3})'.format(
+            self.url, self.healthy, self.latency, self.outstanding)
+
+
+class Cluster(object):
+    """
+        Routes requests across Tower cluster nodes. Reads go to the
+        healthy node with the lowest latency (or the fewest
+        outstanding requests), writes stick to one node until it
+        fails. Nodes that can't be reached are skipped until a
+        background health check finds them available again or, with
+        health checks disabled, until `retry_interval` has passed.
+    Example::
+        client_config:
+          endpoint:
+            - https://tower-1.example.com
+            - https://tower-2.example.com
+          cluster:
+            routing: outstanding
+    :param list endpoints: Node endpoints, the first one is used for
+        writes until it fails
+    :param dict config: Cluster configuration, with the keys
+        "routing", "health_interval", "health_timeout" and
+        "retry_interval"
+    :param bool verify: Verify the nodes' TLS certificates
+    :param `logging.Logger` logger: Logger to report node state with
+    """
+    def __init__(self, endpoints, config, verify, logger):
+        self.log = logger
+        self.nodes = [Node(url) for url in endpoints]
+        self.primary = endpoints[0]
+        self.routing = config.get('routing', constants.CLUSTER_ROUTING)
+        self.health_interval = config.get(
+            'health_interval', constants.CLUSTER_HEALTH_INTERVAL)
+        self.health_timeout = config.get(
+            'health_timeout', constants.CLUSTER_HEALTH_TIMEOUT)
+        self.retry_interval = config.get(
+            'retry_interval', constants.CLUSTER_RETRY_INTERVAL)
+        self.verify = verify
+        self.write_node = self.nodes[0]
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.checker = None
+
+    def start(self):
+        """Starts the background health checks"""
+        if self.health_interval and self.checker is None:
+            self.checker = threading.Thread(
+                target=self.check_health_forever, daemon=True)
+            self.checker.start()
+
+    def stop(self):
+        """Stops the background health checks"""
+        self.stopped.set()
+
+    def check_health_forever(self):
+        while not self.stopped.wait(self.health_interval):
+            self.check_health()
+
+    def check_health(self):
+        """Pings every node, updating its health and latency"""
+        for node in self.nodes:
+            started = time.monotonic()
+            try:
+                healthy = requests.get(
+                    node.url + constants.PING_URL, verify=self.verify,
+                    timeout=self.health_timeout).status_code == \
+                    requests.codes.ok
+            except requests.RequestException:
+                healthy = False
+            with self.lock:
+                if healthy:
+                    node.observe(time.monotonic() - started)
+                    if not node.healthy:
+                        self.log.info('Tower node {0} is back'.format(
+                            node.url))
+                node.healthy = healthy
+                if not healthy:
+                    node.failed_at = time.time()
+
+    def mark_down(self, node, reason):
+        """
+            Takes a node out of rotation until it passes a health
+            check (or, without health checks, for `retry_interval`)
+        """
+        with self.lock:
+            if node.healthy:
+                self.log.warning('Tower node {0} failed ({1}), failing '
+                                 'over'.format(node.url, reason))
+            node.healthy = False
+            node.failed_at = time.time()
+
+    def pick(self, read, exclude):
+        """
+            Chooses the node of a request
+        :param bool read: Read (True) or write (False) request
+        :param list exclude: Nodes already tried for the request
+        :returns: Node, or None if every node was tried
+        :rtype: :class:`Node`
+        """
+        with self.lock:
+            candidates = [node for node in self.nodes
+                          if node not in exclude]
+            if not candidates:
+                return None
+            if self.checker is None:
+                self.revive(candidates)
+            healthy = [node for node in candidates if node.healthy]
+            if not healthy:
+                # Nothing known to be up, try the longest-failed node
+                return min(candidates, key=lambda node: node.failed_at)
+            if not read:
+                if self.write_node not in healthy:
+                    # Fail over, in configuration order, and stick there
+                    self.write_node = healthy[0]
+                return self.write_node
+            if self.routing == 'outstanding':
+                return min(healthy, key=lambda node: (
+                    node.outstanding, node.latency or 0))
+            return min(healthy, key=lambda node: (
+                node.latency or 0, node.outstanding))
+
+    def revive(self, nodes):
+        """
+            Puts the nodes that failed more than `retry_interval`
+            seconds ago back into rotation. Used instead of the
+            health checks when they are disabled.
+        """
+        retry_before = time.time() - self.retry_interval
+        for node in nodes:
+            if not node.healthy and node.failed_at <= retry_before:
+                self.log.info('Trying Tower node {0} again'.format(
+                    node.url))
+                node.healthy = True
+
+    def route(self, send, **kwargs):
+        """
+            Sends a request to a cluster node, failing over to the
+            other nodes when it can't be reached (or, for reads, when
+            it answers with a server error). Only nodes that can't be
+            reached are taken out of rotation.
+        :param callable send: Sends a request, given its arguments
+        :returns: The received response
+        :rtype: :class:`requests.Response`
+        """
+        url = kwargs['url']
+        if not url.startswith(self.primary):
+            return send(**kwargs)
+        path = url[len(self.primary):]
+        read = kwargs.get('method', '').upper() in READ_METHODS
+        tried = list()
+        while True:
+            node = self.pick(read, tried)
+            tried.append(node)
+            kwargs['url'] = node.url + path
+            with self.lock:
+                node.outstanding += 1
+            started = time.monotonic()
+            try:
+                res = send(**kwargs)
+            except requests.RequestException as ex:
+                if is_node_error(ex):
+                    self.mark_down(node, ex.__class__.__name__)
+                if len(tried) == len(self.nodes) or not (
+                        read or is_connect_error(ex)):
+                    raise
+                continue
+            finally:
+                with self.lock:
+                    node.outstanding -= 1
+            if read and res.status_code in \
+                    constants.CLUSTER_FAILOVER_STATUSES and \
+                    len(tried) < len(self.nodes):
+                # Retried on another node, but this one stays in
+                # rotation as it answered
+                continue
+            with self.lock:
+                node.observe(time.monotonic() - started)
+            return res
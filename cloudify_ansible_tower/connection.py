@@ -21,12 +21,149 @@
 
 # Py3 Compatibility
 
-import json
+import time
+import atexit
+import asyncio
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 from requests.packages import urllib3
 
 from cloudify import ctx
-from cloudify_ansible_tower import utils
+from cloudify.state import current_ctx, NotInContext
+from cloudify.exceptions import RecoverableError
+from cloudify_ansible_tower import (
+    breaker, cache, cluster, constants, metrics, ratelimit, tracing, utils)
+
+# Process-wide registry of pooled requests.Session objects, keyed
+# by (endpoints, access_token, endpoint_verify, api_version) and
+# the settings changing how sessions retry (rate limiting and
+# circuit breaking)
+_SESSIONS = dict()
+# Worker pools backing AsyncConnection, keyed like _SESSIONS
+_EXECUTORS = dict()
+# Opt-in GET response caches, keyed like _SESSIONS
+_RESPONSE_CACHES = dict()
+# Request routers of multi-node endpoints, keyed like _SESSIONS
+_CLUSTERS = dict()
+_SESSIONS_LOCK = threading.Lock()
+# Deadline of the request being sent by the thread, read by DeadlineRetry
+_REQUEST = threading.local()
+# Attribute of the operation context holding the operation deadline
+DEADLINE_ATTRIBUTE = '_ansible_tower_deadline'
+
+
+def close_sessions():
+    """
+        Closes, and forgets, every pooled session and worker pool
+        in the process. This is registered to run at interpreter exit.
+    """
+    with _SESSIONS_LOCK:
+        for executor in _EXECUTORS.values():
+            executor.shutdown(wait=False)
+        _EXECUTORS.clear()
+        for session in _SESSIONS.values():
+            session.close()
+        _SESSIONS.clear()
+        _RESPONSE_CACHES.clear()
+        for tower_cluster in _CLUSTERS.values():
+            tower_cluster.stop()
+        _CLUSTERS.clear()
+
+
+atexit.register(close_sessions)
+
+
+def get_operation_deadline(timeout):
+    """
+        Gets the deadline of the current operation, starting it if
+        this is the first time it is asked for. The deadline is kept
+        on the operation context, so every connection of the
+        operation, in any thread, shares it.
+    :param float timeout: Seconds the operation may run for
+    :returns: Deadline (epoch), or None without timeout or context
+    :rtype: float
+    """
+    try:
+        op_ctx = current_ctx.get_ctx()
+    except NotInContext:
+        return None
+    deadline = getattr(op_ctx, DEADLINE_ATTRIBUTE, None)
+    if deadline is None and timeout:
+        deadline = time.time() + timeout
+        setattr(op_ctx, DEADLINE_ATTRIBUTE, deadline)
+    return deadline
+
+
+class DeadlineRetry(urllib3.util.Retry):
+    """
+        urllib3 retry policy that also gives up when the next attempt
+        would start after the deadline of the request being sent
+    """
+    def increment(self, method=None, url=None, response=None, error=None,
+                  _pool=None, _stacktrace=None):
+        new_retry = super(DeadlineRetry, self).increment(
+            method=method, url=url, response=response, error=error,
+            _pool=_pool, _stacktrace=_stacktrace)
+        deadline = getattr(_REQUEST, 'deadline', None)
+        if deadline is None:
+            return new_retry
+        wait = new_retry.get_backoff_time()
+        if response is not None:
+            wait = max(wait, new_retry.get_retry_after(response) or 0)
+        if time.time() + wait >= deadline:
+            _REQUEST.expired = True
+            raise urllib3.exceptions.MaxRetryError(
+                _pool, url, error or urllib3.exceptions.ResponseError(
+                    'operation deadline reached'))
+        return new_retry
+
+
+def run_until_complete(coro):
+    """
+        Runs a coroutine on a private event loop and returns its result.
+        This is how synchronous operation code drives async calls.
+    :param coroutine coro: Coroutine to run
+    :returns: Result of the coroutine
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def gather(coros, return_exceptions=False, limit=None):
+    """
+        Runs coroutines concurrently and returns their results
+    Example::
+        # Import
+        from cloudify_ansible_tower import connection
+        # Look up many users concurrently
+        ids = connection.gather(
+            [User().async_lookup_id(name) for name in names])
+    :param list coros: Coroutines to run
+    :param bool return_exceptions: Return exceptions raised by
+        coroutines as results instead of raising the first one
+    :param int limit: Maximum number of coroutines running at once
+    :returns: Results, in the same order as `coros`
+    :rtype: list
+    """
+    async def _gather():
+        if limit:
+            semaphore = asyncio.Semaphore(limit)
+
+            async def bounded(coro):
+                async with semaphore:
+                    return await coro
+            aws = [bounded(coro) for coro in coros]
+        else:
+            aws = coros
+        return await asyncio.gather(
+            *aws, return_exceptions=return_exceptions)
+    return run_until_complete(_gather())
 
 
 class Connection(object):
@@ -46,13 +183,281 @@ class Connection(object):
             plogger=logger)
         # Get credentials object
         self.creds = utils.get_credentials(_ctx=self.ctx)
-        # Get a pre-configured requests.Session object
-        self.session = self.get_session_connection()
+        self.config = utils.get_client_config(_ctx=self.ctx)
+        # Get the agent-wide rate limiter and circuit breaker, if
+        # enabled. They change how the session retries, so they are
+        # set up first. Clusters share a single circuit.
+        self.rate_limiter = ratelimit.get_rate_limiter(
+            self.creds.endpoint, self.config, self.log)
+        self.circuit_breaker = breaker.get_circuit_breaker(
+            ','.join(self.creds.endpoints), self.config, self.ping,
+            self.log)
+        # Get a shared, pre-configured requests.Session object
+        self.session = self.get_pooled_session()
+        # Get the shared GET response cache, if enabled
+        self.response_cache = self.get_response_cache()
+        # Get the shared cluster router, for multi-node endpoints
+        self.cluster = self.get_cluster()
+        self.tracer = tracing.Tracer(self.log, self.config.get('tracing'))
+        # Per-request timeouts, bounded by the operation deadline
+        self.connect_timeout = self.config.get(
+            'connect_timeout', constants.DEFAULT_CONNECT_TIMEOUT)
+        self.read_timeout = self.config.get(
+            'read_timeout', constants.DEFAULT_READ_TIMEOUT)
+        self.operation_timeout = self.config.get('operation_timeout')
+        self.deadline = get_operation_deadline(self.operation_timeout)
+
+    @property
+    def session_key(self):
+        """Key of this connection's session in the registry"""
+        return (self.creds.endpoints, self.creds.access_token,
+                self.creds.endpoint_verify, self.api_version,
+                self.rate_limiter is not None,
+                self.circuit_breaker is not None)
 
-    def __del__(self):
-        # Clean up any Session connections
-        if self.session:
-            self.session.close()
+    def get_pooled_session(self):
+        """
+            Gets the process-wide `requests.Session` for this
+            connection's parameters, creating it on first use.
+            Sessions are closed by :func:`close_sessions` at exit.
+
+        :returns: A shared, configured requests.Session instance
+        :rtype: :class:`requests.Session`
+        """
+        with _SESSIONS_LOCK:
+            session = _SESSIONS.get(self.session_key)
+            if session is None:
+                session = self.get_session_connection()
+                _SESSIONS[self.session_key] = session
+        return session
+
+    def get_response_cache(self):
+        """
+            Gets the process-wide GET response cache for this
+            connection's parameters, creating it on first use.
+
+        :returns: A shared response cache, or None if disabled
+        :rtype: :class:`cloudify_ansible_tower.cache.ResponseCache`
+        """
+        config = self.config.get('response_cache') or dict()
+        if not config.get('enabled'):
+            return None
+        with _SESSIONS_LOCK:
+            response_cache = _RESPONSE_CACHES.get(self.session_key)
+            if response_cache is None:
+                response_cache = cache.ResponseCache(
+                    max_bytes=config.get(
+                        'max_bytes', constants.RESPONSE_CACHE_MAX_BYTES),
+                    ttl=config.get('ttl', constants.RESPONSE_CACHE_TTL))
+                _RESPONSE_CACHES[self.session_key] = response_cache
+        return response_cache
+
+    def get_cluster(self):
+        """
+            Gets the process-wide router of this connection's
+            cluster nodes, creating it on first use.
+
+        :returns: A shared router, or None for a single endpoint
+        :rtype: :class:`cloudify_ansible_tower.cluster.Cluster`
+        """
+        if len(self.creds.endpoints) < 2:
+            return None
+        with _SESSIONS_LOCK:
+            tower_cluster = _CLUSTERS.get(self.session_key)
+            if tower_cluster is None:
+                tower_cluster = cluster.Cluster(
+                    self.creds.endpoints,
+                    self.config.get('cluster') or dict(),
+                    self.session.verify, self.log)
+                tower_cluster.start()
+                _CLUSTERS[self.session_key] = tower_cluster
+        return tower_cluster
+
+    def is_cacheable(self, url):
+        """Checks if GET responses for `url` may be cached"""
+        config = self.config.get('response_cache') or dict()
+        exclude = config.get('exclude', constants.RESPONSE_CACHE_EXCLUDE)
+        return not any(pattern in url for pattern in exclude)
+
+    def remaining(self):
+        """
+            Gets the time the operation has left
+
+        :returns: Seconds left, or None without operation deadline
+        :rtype: float
+        """
+        if self.deadline is None:
+            return None
+        return self.deadline - time.time()
+
+    def check_deadline(self):
+        """
+            Checks that the operation deadline hasn't passed
+
+        :raises: :exc:`cloudify.exceptions.RecoverableError`
+        """
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise RecoverableError(
+                'Operation deadline ({0}s) exceeded'.format(
+                    self.operation_timeout))
+
+    def sleep(self, seconds):
+        """
+            Sleeps, but not past the operation deadline
+
+        :raises: :exc:`cloudify.exceptions.RecoverableError` if
+            the deadline is reached
+        """
+        remaining = self.remaining()
+        if remaining is not None and remaining < seconds:
+            time.sleep(max(0, remaining))
+            self.check_deadline()
+        time.sleep(seconds)
+
+    def get_timeout(self):
+        """
+            Gets the (connect, read) timeouts of the next request,
+            bounded by the time the operation has left
+
+        :rtype: tuple
+        """
+        remaining = self.remaining()
+        if remaining is None:
+            return self.connect_timeout, self.read_timeout
+        return (min(self.connect_timeout, remaining),
+                min(self.read_timeout, remaining))
+
+    def ping(self):
+        """
+            Checks if Tower answers its (unauthenticated) ping
+            endpoint, without retries. Clusters are available as
+            long as one of their nodes answers.
+
+        :returns: True if Tower is available
+        :rtype: boolean
+        """
+        kwargs = dict(
+            method='get', url=self.creds.endpoint + constants.PING_URL,
+            verify=self.session.verify,
+            timeout=constants.CIRCUIT_BREAKER_PROBE_TIMEOUT)
+        try:
+            if self.cluster is None:
+                res = requests.request(**kwargs)
+            else:
+                res = self.cluster.route(requests.request, **kwargs)
+        except requests.RequestException as ex:
+            self.log.debug('Ping failed: {0}'.format(ex))
+            return False
+        return res.status_code == requests.codes.ok
+
+    def send(self, **kwargs):
+        """
+            Executes a request on the session. With the circuit
+            breaker enabled, requests fail fast with a RecoverableError
+            while Tower is deemed unavailable.
+
+        :returns: The received response
+        :rtype: :class:`requests.Response`
+        :raises: :exc:`cloudify.exceptions.RecoverableError`
+        """
+        if self.circuit_breaker is None:
+            return self.send_throttled(**kwargs)
+        self.circuit_breaker.allow()
+        try:
+            res = self.send_throttled(**kwargs)
+        except requests.RequestException:
+            self.circuit_breaker.trip()
+            raise
+        self.circuit_breaker.record(res.status_code)
+        return res
+
+    def send_throttled(self, **kwargs):
+        """
+            Executes a request on the session. With rate limiting
+            enabled, the request waits for the rate limiter and is
+            sent again when Tower throttles it.
+
+        :returns: The received response
+        :rtype: :class:`requests.Response`
+        """
+        if self.rate_limiter is None:
+            return self.send_routed(**kwargs)
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire(kwargs['url'], sleep=self.sleep)
+            res = self.send_routed(**kwargs)
+            if not self.rate_limiter.throttled(res, attempt):
+                return res
+            attempt += 1
+
+    def send_routed(self, **kwargs):
+        """
+            Executes a request on the session, on one of the cluster
+            nodes if the endpoint is a cluster.
+
+        :returns: The received response
+        :rtype: :class:`requests.Response`
+        """
+        if self.cluster is None:
+            return self.send_once(**kwargs)
+        return self.cluster.route(self.send_once, **kwargs)
+
+    def send_once(self, **kwargs):
+        """
+            Executes a request on the session, recording its
+            latency, status code and retries in the process metrics.
+
+        :returns: The received response
+        :rtype: :class:`requests.Response`
+        """
+        started = time.monotonic()
+        _REQUEST.deadline = self.deadline
+        _REQUEST.expired = False
+        try:
+            res = self.session.request(**kwargs)
+        except requests.RequestException:
+            metrics.METRICS.observe(
+                kwargs['method'], kwargs['url'], 'error',
+                time.monotonic() - started)
+            raise
+        metrics.METRICS.observe(
+            kwargs['method'], kwargs['url'], res.status_code,
+            time.monotonic() - started, metrics.get_retries(res))
+        return res
+
+    def cached_request(self, **kwargs):
+        """
+            Executes a GET request through the response cache.
+            Fresh responses are served without a request, stale
+            ones are revalidated when Tower supplied an ETag or
+            Last-Modified header.
+
+        :returns: The cached or received response
+        :rtype: :class:`requests.Response`
+        """
+        req = requests.models.PreparedRequest()
+        req.prepare_url(kwargs['url'], kwargs.get('params'))
+        url = req.url
+        res, fresh = self.response_cache.get(url)
+        if res is not None and fresh:
+            self.response_cache.record('hits', res)
+            return res
+        if res is not None:
+            kwargs['headers'] = dict(
+                kwargs.get('headers') or dict(),
+                **self.response_cache.validators(res))
+        new_res = self.send(**kwargs)
+        if res is not None and new_res.status_code == 304:
+            self.response_cache.refresh(url)
+            self.response_cache.record('revalidations', res)
+            return res
+        self.response_cache.record('misses')
+        if new_res.status_code == 200:
+            self.response_cache.put(url, new_res)
+        else:
+            self.response_cache.discard(url)
+        return new_res
 
     def request(self, **kwargs):
         """
@@ -71,17 +476,33 @@ class Connection(object):
             # Add the endpoint and subscription ID
             url = self.creds.endpoint + url
         kwargs['url'] = url
-        # Log the request details
-        self.log.info('request({0})'.format(kwargs))
-        res = self.session.request(**kwargs)
-        # Only get data if there's data to be gotten
-        data = None
-        if res.text:
-            data = res.json()
-        self.log.debug('response: '
-                       '(status={0}, data={1})'.format(
-                           res.status_code,
-                           json.dumps(data, indent=2)))
+        self.check_deadline()
+        kwargs.setdefault('timeout', self.get_timeout())
+        # Log the request details, if traced
+        traced = self.tracer.request(kwargs)
+        try:
+            if self.response_cache is None:
+                res = self.send(**kwargs)
+            elif kwargs.get('method', '').upper() != 'GET':
+                res = self.send(**kwargs)
+                self.response_cache.invalidate(url)
+            elif self.is_cacheable(url):
+                res = self.cached_request(**kwargs)
+            else:
+                res = self.send(**kwargs)
+        except requests.Timeout as ex:
+            raise RecoverableError('{0} {1} timed out: {2}'.format(
+                kwargs.get('method', '').upper(), url, ex))
+        except requests.RequestException as ex:
+            if not getattr(_REQUEST, 'expired', False):
+                raise
+            raise RecoverableError(
+                'Operation deadline ({0}s) reached while retrying '
+                '{1} {2}: {3}'.format(
+                    self.operation_timeout,
+                    kwargs.get('method', '').upper(), url, ex))
+        if traced:
+            self.tracer.response(res)
         return res
 
     def get_session_connection(self):
@@ -96,22 +517,95 @@ class Connection(object):
         # Build a session object with some fault tolerance
         # Retry up to 10 times with increasing backoff time
         # up to 120 seconds.
+        # Cluster nodes fail over instead of retrying connections
+        # and server errors on the same node.
+        retry_params = dict(total=10)
+        if len(self.creds.endpoints) > 1:
+            retry_params.update(
+                connect=0, status=constants.CLUSTER_STATUS_RETRIES)
+        # Throttled requests are retried by the rate limiter, which
+        # makes every process on the agent wait, not by urllib3
+        if self.rate_limiter is not None:
+            retry_params.update(respect_retry_after_header=False)
+        # Failures must reach the circuit breaker within seconds, not
+        # after minutes of backoff in every worker
+        if self.circuit_breaker is not None:
+            retry_params.update(total=constants.CIRCUIT_BREAKER_RETRIES)
         session = requests.Session()
-        session.mount(
-            self.creds.endpoint,
-            requests.adapters.HTTPAdapter(
-                max_retries=urllib3.util.Retry(
-                    total=10,
-                    backoff_factor=0.4,
-                    status_forcelist=[500, 501, 502, 503, 504]
-                )))
+        for endpoint in self.creds.endpoints:
+            session.mount(
+                endpoint,
+                requests.adapters.HTTPAdapter(
+                    pool_connections=self.config.get(
+                        'pool_connections',
+                        constants.DEFAULT_POOL_CONNECTIONS),
+                    pool_maxsize=self.config.get(
+                        'pool_maxsize', constants.DEFAULT_POOL_MAXSIZE),
+                    max_retries=DeadlineRetry(
+                        backoff_factor=0.4,
+                        status_forcelist=[500, 501, 502, 503, 504],
+                        **retry_params
+                    )))
         # SSL Verification
         if not self.creds.endpoint.startswith('http://'):
             session.verify = self.creds.endpoint_verify
-        # Set the API access token for the session
-        session.headers = {
+        # Set the API access token for the session. The default
+        # headers are kept so connections are reused (keep-alive).
+        session.headers.update({
             'Authorization': 'Bearer {0}'.format(
                 self.creds.access_token),
             'Content-Type': 'application/json'
-        }
+        })
         return session
+
+
+class AsyncConnection(object):
+    """
+        asyncio front-end for a :class:`Connection`. Blocking calls
+        are run on a worker pool shared by every connection with the
+        same session, so the pooled keep-alive connections are reused
+        and no more than `concurrency` requests are in flight at once.
+
+    :param `Connection` connection: Connection to issue requests with
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.log = connection.log
+        self.concurrency = connection.config.get(
+            'concurrency', constants.DEFAULT_CONCURRENCY)
+        self.executor = self.get_executor()
+
+    def get_executor(self):
+        """
+            Gets the process-wide worker pool for this
+            connection's session, creating it on first use.
+
+        :returns: A shared worker pool
+        :rtype: :class:`concurrent.futures.ThreadPoolExecutor`
+        """
+        with _SESSIONS_LOCK:
+            executor = _EXECUTORS.get(self.connection.session_key)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=self.concurrency)
+                _EXECUTORS[self.connection.session_key] = executor
+        return executor
+
+    async def call(self, func, *args, **kwargs):
+        """
+            Runs a blocking function on the worker pool, under
+            the Cloudify context of the caller.
+
+        :returns: Result of the function
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            partial(utils.bind_current_ctx(func), *args, **kwargs))
+
+    async def request(self, **kwargs):
+        """
+            Asynchronous :meth:`Connection.request`
+
+        :rtype: :class:`requests.Response`
+        """
+        return await self.call(self.connection.request, **kwargs)
@@ -17,5 +17,124 @@
     API constants
 '''
 
+import os
+
 CONFIG_PROPERTY = 'client_config'
 EXTERNAL_RESOURCE_ID = 'resource_id'
+
+# Connection pooling
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+
+# Pagination (Tower caps page_size at 200)
+DEFAULT_PAGE_SIZE = 200
+# Names resolved by one "<field>__in" filtered request
+BULK_LOOKUP_SIZE = 100
+
+# Name-to-ID resolution cache (TTLs in seconds, per collection)
+RESOLUTION_CACHE_MAXSIZE = 1024
+RESOLUTION_CACHE_DEFAULT_TTL = 300
+RESOLUTION_CACHE_NEGATIVE_TTL = 30
+RESOLUTION_CACHE_TTLS = {
+    '/jobs': 0,
+    '/hosts': 60
+}
+
+# Private, per-user directory of the state shared by every operation
+# process on the agent
+STATE_PATH = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or
+    os.path.join(os.path.expanduser('~'), '.cache'),
+    'cloudify-ansible-tower')
+
+# On-disk object index
+OBJECT_INDEX_PATH = os.path.join(STATE_PATH, 'index.sqlite')
+OBJECT_INDEX_MAX_AGE = 300
+OBJECT_INDEX_LOCK_TIMEOUT = 30
+OBJECT_INDEX_WARM_UP = [
+    '/organizations',
+    '/credential_types'
+]
+
+# Maximum number of requests in flight from one process (async calls)
+DEFAULT_CONCURRENCY = 10
+
+# Job completion polling (seconds)
+JOB_WAIT_TIMEOUT = 3600
+JOB_POLL_INTERVAL = 2
+JOB_MAX_POLL_INTERVAL = 60
+JOB_SUCCESSFUL = 'successful'
+JOB_FAILED_STATUSES = ['failed', 'error', 'canceled']
+JOB_EVENTS_PAGE_SIZE = 200
+
+# AWX bulk API (BULK_HOST_MAX_CREATE server setting default)
+BULK_HOST_CREATE_MAX = 100
+
+# HTTP GET response cache
+RESPONSE_CACHE_MAX_BYTES = 8 * 1024 * 1024
+RESPONSE_CACHE_TTL = 5
+# Never cached, their state changes without API writes
+RESPONSE_CACHE_EXCLUDE = ['/jobs/', '/workflow_jobs/']
+
+# Request/response tracing
+TRACE_LEVEL = 'debug'
+TRACE_MAX_BODY = 2048
+TRACE_SAMPLE_RATE = 1.0
+# Substrings of the JSON keys whose values are never logged
+TRACE_REDACT = ['password', 'secret', 'token', 'key_data', 'key_unlock',
+                'authorization', 'cookie']
+
+# Request metrics
+METRICS_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                           1, 2.5, 5, 10, 30]
+METRICS_PATH = os.path.join(STATE_PATH, 'metrics.prom')
+
+# Payload schemas, compiled from the data types of plugin.yaml
+RESOURCE_CONFIG_TYPE = 'cloudify.datatypes.ansible_tower.{0}.config'
+PLUGIN_YAML_PATHS = [
+    os.path.join(os.path.dirname(__file__), 'plugin.yaml'),
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'plugin.yaml'),
+]
+
+# Client-side rate limiting (requests per second on the agent)
+RATE_LIMIT_RATE = 10
+RATE_LIMIT_BURST = 20
+RATE_LIMIT_JITTER = 0.2
+RATE_LIMIT_MAX_RETRIES = 5
+RATE_LIMIT_BACKOFF = 1
+RATE_LIMIT_MAX_DELAY = 120
+RATE_LIMIT_STATUSES = [429]
+RATE_LIMIT_PATH = os.path.join(STATE_PATH, 'ratelimit')
+
+# Circuit breaker
+CIRCUIT_BREAKER_THRESHOLD = 5
+CIRCUIT_BREAKER_RESET_TIMEOUT = 30
+CIRCUIT_BREAKER_PROBE_TIMEOUT = 5
+CIRCUIT_BREAKER_STATUSES = [500, 502, 503, 504]
+CIRCUIT_BREAKER_PATH = os.path.join(STATE_PATH, 'breaker')
+# urllib3 retries behind each request seen by the circuit breaker
+CIRCUIT_BREAKER_RETRIES = 1
+PING_URL = '/api/v2/ping/'
+
+# Request timeouts (seconds)
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 60
+
+# Tower clusters (multi-node endpoints)
+CLUSTER_ROUTING = 'latency'
+CLUSTER_HEALTH_INTERVAL = 10
+CLUSTER_HEALTH_TIMEOUT = 5
+# Seconds before a failed node is tried again, without health checks
+CLUSTER_RETRY_INTERVAL = 30
+CLUSTER_LATENCY_WEIGHT = 0.2
+CLUSTER_STATUS_RETRIES = 1
+# Responses of read requests retried on another node
+CLUSTER_FAILOVER_STATUSES = [500, 502, 503, 504]
+
+# Fields of API objects kept in the "resource" runtime property
+# ("*" keeps the whole object)
+RESOURCE_FIELDS = [
+    'id', 'type', 'url', 'name', 'username', 'description', 'kind',
+    'organization', 'inventory', 'project', 'job_template',
+    'credential_type', 'playbook', 'job_type', 'status',
+    'created', 'modified', 'job', 'workflow_job', 'ignored_fields']
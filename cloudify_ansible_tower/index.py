@@ -0,0 +1,193 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Index
+    ~~~~~
+    On-disk index of Ansible Tower objects, shared by every
+    operation process on an agent
+"""
+
+import os
+import json
+import time
+import fcntl
+import sqlite3
+from contextlib import contextmanager
+
+from cloudify_ansible_tower import constants, utils
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS objects ('
+    ' endpoint TEXT, resource TEXT, field TEXT, value TEXT,'
+    ' object_id INTEGER, updated REAL,'
+    ' PRIMARY KEY (endpoint, resource, field, value))',
+    'CREATE TABLE IF NOT EXISTS sweeps ('
+    ' endpoint TEXT, resource TEXT, updated REAL,'
+    ' PRIMARY KEY (endpoint, resource))'
+]
+
+
+def get_object_index(client_config):
+    """
+        Gets the object index configured in `client_config`
+    :param dict client_config: Node client configuration
+    :returns: Object index, or None if the index is disabled
+    :rtype: :class:`cloudify_ansible_tower.index.ObjectIndex`
+    """
+    config = client_config.get('object_index') or dict()
+    if not config.get('enabled'):
+        return None
+    return ObjectIndex(
+        config.get('path') or constants.OBJECT_INDEX_PATH,
+        max_age=config.get('max_age', constants.OBJECT_INDEX_MAX_AGE),
+        warm_up=config.get('warm_up', constants.OBJECT_INDEX_WARM_UP))
+
+
+class ObjectIndex(object):
+    """
+        SQLite-backed index mapping (endpoint, collection, lookup
+        field, value) to object IDs. Writers serialize on an
+        exclusive file lock next to the database. The database, its
+        lock and its directory must be private to the current user.
+    :param string path: Path to the SQLite database file
+    :param int max_age: Seconds an indexed entry is trusted for
+    :param list warm_up: Collection endpoints (ie. "/organizations")
+        to index in bulk the first time one of their objects is missed
+    """
+    def __init__(self, path,
+                 max_age=constants.OBJECT_INDEX_MAX_AGE,
+                 warm_up=constants.OBJECT_INDEX_WARM_UP):
+        # SQLite journals live next to the database, so the whole
+        # directory must be private
+        utils.make_private(os.path.dirname(os.path.abspath(path)),
+                           directory=True)
+        self.path = utils.make_private(path)
+        utils.make_private(path + '.lock')
+        self.max_age = max_age
+        self.warm_up = warm_up
+
+    @contextmanager
+    def connect(self):
+        """Opens the database, committing on success"""
+        conn = sqlite3.connect(
+            self.path, timeout=constants.OBJECT_INDEX_LOCK_TIMEOUT)
+        try:
+            for statement in SCHEMA:
+                conn.execute(statement)
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    @contextmanager
+    def locked(self):
+        """Holds the exclusive writer lock"""
+        with open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get(self, endpoint, resource, fields, value):
+        """
+            Finds an indexed object ID
+        :param string endpoint: Tower endpoint
+        :param string resource: Collection endpoint (ie. "/projects")
+        :param list fields: Lookup fields to try, in order
+        :param value: Name/ID of the object
+        :returns: Object ID, or None if it isn't (freshly) indexed
+            or is ambiguous
+        :rtype: integer
+        """
+        oldest = time.time() - self.max_age
+        with self.connect() as conn:
+            for field in fields:
+                row = conn.execute(
+                    'SELECT object_id FROM objects WHERE endpoint = ? '
+                    'AND resource = ? AND field = ? AND value = ? '
+                    'AND updated >= ?',
+                    (endpoint, resource, field, json.dumps(value),
+                     oldest)).fetchone()
+                if row:
+                    return row[0]
+        return None
+
+    def put(self, endpoint, resource, fields, r_obj):
+        """Indexes a single, already resolved, object"""
+        with self.locked(), self.connect() as conn:
+            for field in fields:
+                if r_obj.get(field) is None:
+                    continue
+                conn.execute(
+                    'INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?)',
+                    (endpoint, resource, field, json.dumps(r_obj[field]),
+                     r_obj['id'], time.time()))
+
+    def is_warm(self, endpoint, resource):
+        """Checks if `resource` was swept within `max_age`"""
+        with self.connect() as conn:
+            row = conn.execute(
+                'SELECT updated FROM sweeps '
+                'WHERE endpoint = ? AND resource = ?',
+                (endpoint, resource)).fetchone()
+        return bool(row) and row[0] >= time.time() - self.max_age
+
+    def sweep(self, endpoint, resource, fields, pages):
+        """
+            Replaces the index of a collection with the objects
+            in `pages`. Values shared by several objects are stored
+            without an ID so that they are never resolved from here.
+        :param string endpoint: Tower endpoint
+        :param string resource: Collection endpoint (ie. "/projects")
+        :param list fields: Lookup fields to index
+        :param pages: Iterable of collection pages
+        :returns: Number of objects indexed
+        :rtype: integer
+        """
+        count = 0
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute(
+                'DELETE FROM objects WHERE endpoint = ? AND resource = ?',
+                (endpoint, resource))
+            for page in pages:
+                for r_obj in page.get('results', list()):
+                    count += 1
+                    for field in fields:
+                        if r_obj.get(field) is None:
+                            continue
+                        conn.execute(
+                            'INSERT INTO objects VALUES (?, ?, ?, ?, ?, ?) '
+                            'ON CONFLICT (endpoint, resource, field, value) '
+                            'DO UPDATE SET object_id = CASE WHEN '
+                            'object_id = excluded.object_id '
+                            'THEN object_id ELSE NULL END',
+                            (endpoint, resource, field,
+                             json.dumps(r_obj[field]), r_obj['id'], now))
+            conn.execute(
+                'INSERT OR REPLACE INTO sweeps VALUES (?, ?, ?)',
+                (endpoint, resource, now))
+        return count
+
+    def invalidate(self, endpoint, resource):
+        """Drops the index of a collection"""
+        with self.locked(), self.connect() as conn:
+            conn.execute(
+                'DELETE FROM objects WHERE endpoint = ? AND resource = ?',
+                (endpoint, resource))
+            conn.execute(
+                'DELETE FROM sweeps WHERE endpoint = ? AND resource = ?',
+                (endpoint, resource))
@@ -0,0 +1,276 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Metrics
+    ~~~~~~~
+    Per-endpoint request metrics of the Ansible Tower REST API client
+"""
+
+import os
+import re
+import fcntl
+import bisect
+import threading
+from functools import wraps
+
+from requests.compat import urlsplit
+
+from cloudify import ctx
+from cloudify.constants import RELATIONSHIP_INSTANCE
+
+from cloudify.exceptions import NonRecoverableError
+
+from cloudify_ansible_tower import constants, utils
+
+# Path segments replaced in endpoint templates (object IDs)
+ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+# (name, type, help) of the exported metric families
+FAMILIES = [
+    ('cloudify_ansible_tower_requests_total', 'counter',
+     'Tower API requests by method, endpoint and status code'),
+    ('cloudify_ansible_tower_request_retries_total', 'counter',
+     'Tower API request retries done by urllib3'),
+    ('cloudify_ansible_tower_request_duration_seconds', 'histogram',
+     'Tower API request latency, retries included'),
+]
+
+
+def get_endpoint_template(url):
+    """
+        Gets the endpoint template of a URL
+    Example::
+        get_endpoint_template(
+            'https://tower/api/v2/job_templates/5/launch/?a=b')
+        # '/api/v2/job_templates/{id}/launch/'
+    :param string url: Request URL
+    :returns: URL path with object IDs replaced by "{id}"
+    :rtype: string
+    """
+    return ID_SEGMENT.sub('/{id}', urlsplit(url).path)
+
+
+def get_retries(res):
+    """Gets the number of retries urllib3 did for a response"""
+    retries = getattr(res.raw, 'retries', None)
+    if retries is None:
+        return 0
+    return len(retries.history)
+
+
+class Metrics(object):
+    """
+        Request counters, retry counters and latency histograms
+        per (method, endpoint template), for the operation process.
+    Example::
+        # Import
+        from cloudify_ansible_tower.metrics import METRICS
+        # See the requests done so far
+        METRICS.summary()
+    :param list buckets: Upper bounds (seconds) of the latency buckets
+    """
+    def __init__(self, buckets=None):
+        self.buckets = buckets or constants.METRICS_LATENCY_BUCKETS
+        self._series = dict()
+        self._lock = threading.Lock()
+
+    def observe(self, method, url, status, elapsed, retries=0):
+        """
+            Records a request
+        :param string method: HTTP method
+        :param string url: Request URL
+        :param status: HTTP status code, or "error" if no
+            response was received
+        :param float elapsed: Seconds the request took
+        :param int retries: Number of retries behind the request
+        """
+        key = (method.upper(), get_endpoint_template(url))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = dict(
+                    statuses=dict(), retries=0, sum=0.0, max=0.0,
+                    buckets=[0] * len(self.buckets))
+            status = str(status)
+            series['statuses'][status] = \
+                series['statuses'].get(status, 0) + 1
+            series['retries'] += retries
+            series['sum'] += elapsed
+            series['max'] = max(series['max'], elapsed)
+            index = bisect.bisect_left(self.buckets, elapsed)
+            if index < len(self.buckets):
+                series['buckets'][index] += 1
+
+    def reset(self):
+        """Drops every recorded request"""
+        with self._lock:
+            self._series.clear()
+
+    def summary(self):
+        """
+            Gets the recorded requests, in a form that can be stored
+            in runtime properties
+        :returns: Count, status codes, retries, total and maximum
+            latency keyed by "<METHOD> <endpoint template>"
+        :rtype: dict
+        """
+        summary = dict()
+        with self._lock:
+            for (method, endpoint), series in self._series.items():
+                summary['{0} {1}'.format(method, endpoint)] = dict(
+                    count=sum(series['statuses'].values()),
+                    statuses=dict(series['statuses']),
+                    retries=series['retries'],
+                    seconds=round(series['sum'], 6),
+                    max_seconds=round(series['max'], 6))
+        return summary
+
+    def samples(self):
+        """
+            Gets the recorded requests as Prometheus samples
+        :returns: Sample values keyed by (metric name, labels)
+        :rtype: dict
+        """
+        requests, retries, duration = [name for name, _, _ in FAMILIES]
+        samples = dict()
+        with self._lock:
+            for (method, endpoint), series in self._series.items():
+                labels = 'method="{0}",endpoint="{1}"'.format(
+                    method, endpoint)
+                for status, count in series['statuses'].items():
+                    samples[(requests, '{0},status="{1}"'.format(
+                        labels, status))] = count
+                samples[(retries, labels)] = series['retries']
+                cumulative = 0
+                for bound, count in zip(self.buckets, series['buckets']):
+                    cumulative += count
+                    samples[(duration + '_bucket', '{0},le="{1}"'.format(
+                        labels, bound))] = cumulative
+                total = sum(series['statuses'].values())
+                samples[(duration + '_bucket',
+                         labels + ',le="+Inf"')] = total
+                samples[(duration + '_sum', labels)] = series['sum']
+                samples[(duration + '_count', labels)] = total
+        return samples
+
+
+def write_textfile(path, samples):
+    """
+        Adds samples to a Prometheus text-format file, so that the
+        file holds the totals of every operation run on the agent.
+        The totals are read back, so the file, and its directory,
+        must be private to the current user.
+    :param string path: Path to the .prom file
+    :param dict samples: Sample values keyed by (metric name, labels)
+    :raises: :exc:`cloudify.exceptions.NonRecoverableError` if the
+        file or its directory isn't private
+    """
+    sample_line = re.compile(r'^(\w+)\{(.*)\} (\S+)$')
+    utils.make_private(os.path.dirname(os.path.abspath(path)),
+                       directory=True)
+    with open(utils.make_private(path + '.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            totals = dict()
+            if os.path.exists(path):
+                with open(utils.make_private(path)) as prom_file:
+                    for line in prom_file:
+                        match = sample_line.match(line.strip())
+                        if match:
+                            totals[match.group(1, 2)] = \
+                                float(match.group(3))
+            for key, value in samples.items():
+                totals[key] = totals.get(key, 0) + value
+            lines = list()
+            for family, metric_type, description in FAMILIES:
+                lines.append('# HELP {0} {1}'.format(family, description))
+                lines.append('# TYPE {0} {1}'.format(family, metric_type))
+                for (name, labels), value in sorted(totals.items()):
+                    if name == family or (
+                            name.startswith(family + '_') and
+                            metric_type == 'histogram'):
+                        lines.append('{0}{{{1}}} {2:.12g}'.format(
+                            name, labels, value))
+            # Write a new file and rename it over the old one so
+            # that collectors never read a partial file
+            with open(utils.make_private(path + '.tmp'), 'w') as prom_file:
+                prom_file.write('\n'.join(lines) + '\n')
+            os.rename(path + '.tmp', path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def export(_ctx=ctx, store=True):
+    """
+        Exports the recorded requests as configured in the
+        `metrics` key of the node's `client_config`
+    :param bool store: Store the summary in the instance's
+        runtime properties (if configured to)
+    """
+    if _ctx.type == RELATIONSHIP_INSTANCE:
+        _ctx = _ctx.source
+    config = (_ctx.node.properties.get('client_config') or dict()).get(
+        'metrics') or dict()
+    if not config.get('enabled'):
+        return
+    summary = METRICS.summary()
+    if not summary:
+        return
+    if store and config.get('runtime_properties', True):
+        _ctx.instance.runtime_properties['metrics'] = summary
+        _ctx.instance.update()
+    path = config.get('path', constants.METRICS_PATH)
+    if path:
+        try:
+            write_textfile(path, METRICS.samples())
+        except (IOError, OSError, NonRecoverableError) as ex:
+            _ctx.logger.warning(
+                'Unable to write metrics to {0}: {1}'.format(path, ex))
+
+
+def collect(func):
+    """
+        Operation decorator recording the requests of the operation
+        and exporting them when it ends, whether it succeeds or not
+    Example::
+        @operation(resumable=True)
+        @metrics.collect
+        def create(**_):
+            ...
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        METRICS.reset()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            try:
+                # Runtime properties of deleted instances aren't
+                # written back, they were just cleaned up
+                export(store=not is_deletion(func))
+            except Exception as ex:
+                ctx.logger.warning(
+                    'Unable to export metrics: {0}'.format(ex))
+    return wrapper
+
+
+def is_deletion(func, _ctx=ctx):
+    """Checks if an operation deletes (or cleans up) its resource"""
+    operation = (getattr(_ctx.operation, 'name', None) or '').lower()
+    return func.__name__.startswith('delete') or \
+        operation.endswith(('.delete', '.cleanup'))
+
+
+# Process-wide metrics recorded by every Connection
+METRICS = Metrics()
@@ -0,0 +1,217 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Rate limiting
+    ~~~~~~~~~~~~~
+    Client-side rate limiting of Ansible Tower API requests, shared
+    by every operation process on an agent
+"""
+
+import os
+import time
+import random
+import hashlib
+from email.utils import parsedate_to_datetime
+
+from requests.compat import urlsplit
+
+from cloudify_ansible_tower import constants, utils
+
+
+def get_rate_limiter(endpoint, client_config, logger):
+    """
+        Gets the rate limiter configured in `client_config`
+    :param string endpoint: Tower endpoint the requests are sent to
+    :param dict client_config: Node client configuration
+    :param `logging.Logger` logger: Logger to report throttling with
+    :returns: Rate limiter, or None if rate limiting is disabled
+    :rtype: :class:`cloudify_ansible_tower.ratelimit.RateLimiter`
+    """
+    config = client_config.get('rate_limit') or dict()
+    if not config.get('enabled'):
+        return None
+    return RateLimiter(endpoint, config, logger)
+
+
+def get_retry_after(res):
+    """
+        Gets the delay requested by a response's Retry-After header
+    :returns: Seconds to wait, or None without a valid header
+    :rtype: float
+    """
+    value = res.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() -
+                   time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class TokenBucket(object):
+    """
+        Token bucket whose state lives in a small file, updated under
+        an exclusive file lock, so that every process using the same
+        file shares the bucket
+    :param string path: Path to the state file
+    :param float rate: Tokens added per second
+    :param int burst: Maximum number of tokens
+    """
+    def __init__(self, path, rate, burst):
+        self.path = path
+        self.rate = float(rate)
+        self.burst = max(1, burst)
+
+    def update(self, func):
+        """
+            Applies `func(state, now)` to the refilled bucket state,
+            under the file lock
+        :returns: Result of `func`
+        """
+        def _update(state):
+            now = time.time()
+            if not isinstance(state, dict):
+                state = dict(tokens=self.burst, updated=now, blocked=0)
+            state['tokens'] = min(
+                self.burst,
+                state['tokens'] + max(0, now - state['updated']) * self.rate)
+            state['updated'] = now
+            return state, func(state, now)
+        return utils.update_state_file(self.path, _update)
+
+    def take(self):
+        """
+            Takes a token, if one is available and the bucket isn't
+            blocked
+        :returns: Seconds to wait before trying again, 0 if a token
+            was taken
+        :rtype: float
+        """
+        def _take(state, now):
+            if state['blocked'] > now:
+                return state['blocked'] - now
+            if state['tokens'] >= 1:
+                state['tokens'] -= 1
+                return 0
+            return (1 - state['tokens']) / self.rate
+        return self.update(_take)
+
+    def block(self, delay):
+        """Blocks the bucket, and drains it, for `delay` seconds"""
+        def _block(state, now):
+            state['blocked'] = max(state['blocked'], now + delay)
+            state['tokens'] = 0
+        self.update(_block)
+
+
+class RateLimiter(object):
+    """
+        Token-bucket rate limiter for the requests sent to one Tower
+        endpoint. Every request takes a token from the endpoint's
+        bucket and, if its path contains one of the configured
+        patterns, from the bucket of that pattern as well. Buckets are
+        files shared by every process on the agent. Throttled (429)
+        responses block the endpoint's bucket for the Retry-After
+        delay, and waits are randomly stretched so that waiting
+        processes don't retry in lockstep.
+    Example::
+        rate_limit:
+          enabled: true
+          rate: 5
+          burst: 10
+          endpoints:
+            /launch/: {rate: 0.5, burst: 2}
+    :param string endpoint: Tower endpoint
+    :param dict config: Rate limiting configuration, with the keys
+        "rate", "burst", "jitter", "max_retries", "backoff", "path"
+        (directory private to the current user) and "endpoints"
+    :param `logging.Logger` logger: Logger to report throttling with
+    """
+    def __init__(self, endpoint, config, logger):
+        self.log = logger
+        self.jitter = config.get('jitter', constants.RATE_LIMIT_JITTER)
+        self.max_retries = config.get(
+            'max_retries', constants.RATE_LIMIT_MAX_RETRIES)
+        self.backoff = config.get('backoff', constants.RATE_LIMIT_BACKOFF)
+        path = utils.make_private(
+            config.get('path') or constants.RATE_LIMIT_PATH, directory=True)
+
+        def get_bucket(pattern, bucket_config):
+            key = hashlib.sha1('{0}|{1}'.format(
+                endpoint, pattern).encode('utf-8')).hexdigest()[:16]
+            return TokenBucket(
+                os.path.join(path, key + '.bucket'),
+                rate=bucket_config.get('rate', constants.RATE_LIMIT_RATE),
+                burst=bucket_config.get(
+                    'burst', constants.RATE_LIMIT_BURST))
+        self.bucket = get_bucket('', config)
+        # Longest patterns first, so the most specific one wins
+        self.endpoint_buckets = [
+            (pattern, get_bucket(pattern, bucket_config or dict()))
+            for pattern, bucket_config in sorted(
+                (config.get('endpoints') or dict()).items(),
+                key=lambda item: -len(item[0]))]
+
+    def get_buckets(self, url):
+        """Gets the buckets a request to `url` takes tokens from"""
+        path = urlsplit(url).path
+        for pattern, bucket in self.endpoint_buckets:
+            if pattern in path:
+                return [self.bucket, bucket]
+        return [self.bucket]
+
+    def acquire(self, url, sleep=time.sleep):
+        """
+            Waits until a request to `url` is allowed
+        :param callable sleep: Function waiting for a number of seconds
+        """
+        for bucket in self.get_buckets(url):
+            while True:
+                wait = bucket.take()
+                if not wait:
+                    break
+                sleep(wait * (1 + random.uniform(0, self.jitter)))
+
+    def throttled(self, res, attempt):
+        """
+            Checks if a response was throttled and, if so, blocks
+            the endpoint's bucket for the delay Tower asked for
+        :param `requests.Response` res: Received response
+        :param int attempt: Number of times the request was retried
+        :returns: True if the request should be sent again
+        :rtype: boolean
+        """
+        if res.status_code not in constants.RATE_LIMIT_STATUSES:
+            return False
+        delay = get_retry_after(res)
+        if delay is None:
+            delay = self.backoff * 2 ** attempt
+        delay = min(delay, constants.RATE_LIMIT_MAX_DELAY)
+        # Other requests wait as well, even if this one gives up
+        self.bucket.block(delay)
+        if attempt >= self.max_retries:
+            self.log.warning(
+                'Request to {0} still throttled after {1} retries'.format(
+                    res.url, attempt))
+            return False
+        self.log.warning(
+            'Request to {0} throttled (HTTP {1}), waiting {2:.1f}s'.format(
+                res.url, res.status_code, delay))
+        return True
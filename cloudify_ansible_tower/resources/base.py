@@ -19,14 +19,18 @@
     Ansible Tower API abstraction layer
 """
 
-import json
-import yaml
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 
 from cloudify import ctx
 from cloudify.exceptions import NonRecoverableError, RecoverableError
 
-from cloudify_ansible_tower import connection, utils
+from cloudify_ansible_tower import (
+    connection, constants, index, schema, utils)
+from cloudify_ansible_tower.cache import (
+    OBJECT_ROLE_CACHE, RESOLUTION_CACHE)
 
 
 class Resource(object):
@@ -59,11 +63,23 @@ class Resource(object):
         # Build the partial endpoint
         self.endpoint = endpoint
         self.api_version = 'v2'
+        self.page_size = constants.DEFAULT_PAGE_SIZE
         # Get a connection
         self.client = connection.Connection(
             logger=self.log,
             _ctx=self.ctx)
+        # Get the on-disk object index, if enabled
+        self.index = index.get_object_index(self.client.config)
+        self._async_client = None
         self._id = _id
+        self._object = None
+
+    @property
+    def async_client(self):
+        """asyncio front-end of the resource's connection"""
+        if not self._async_client:
+            self._async_client = connection.AsyncConnection(self.client)
+        return self._async_client
 
     @property
     def resource_id(self):
@@ -90,6 +106,11 @@ class Resource(object):
         """Create URL to the resource collection"""
         return '{0}/{1}{2}/'.format('/api', self.api_version, self.endpoint)
 
+    @property
+    def cache_namespace(self):
+        """Resolution cache namespace of the resource collection"""
+        return self.client.session_key + (self.endpoint,)
+
     def exists(self):
         """
             Checks if a resource exists
@@ -104,8 +125,6 @@ class Resource(object):
 
         # Make the request
         res = self.client.request(method='get', url=self.resource_url)
-        self.log.debug('headers: {0}'.format(dict(res.headers)))
-        # headers = self.lowercase_headers(res.headers)
         # Check the response
         # HTTP 200 (OK) - The resource already exists
         if res.status_code == requests.codes.ok:
@@ -114,22 +133,51 @@ class Resource(object):
 
     def list(self):
         """
-            Lists resources of a type
-        :param string name: Name of the resource type
+            Lists resources of a type. Only the first page of the
+            collection is returned, use :meth:`iter_all` to walk
+            every object of a collection.
         :returns: list of resources
         :rtype: list
         """
         self.log.info('Retrieving {0} resources'.format(self.name))
         # Make the request
         res = self.client.request(method='get', url=self.collection_url)
-        self.log.debug('headers: {0}'.format(dict(res.headers)))
-        # headers = self.lowercase_headers(res.headers)
         # Check the response
         # HTTP 200 (OK) - The resource already exists
         if res.status_code == requests.codes.ok:
             return res.json()
         return list()
 
+    def iter_all(self, filters=None, order_by=None, page_size=None,
+                 window=None):
+        """
+            Walks every resource of a type, reading pages ahead
+        Example::
+            for host in Host().iter_all(
+                    filters=dict(inventory=4, enabled=True)):
+                ...
+        :param dict filters: Server-side filters (Tower query
+            parameters, e.g. {"name__startswith": "web-"})
+        :param order_by: Field, or list of fields, to order by.
+            Defaults to "id", which keeps pages stable.
+        :param int page_size: Number of objects to request per page
+        :param int window: Maximum number of pages requested at once
+        :returns: Generator of resources
+        :rtype: generator of dict
+        :raises: :exc:`cloudify.exceptions.RecoverableError`,
+                 :exc:`requests.RequestException`
+        """
+        self.log.info('Retrieving {0} resources'.format(self.name))
+        params = dict(filters or dict())
+        if isinstance(order_by, (list, tuple)):
+            order_by = ','.join(order_by)
+        params['order_by'] = order_by or 'id'
+        params['page_size'] = page_size or self.page_size
+        for page in self.iter_pages_ahead(
+                self.collection_url, params, window=window):
+            for r_obj in page.get('results', list()):
+                yield r_obj
+
     def get(self):
         """
             Gets details about an existing resource
@@ -143,8 +191,6 @@ class Resource(object):
             self.name, self.resource_id))
         # Make the request
         res = self.client.request(method='get', url=self.resource_url)
-        self.log.debug('headers: {0}'.format(dict(res.headers)))
-        # headers = self.lowercase_headers(res.headers)
         # Check the response
         # HTTP 200 (OK) - The resource already exists
         if res.status_code == requests.codes.ok:
@@ -165,6 +211,36 @@ class Resource(object):
             'Expected HTTP status code {0}, recieved {1}'
             .format(requests.codes.ok, res.status_code))
 
+    def get_object(self, fields=None):
+        """
+            Gets the object of the context node lazily. The fields
+            stored in its "resource" runtime property are returned
+            when they include `fields`, otherwise the full object is
+            fetched, once per Resource instance.
+        Example::
+            template = JobTemplate()
+            # Stored fields, without a request
+            template.get_object(['id', 'name'])['name']
+            # Full object
+            template.get_object()['summary_fields']
+        :param list fields: Top-level fields the caller needs, None
+            for the full object
+        :returns: API object
+        :rtype: dict
+        :raises: :exc:`cloudify.exceptions.RecoverableError`,
+                 :exc:`cloudify.exceptions.NonRecoverableError`,
+                 :exc:`requests.RequestException`
+        """
+        if fields is not None and self._object is None:
+            stored = self.ctx.instance.runtime_properties.get('resource')
+            if isinstance(stored, dict) and \
+                    (self._id is None or stored.get('id') == self._id) \
+                    and all(field in stored for field in fields):
+                return stored
+        if self._object is None:
+            self._object = self.get()
+        return self._object
+
     def create(self, params):
         """
             Creates a new resource
@@ -177,13 +253,11 @@ class Resource(object):
         # Sanitize input data
         kwargs = params.pop('kwargs', dict())
         params = utils.dict_update(params, kwargs)
-        params = self.sanitize_json_input(params)
+        params = self.sanitize_json_input(params, self.name)
 
         # Make the request
         res = self.client.request(
             method='post', url=self.collection_url, json=params)
-        self.log.debug('headers: {0}'.format(dict(res.headers)))
-        # headers = self.lowercase_headers(res.headers)
         # Check the response
         # If API sent a 400, we're sending bad data
         if res.status_code == requests.codes.bad_request:
@@ -195,6 +269,8 @@ class Resource(object):
             raise RecoverableError(
                 'Expected HTTP status code {0}, recieved {1}'
                 .format(requests.codes.created, res.status_code))
+        # Names (or "not found" results) may now resolve differently
+        self.invalidate_lookups()
         return res.json()
 
     def delete(self):
@@ -209,11 +285,10 @@ class Resource(object):
 
         # Make the request
         res = self.client.request(method='delete', url=self.resource_url)
-        self.log.debug('headers: {0}'.format(dict(res.headers)))
-        # headers = self.lowercase_headers(res.headers)
         # Check the response
         # If API sent 204, we're good
         if res.status_code in [requests.codes.no_content, requests.codes.accepted]:
+            self.invalidate_lookups()
             return
         # If API sent a 400, we're sending bad data
         if res.status_code == requests.codes.bad_request:
@@ -226,84 +301,535 @@ class Resource(object):
             'Expected HTTP status code {0}, recieved {1}'
             .format(requests.codes.no_content, res.status_code))
 
-    def lookup_id(self, name):
+    def associate(self, url, _id, disassociate=False):
         """
-            Find a resource's ID
-        :param string name: Name/ID of the existing resource
-        :returns: Resource ID
-        :rtype: integer
+            Associates (or disassociates) an object with a
+            sub-collection of the resource, or with a role
+        :param string url: URL of the sub-collection, e.g. the
+            resource's "users/"
+        :param int _id: ID of the object to associate
+        :param bool disassociate: Remove the association instead
+        :raises: :exc:`cloudify.exceptions.RecoverableError`,
+                 :exc:`cloudify.exceptions.NonRecoverableError`
+        """
+        body = dict(id=_id)
+        if disassociate:
+            body['disassociate'] = True
+        # Make the request
+        res = self.client.request(method='post', url=url, json=body)
+        # Check the response
+        # If API sent a 400, we're sending bad data
+        if res.status_code == requests.codes.bad_request:
+            self.log.info('BAD REQUEST: response: {}'.format(res.content))
+            raise NonRecoverableError(
+                '{0} BAD REQUEST'.format(self.name))
+        # All other errors will be treated as recoverable
+        if res.status_code != requests.codes.no_content:
+            raise RecoverableError(
+                'Expected HTTP status code {0}, recieved {1}'
+                .format(requests.codes.no_content, res.status_code))
+
+    def get_member_ids(self, url):
+        """
+            Gets the IDs of the objects of a sub-collection
+        :param string url: URL of the sub-collection, e.g. the
+            resource's "users/"
+        :rtype: set
+        :raises: :exc:`cloudify.exceptions.RecoverableError`,
+                 :exc:`requests.RequestException`
+        """
+        return set(
+            r_obj['id']
+            for page in self.iter_pages_ahead(
+                url, dict(page_size=self.page_size))
+            for r_obj in page.get('results', list()))
+
+    def sync_members(self, sub, members, member_type, prune=True,
+                     limit=None):
+        """
+            Makes a sub-collection of the resource (e.g. the users of
+            a team) match `members`. The current members are fetched
+            once and the member names resolved in bulk, concurrently,
+            then only the difference is applied, with at most `limit`
+            requests in flight.
+        Example::
+            Team().sync_members('users', ['alice', 'bob', 12], User)
+        :param string sub: Sub-collection, e.g. "users"
+        :param list members: Names or IDs of the desired members
+        :param member_type: Resource class of the members, e.g. User
+        :param bool prune: Remove the members missing from `members`
+        :param int limit: Maximum number of concurrent requests.
+            Defaults to `client_config.concurrency`.
+        :returns: IDs of the added and of the removed members
+        :rtype: tuple
         :raises: :exc:`cloudify.exceptions.RecoverableError`,
                  :exc:`cloudify.exceptions.NonRecoverableError`,
                  :exc:`requests.RequestException`
         """
-        self.log.info('Retrieving list {0}'.format(self.name))
+        limit = limit or self.client.config.get(
+            'concurrency', constants.DEFAULT_CONCURRENCY)
+        url = self.resource_url + sub + '/'
+        resolver = member_type(_ctx=self.ctx)
+        current, ids = connection.gather([
+            self.async_client.call(self.get_member_ids, url),
+            self.async_client.call(resolver.lookup_ids, members)])
+        missing = [name for name, _id in ids.items() if _id is None]
+        if missing:
+            raise NonRecoverableError('{0} {1} not found: {2}'.format(
+                len(missing), resolver.name, ', '.join(
+                    str(name) for name in missing[:10])))
+        desired = set(ids.values())
+        added = sorted(desired - current)
+        removed = sorted(current - desired) if prune else list()
+        self.log.info('{0}({1}) {2}: adding {3}, removing {4}, keeping '
+                      '{5}'.format(self.name, self.resource_id, sub,
+                                   len(added), len(removed),
+                                   len(desired & current)))
+        connection.gather(
+            [self.async_client.call(self.associate, url, _id)
+             for _id in added] +
+            [self.async_client.call(self.associate, url, _id, True)
+             for _id in removed],
+            limit=limit)
+        return added, removed
+
+    def invalidate_lookups(self):
+        """Forgets cached and indexed lookups of the collection"""
+        RESOLUTION_CACHE.invalidate(self.cache_namespace)
+        if self.index:
+            self.index.invalidate(self.client.creds.endpoint, self.endpoint)
+
+    def iter_pages(self, url, params=None):
+        """
+            Walks a paginated collection, following `next` links
+        :param string url: URL of the (first page of the) collection
+        :param dict params: Query parameters for the first request
+        :returns: Generator of collection pages
+        :rtype: generator of dict
+        :raises: :exc:`cloudify.exceptions.RecoverableError`,
+                 :exc:`requests.RequestException`
+        """
+        while url:
+            page = self.fetch_page(url, params)
+            yield page
+            # The "next" link already carries the query string
+            url = page.get('next')
+            params = None
+
+    def iter_pages_ahead(self, url, params=None, window=None):
+        """
+            Walks a paginated collection like :meth:`iter_pages`, but
+            once the first page reports the collection's `count`, the
+            remaining pages are requested concurrently, `window` at a
+            time. Pages are yielded in order, and no more than `window`
+            of them are held at once whatever the collection size.
+        :param string url: URL of the collection
+        :param dict params: Query parameters (filters, ordering and
+            page size) for every page
+        :param int window: Maximum number of pages requested at once.
+            Defaults to `client_config.concurrency`.
+        :returns: Generator of collection pages
+        :rtype: generator of dict
+        :raises: :exc:`cloudify.exceptions.RecoverableError`,
+                 :exc:`requests.RequestException`
+        """
+        params = dict(params or dict())
+        window = window or self.client.config.get(
+            'concurrency', constants.DEFAULT_CONCURRENCY)
+        page = self.fetch_page(url, params)
+        yield page
+        per_page = len(page.get('results') or list())
+        count = page.get('count')
+        if not page.get('next'):
+            return
+        if window < 2 or not per_page or not isinstance(count, int):
+            for page in self.iter_pages(page['next']):
+                yield page
+            return
+        # Page numbers are those of the server's (possibly capped)
+        # page size, as returned for the first page
+        last = (count + per_page - 1) // per_page
+        fetch = utils.bind_current_ctx(self.fetch_page)
+        pending = deque()
+        # Private workers, this may run on the shared async pool
+        executor = ThreadPoolExecutor(max_workers=window)
+        try:
+            for number in range(2, last + 1):
+                pending.append(executor.submit(
+                    fetch, url, dict(params, page=number), True))
+                if len(pending) >= window:
+                    page = pending.popleft().result()
+                    yield page
+            while pending:
+                page = pending.popleft().result()
+                yield page
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+        # Objects added since the first page spill onto further pages
+        if page.get('next'):
+            for page in self.iter_pages(page['next']):
+                yield page
+
+    def fetch_page(self, url, params=None, missing_ok=False):
+        """
+            Gets one page of a paginated collection
+        :param string url: URL of the collection (or of the page)
+        :param dict params: Query parameters
+        :param bool missing_ok: Return an empty page if the page
+            doesn't exist (anymore), as when the collection shrank
+        :returns: Collection page
+        :rtype: dict
+        :raises: :exc:`cloudify.exceptions.RecoverableError`,
+                 :exc:`requests.RequestException`
+        """
         # Make the request
-        res = self.client.request(method='get', url=self.collection_url)
-        self.log.debug('headers: {0}'.format(dict(res.headers)))
-        # headers = self.lowercase_headers(res.headers)
+        res = self.client.request(method='get', url=url, params=params)
         # Check the response
-        # HTTP 200 (OK) - The resource already exists
+        if missing_ok and res.status_code == requests.codes.not_found:
+            return dict(results=list(), next=None)
         if res.status_code != requests.codes.ok:
             raise RecoverableError(
                 'Expected HTTP status code {0}, recieved {1}'
                 .format(requests.codes.ok, res.status_code))
-        # Get list of resources
-        for r_obj in res.json().get('results', list()):
-            for lookup in self.lookup:
-                if name == r_obj.get(lookup):
-                    return r_obj['id']
+        return res.json()
+
+    def lookup_params(self, lookup, name):
+        """
+            Builds the server-side filter matching `name` on
+            the `lookup` field
+        :param string lookup: Field to match on (id, url, name, ...)
+        :param string name: Name/ID of the existing resource
+        :returns: Query parameters, or None if `name` can't match
+        :rtype: dict
+        """
+        if lookup == 'id':
+            if isinstance(name, bool) or not isinstance(name, int):
+                return None
+            return dict(id=name)
+        if lookup == 'url':
+            # Object URLs are "<collection_url><id>/"
+            if not isinstance(name, str) or \
+                    not name.startswith(self.collection_url):
+                return None
+            _id = name[len(self.collection_url):].strip('/')
+            if not _id.isdigit():
+                return None
+            return dict(id=int(_id))
+        return {lookup: name}
+
+    def lookup_id(self, name, page_size=None):
+        """
+            Find a resource's ID, using the process-wide
+            resolution cache when possible
+        :param string name: Name/ID of the existing resource
+        :param int page_size: Number of objects to request per page
+        :returns: Resource ID
+        :rtype: integer
+        :raises: :exc:`cloudify.exceptions.RecoverableError`,
+                 :exc:`cloudify.exceptions.NonRecoverableError`,
+                 :exc:`requests.RequestException`
+        """
+        if name is None or name == '':
+            return None
+        found, _id = RESOLUTION_CACHE.get(self.cache_namespace, name)
+        if found:
+            self.log.debug('Resolved {0} "{1}" from cache ({2})'.format(
+                self.name, name, _id))
+            return _id
+        if self.index:
+            _id = self.lookup_index_id(name, page_size=page_size)
+        else:
+            _id = self.fetch_id(name, page_size=page_size)
+        RESOLUTION_CACHE.set(self.cache_namespace, name, _id)
+        return _id
+
+    def lookup_ids(self, names):
+        """
+            Find the IDs of many resources at once, using the
+            process-wide resolution cache when possible. Names and IDs
+            are resolved with one "<field>__in" filtered request per
+            chunk of `constants.BULK_LOOKUP_SIZE`, instead of one
+            request each.
+        :param list names: Names/IDs of existing resources
+        :returns: Resource IDs (None if not found), by name
+        :rtype: dict
+        :raises: :exc:`cloudify.exceptions.RecoverableError`,
+                 :exc:`cloudify.exceptions.NonRecoverableError`,
+                 :exc:`requests.RequestException`
+        """
+        ids = dict()
+        pending = defaultdict(list)
+        for name in names:
+            if name in ids:
+                continue
+            found, _id = RESOLUTION_CACHE.get(self.cache_namespace, name)
+            if found:
+                ids[name] = _id
+            elif isinstance(name, int) and not isinstance(name, bool) \
+                    and 'id' in self.lookup:
+                pending['id'].append(name)
+            elif isinstance(name, str) and ',' not in name and \
+                    not name.startswith(self.collection_url) and \
+                    self.lookup[-1] not in ['id', 'url']:
+                pending[self.lookup[-1]].append(name)
+            else:
+                # URLs and names that can't be filtered on in bulk
+                ids[name] = self.lookup_id(name)
+        for field, values in pending.items():
+            for start in range(0, len(values), constants.BULK_LOOKUP_SIZE):
+                chunk = values[start:start + constants.BULK_LOOKUP_SIZE]
+                matches = defaultdict(list)
+                for r_obj in self.iter_all(filters={
+                        field + '__in': ','.join(str(v) for v in chunk)}):
+                    matches[r_obj.get(field)].append(r_obj['id'])
+                for name in chunk:
+                    if len(matches[name]) > 1:
+                        raise NonRecoverableError(
+                            '{0} "{1}" is ambiguous, {2} objects match on '
+                            '"{3}": {4}'.format(self.name, name,
+                                                len(matches[name]), field,
+                                                matches[name]))
+                    ids[name] = (matches[name] or [None])[0]
+                    RESOLUTION_CACHE.set(
+                        self.cache_namespace, name, ids[name])
+        return ids
+
+    def fetch_id(self, name, page_size=None):
+        """
+            Find a resource's ID by querying the API
+        :param string name: Name/ID of the existing resource
+        :param int page_size: Number of objects to request per page
+        :returns: Resource ID
+        :rtype: integer
+        :raises: :exc:`cloudify.exceptions.RecoverableError`,
+                 :exc:`cloudify.exceptions.NonRecoverableError`,
+                 :exc:`requests.RequestException`
+        """
+        r_obj = self.fetch_object(name, page_size=page_size)
+        return r_obj['id'] if r_obj else None
+
+    def fetch_object(self, name, page_size=None):
+        """
+            Find a resource by querying the API
+        :param string name: Name/ID of the existing resource
+        :param int page_size: Number of objects to request per page
+        :returns: Resource, or None if it doesn't exist
+        :rtype: dict
+        :raises: :exc:`cloudify.exceptions.RecoverableError`,
+                 :exc:`cloudify.exceptions.NonRecoverableError`,
+                 :exc:`requests.RequestException`
+        """
+        self.log.info('Looking up {0} "{1}"'.format(self.name, name))
+        for lookup in self.lookup:
+            params = self.lookup_params(lookup, name)
+            if params is None:
+                continue
+            params['page_size'] = page_size or self.page_size
+            # Let the server filter, but check each match locally in
+            # case a filter is ignored and the whole collection is sent
+            matches = list()
+            for page in self.iter_pages(self.collection_url, params):
+                for r_obj in page.get('results', list()):
+                    if name == r_obj.get(lookup):
+                        matches.append(r_obj)
+            if len(matches) > 1:
+                raise NonRecoverableError(
+                    '{0} "{1}" is ambiguous, {2} objects match on "{3}": {4}'
+                    .format(self.name, name, len(matches), lookup,
+                            [r_obj['id'] for r_obj in matches]))
+            if matches:
+                return matches[0]
         return None
 
-    def lookup_role(self, name):
+    def lookup_index_id(self, name, page_size=None):
         """
-            Find a resource
+            Find a resource's ID through the on-disk object index,
+            sweeping the whole collection into the index first if
+            it's configured for warm-up and hasn't been swept lately.
+            Objects found through the API are added to the index.
         :param string name: Name/ID of the existing resource
-        :returns: Resource
+        :param int page_size: Number of objects to request per page
+        :returns: Resource ID
+        :rtype: integer
+        :raises: :exc:`cloudify.exceptions.RecoverableError`,
+                 :exc:`cloudify.exceptions.NonRecoverableError`,
+                 :exc:`requests.RequestException`
+        """
+        endpoint = self.client.creds.endpoint
+        _id = self.index.get(endpoint, self.endpoint, self.lookup, name)
+        if _id is not None:
+            return _id
+        if self.endpoint in self.index.warm_up:
+            with self.index.locked():
+                # Another worker may have swept while we waited
+                if not self.index.is_warm(endpoint, self.endpoint):
+                    self.log.info('Indexing {0} resources'.format(self.name))
+                    self.index.sweep(
+                        endpoint, self.endpoint, self.lookup,
+                        self.iter_pages_ahead(
+                            self.collection_url,
+                            dict(page_size=page_size or self.page_size)))
+            _id = self.index.get(endpoint, self.endpoint, self.lookup, name)
+            if _id is not None:
+                return _id
+        r_obj = self.fetch_object(name, page_size=page_size)
+        if not r_obj:
+            return None
+        self.index.put(endpoint, self.endpoint, self.lookup, r_obj)
+        return r_obj['id']
+
+    def lookup_role(self, name):
+        """
+            Find an object role of the resource
+        :param string name: Name/ID/URL of the role (Admin, Use, ...)
+        :returns: Role, or None if the resource has no such role
         :rtype: dict
         :raises: :exc:`cloudify.exceptions.RecoverableError`,
                  :exc:`cloudify.exceptions.NonRecoverableError`,
         """
-        _lookup = ['id', 'url', 'name']
+        try:
+            return self.get_object_roles().get(name)
+        except TypeError:
+            return None
+
+    def get_object_roles(self):
+        """
+            Gets the object roles of the resource, indexed by ID,
+            URL and name. They are fetched once per resource and
+            process, and reused by every role assignment.
+        :returns: Roles, by ID, URL and name
+        :rtype: dict
+        :raises: :exc:`cloudify.exceptions.RecoverableError`,
+                 :exc:`requests.RequestException`
+        """
+        namespace = self.cache_namespace + ('object_roles',)
+        found, roles = OBJECT_ROLE_CACHE.get(namespace, self.resource_id)
+        if found:
+            return roles
         self.log.info('Retrieving roles for {0}'.format(self.name))
-        # Make the request
-        res = self.client.request(
-            method='get',
-            url=self.resource_url + 'object_roles/')
-        self.log.debug('headers: {0}'.format(dict(res.headers)))
-        # Check the response
-        # HTTP 200 (OK) - The resource already exists
-        if res.status_code != requests.codes.ok:
-            raise RecoverableError(
-                'Expected HTTP status code {0}, recieved {1}'
-                .format(requests.codes.ok, res.status_code))
-        # Get list of resources
-        for r_obj in res.json().get('results', list()):
-            for lookup in _lookup:
-                if name == r_obj.get(lookup):
-                    return r_obj
-        return None
+        roles = dict()
+        for page in self.iter_pages(
+                self.resource_url + 'object_roles/',
+                dict(page_size=self.page_size)):
+            for r_obj in page.get('results', list()):
+                for lookup in ['id', 'url', 'name']:
+                    if r_obj.get(lookup) is not None:
+                        roles.setdefault(r_obj[lookup], r_obj)
+        OBJECT_ROLE_CACHE.set(namespace, self.resource_id, roles)
+        return roles
+
+    async def async_exists(self):
+        """Asynchronous :meth:`exists`"""
+        return await self.async_client.call(self.exists)
+
+    async def async_list(self):
+        """Asynchronous :meth:`list`"""
+        return await self.async_client.call(self.list)
+
+    async def async_get(self):
+        """Asynchronous :meth:`get`"""
+        return await self.async_client.call(self.get)
 
+    async def async_create(self, params):
+        """Asynchronous :meth:`create`"""
+        return await self.async_client.call(self.create, params)
+
+    async def async_delete(self):
+        """Asynchronous :meth:`delete`"""
+        return await self.async_client.call(self.delete)
+
+    async def async_lookup_id(self, name, page_size=None):
+        """Asynchronous :meth:`lookup_id`"""
+        return await self.async_client.call(
+            self.lookup_id, name, page_size=page_size)
 
     @staticmethod
-    def sanitize_json_input(us_data):
+    def sanitize_json_input(us_data, name=None):
         """
-            Sanitizes data before going to Requests. This mostly
-            handles cases where there are mixed-encoded objects
-            where part of the object is ASCII/UTF-8 and the other
-            part is Unicode.
+            Sanitizes data before going to Requests. The data is
+            copied as plain JSON types in a single pass and, if `name`
+            is given, its fields are coerced to the types declared
+            by the resource's data type in plugin.yaml.
         :param obj us_data: JSON-serializable Python object
-        :returns: UTF-8 JSON object
+        :param string name: Resource name, e.g. "JobTemplate"
+        :returns: Normalized copy of the data (empty data stays empty)
         :rtype: JSON object
+        :raises: :exc:`cloudify.exceptions.NonRecoverableError` if
+            fields don't match their declared types
         """
-        if not us_data:
-            return None
-        if not isinstance(us_data, dict) and not isinstance(us_data, list):
-            return None
-        return yaml.safe_load(
-            json.dumps(us_data, ensure_ascii=True).encode('utf8'))
+        return schema.normalize(us_data, name)
 
     @staticmethod
     def lowercase_headers(headers):
         """Convert all header names to lowercase"""
         # Convert headers from CaseInsensitiveDict to Dict
         return dict(headers.lower_items())
+
+
+def resolve_references(config, references, _ctx=ctx):
+    """
+        Resolves the references of a resource configuration to IDs,
+        before the resource is created. A reference to a related node
+        is its target's resource ID. Names (or IDs) given in `config`
+        are looked up concurrently, each distinct lookup only once,
+        instead of one round trip after the other.
+    Example::
+        resolve_references(config, [
+            ('project', Project,
+             'cloudify.ansible_tower.relationships.contained_in_project'),
+            ('inventory', Inventory, None)])
+    :param dict config: Resource configuration, updated in place
+    :param list references: (field, resource class, relationship
+        type) tuples. The relationship type may be None, or a list
+        of types tried in order.
+    :returns: The updated configuration
+    :rtype: dict
+    :raises: :exc:`cloudify.exceptions.RecoverableError`,
+             :exc:`cloudify.exceptions.NonRecoverableError`,
+             :exc:`requests.RequestException`
+    """
+    lookups = dict()
+    for field, resource_type, rel_types in references:
+        if isinstance(rel_types, str):
+            rel_types = [rel_types]
+        rel = None
+        for rel_type in rel_types or list():
+            rel = utils.get_relationship_by_type(
+                _ctx.instance.relationships, rel_type)
+            if rel:
+                break
+        if rel:
+            config[field] = utils.get_resource_name(rel.target)
+        elif config.get(field):
+            # Unhashable values are left for the API to reject
+            key = (resource_type, config[field])
+            try:
+                lookups.setdefault(key, list()).append(field)
+            except TypeError:
+                continue
+    if not lookups:
+        return config
+    resources = dict()
+    for resource_type, _ in lookups:
+        if resource_type not in resources:
+            resources[resource_type] = resource_type(_ctx=_ctx)
+    if len(lookups) == 1:
+        (resource_type, name), = lookups
+        results = [resources[resource_type].lookup_id(name)]
+    else:
+        limit = next(iter(resources.values())).client.config.get(
+            'concurrency', constants.DEFAULT_CONCURRENCY)
+        # Private workers, this may run on the shared async pool
+        with ThreadPoolExecutor(
+                max_workers=min(limit, len(lookups))) as executor:
+            futures = [
+                executor.submit(utils.bind_current_ctx(
+                    resources[resource_type].lookup_id), name)
+                for resource_type, name in lookups]
+            results = [future.result() for future in futures]
+    for fields, _id in zip(lookups.values(), results):
+        for field in fields:
+            config[field] = _id
+    return config
@@ -23,9 +23,10 @@ from cloudify import ctx
 # Lifecycle operation decorator
 from cloudify.decorators import operation
 # Base resource class
-from cloudify_ansible_tower.resources.base import Resource
+from cloudify_ansible_tower.resources.base import (
+    Resource, resolve_references)
 # API version
-from cloudify_ansible_tower import utils
+from cloudify_ansible_tower import metrics, utils
 # Resources
 from cloudify_ansible_tower.resources.organization import Organization
 from cloudify_ansible_tower.resources.team import Team
@@ -73,66 +74,42 @@ class CredentialType(Resource):
 
 
 @operation(resumable=True)
+@metrics.collect
 def create(**_):
     """Uses an existing, or creates a new, Credential"""
     config = ctx.node.properties.get('resource_config')
-    credential_type = config.get('credential_type')
 
-    config['credential_type'] = \
-        CredentialType().lookup_id(credential_type)
+    # Get credential type, organization, team and user references
+    resolve_references(config, [
+        ('credential_type', CredentialType, None),
+        ('organization', Organization,
+         'cloudify.ansible_tower.relationships.contained_in_organization'),
+        ('team', Team,
+         'cloudify.ansible_tower.relationships.contained_in_team'),
+        ('user', User,
+         'cloudify.ansible_tower.relationships.contained_in_user')])
 
-    # Get organization reference
-    rel_org = utils.get_relationship_by_type(
-        ctx.instance.relationships,
-        'cloudify.ansible_tower.relationships.contained_in_organization')
-    if rel_org:
-        config['organization'] = utils.get_resource_name(rel_org.target)
-    elif config.get('organization'):
-        config['organization'] = \
-            Organization().lookup_id(config['organization'])
-
-    # Get team reference
-    rel_team = utils.get_relationship_by_type(
-        ctx.instance.relationships,
-        'cloudify.ansible_tower.relationships.contained_in_team')
-    if rel_team:
-        config['team'] = utils.get_resource_name(rel_team.target)
-    elif config.get('team'):
-        config['team'] = Team().lookup_id(config['team'])
-
-    # Get user reference
-    rel_user = utils.get_relationship_by_type(
-        ctx.instance.relationships,
-        'cloudify.ansible_tower.relationships.contained_in_user')
-    if rel_user:
-        config['user'] = utils.get_resource_name(rel_user.target)
-    elif config.get('user'):
-        config['user'] = User().lookup_id(config['user'])
-
-    ctx.instance.runtime_properties['resource'] = \
-        utils.task_resource_create(Credential(), config)
-    ctx.instance.runtime_properties['resource_id'] = \
-        ctx.instance.runtime_properties['resource'].get('id')
+    utils.set_resource(utils.task_resource_create(Credential(), config))
 
 
 @operation(resumable=True)
+@metrics.collect
 def delete(**_):
     """Deletes a Credential"""
     utils.task_resource_delete(Credential())
 
 
 @operation(resumable=True)
+@metrics.collect
 def create_type(**_):
     """Uses an existing, or creates a new, CredentialType"""
-    ctx.instance.runtime_properties['resource'] = \
-        utils.task_resource_create(
-            CredentialType(),
-            ctx.node.properties.get('resource_config'))
-    ctx.instance.runtime_properties['resource_id'] = \
-        ctx.instance.runtime_properties['resource'].get('id')
+    utils.set_resource(utils.task_resource_create(
+        CredentialType(),
+        ctx.node.properties.get('resource_config')))
 
 
 @operation(resumable=True)
+@metrics.collect
 def delete_type(**_):
     """Deletes a CredentialType"""
     utils.task_resource_delete(CredentialType())
@@ -22,12 +22,15 @@
 from cloudify import ctx
 # Lifecycle operation decorator
 from cloudify.decorators import operation
+# Exceptions
+from cloudify.exceptions import NonRecoverableError, RecoverableError
 # API version
-from cloudify_ansible_tower import utils
+from cloudify_ansible_tower import connection, metrics, utils
 # Base resource class
 from cloudify_ansible_tower.resources.base import Resource
 # Resources
-from cloudify_ansible_tower.resources.inventory import Inventory
+from cloudify_ansible_tower.resources.inventory import (
+    Inventory, register_hosts)
 
 
 class Host(Resource):
@@ -51,6 +54,7 @@ class Host(Resource):
 
 
 @operation(resumable=True)
+@metrics.collect
 def create(**_):
     """Uses an existing, or creates a new, Host"""
     config = ctx.node.properties.get('resource_config')
@@ -70,13 +74,68 @@ def create(**_):
         config['inventory'] = \
             Inventory().lookup_id(config['inventory'])
 
-    ctx.instance.runtime_properties['resource'] = \
-        utils.task_resource_create(Host(), config)
-    ctx.instance.runtime_properties['resource_id'] = \
-        ctx.instance.runtime_properties['resource'].get('id')
+    utils.set_resource(utils.task_resource_create(Host(), config))
 
 
 @operation(resumable=True)
+@metrics.collect
 def delete(**_):
     """Deletes a Host"""
     utils.task_resource_delete(Host())
+
+
+def get_batch_inventory(config, _ctx=ctx):
+    """Gets the Inventory a HostBatch adds its hosts to"""
+    rel_inventory = utils.get_relationship_by_type(
+        _ctx.instance.relationships,
+        'cloudify.ansible_tower.relationships.contained_in_inventory')
+    if rel_inventory:
+        return Inventory(_ctx=rel_inventory.target)
+    inventory = Inventory()
+    inventory.resource_id = inventory.lookup_id(config.get('inventory'))
+    if inventory.resource_id is None:
+        raise NonRecoverableError('Inventory "{0}" not found'.format(
+            config.get('inventory')))
+    return inventory
+
+
+def delete_host(host):
+    """Deletes a Host, if it still exists"""
+    if host.exists():
+        host.delete()
+
+
+@operation(resumable=True)
+@metrics.collect
+def create_batch(**_):
+    """Adds many Hosts to an Inventory"""
+    config = ctx.node.properties.get('resource_config')
+    register_hosts(get_batch_inventory(config), config.get('hosts'))
+
+
+@operation(resumable=True)
+@metrics.collect
+def delete_batch(**_):
+    """Deletes the Hosts added by a HostBatch"""
+    registered = ctx.instance.runtime_properties.get('hosts', dict())
+    names = list(registered)
+    hosts = list()
+    for name in names:
+        host = Host()
+        host.resource_id = registered[name]
+        hosts.append(host)
+    results = connection.gather(
+        [host.async_client.call(delete_host, host) for host in hosts],
+        return_exceptions=True)
+    for name, result in zip(names, results):
+        if isinstance(result, Exception):
+            ctx.logger.error('Host "{0}": {1}'.format(name, result))
+        else:
+            del registered[name]
+    ctx.instance.runtime_properties['hosts'] = registered
+    if registered:
+        ctx.instance.update()
+        raise RecoverableError(
+            '{0} hosts could not be deleted: {1}'.format(
+                len(registered), ', '.join(sorted(registered))))
+    utils.runtime_properties_cleanup()
@@ -18,14 +18,17 @@
     Ansible Tower Inventory interface
 """
 
+from requests import codes as http_codes
 # Node properties and logger
 from cloudify import ctx
+# Exceptions
+from cloudify.exceptions import NonRecoverableError, RecoverableError
 # Lifecycle operation decorator
 from cloudify.decorators import operation
 # Base resource class
 from cloudify_ansible_tower.resources.base import Resource
 # API version
-from cloudify_ansible_tower import utils
+from cloudify_ansible_tower import connection, constants, metrics, utils
 # Resources
 from cloudify_ansible_tower.resources.organization import Organization
 
@@ -49,8 +52,112 @@ class Inventory(Resource):
             logger=logger,
             _ctx=_ctx)
 
+    def supports_bulk_host_create(self):
+        """
+            Checks if the server advertises the bulk API (AWX 22+)
+        :rtype: boolean
+        """
+        res = self.client.request(
+            method='get', url='/api/{0}/'.format(self.api_version))
+        return res.status_code == http_codes.ok and 'bulk' in res.json()
+
+    def bulk_add_hosts(self, hosts):
+        """
+            Creates hosts in the inventory with a single request
+        :param list hosts: Host parameters (name, variables, ...)
+        :returns: Created hosts, or None if the server rejected
+            the batch (ie. one of the hosts is invalid)
+        :rtype: list
+        :raises: :exc:`cloudify.exceptions.RecoverableError`
+        """
+        self.log.info('Adding {0} hosts to {1}({2})'.format(
+            len(hosts), self.name, self.resource_id))
+        # Make the request
+        res = self.client.request(
+            method='post',
+            url='/api/{0}/bulk/host_create/'.format(self.api_version),
+            json=dict(inventory=self.resource_id, hosts=hosts))
+        # Check the response
+        # If API sent a 400, at least one host is invalid
+        if res.status_code == http_codes.bad_request:
+            self.log.info('BAD REQUEST: response: {}'.format(res.content))
+            return None
+        # All other errors will be treated as recoverable
+        if res.status_code != http_codes.created:
+            raise RecoverableError(
+                'Expected HTTP status code {0}, recieved {1}'
+                .format(http_codes.created, res.status_code))
+        return res.json().get('hosts', list())
+
+    def add_host(self, params):
+        """
+            Creates a host in the inventory
+        :param dict params: Host parameters (name, variables, ...)
+        :returns: Created host
+        :rtype: dict
+        :raises: :exc:`cloudify.exceptions.RecoverableError`,
+                 :exc:`cloudify.exceptions.NonRecoverableError`
+        """
+        # Make the request
+        res = self.client.request(
+            method='post', url=self.resource_url + 'hosts/', json=params)
+        # Check the response
+        # If API sent a 400, we're sending bad data
+        if res.status_code == http_codes.bad_request:
+            raise NonRecoverableError(
+                'Host BAD REQUEST: {0}'.format(res.text))
+        # All other errors will be treated as recoverable
+        if res.status_code != http_codes.created:
+            raise RecoverableError(
+                'Expected HTTP status code {0}, recieved {1}'
+                .format(http_codes.created, res.status_code))
+        return res.json()
+
+    def add_hosts(self, hosts):
+        """
+            Creates many hosts in the inventory. The bulk API is used
+            when the server has it, in batches. Otherwise, and for
+            batches the server rejects, hosts are created one by one
+            by concurrent requests (up to `client_config.concurrency`)
+            so every failing host is reported.
+        :param list hosts: Host names, or host parameters
+        :returns: Created host IDs by name, and exceptions by name
+        :rtype: tuple of (dict, dict)
+        :raises: :exc:`cloudify.exceptions.RecoverableError`
+        """
+        hosts = [h if isinstance(h, dict) else dict(name=h) for h in hosts]
+        created = dict()
+        errors = dict()
+        pending = list()
+        if hosts and self.supports_bulk_host_create():
+            size = constants.BULK_HOST_CREATE_MAX
+            for i in range(0, len(hosts), size):
+                batch = hosts[i:i + size]
+                results = self.bulk_add_hosts(batch)
+                if results is None:
+                    pending.extend(batch)
+                    continue
+                for host in results:
+                    created[host['name']] = host['id']
+        else:
+            pending = hosts
+        if not pending:
+            return created, errors
+        self.log.info('Adding {0} hosts to {1}({2}) one by one'.format(
+            len(pending), self.name, self.resource_id))
+        results = connection.gather(
+            [self.async_client.call(self.add_host, h) for h in pending],
+            return_exceptions=True)
+        for host, result in zip(pending, results):
+            if isinstance(result, Exception):
+                errors[host['name']] = result
+            else:
+                created[host['name']] = result['id']
+        return created, errors
+
 
 @operation(resumable=True)
+@metrics.collect
 def create(**_):
     """Uses an existing, or creates a new, Inventory"""
     config = ctx.node.properties.get('resource_config')
@@ -65,13 +172,48 @@ def create(**_):
         config['organization'] = \
             Organization().lookup_id(config['organization'])
 
-    ctx.instance.runtime_properties['resource'] = \
-        utils.task_resource_create(Inventory(), config)
-    ctx.instance.runtime_properties['resource_id'] = \
-        ctx.instance.runtime_properties['resource'].get('id')
+    if not ctx.instance.runtime_properties.get('resource_id'):
+        utils.set_resource(utils.task_resource_create(Inventory(), config))
+
+    inventory = Inventory()
+    inventory.resource_id = ctx.instance.runtime_properties['resource_id']
+    register_hosts(inventory, ctx.node.properties.get('hosts'))
+
+
+def register_hosts(inventory, hosts, _ctx=ctx):
+    """
+        Adds hosts to an inventory and records their IDs in the
+        `hosts` runtime property. Hosts already recorded are skipped
+        so that a retried operation only adds the missing ones.
+    :param `Inventory` inventory: Inventory to add the hosts to
+    :param list hosts: Host names, or host parameters
+    :raises: :exc:`cloudify.exceptions.RecoverableError`,
+             :exc:`cloudify.exceptions.NonRecoverableError`
+    """
+    registered = _ctx.instance.runtime_properties.get('hosts', dict())
+    hosts = [h for h in hosts or list()
+             if (h.get('name') if isinstance(h, dict) else h)
+             not in registered]
+    if not hosts:
+        return
+    created, errors = inventory.add_hosts(hosts)
+    registered.update(created)
+    _ctx.instance.runtime_properties['hosts'] = registered
+    _ctx.instance.update()
+    if not errors:
+        return
+    for name, error in errors.items():
+        _ctx.logger.error('Host "{0}": {1}'.format(name, error))
+    message = '{0} of {1} hosts could not be added: {2}'.format(
+        len(errors), len(hosts), ', '.join(sorted(errors)))
+    # Retry if only transient errors occurred
+    if any(isinstance(e, NonRecoverableError) for e in errors.values()):
+        raise NonRecoverableError(message)
+    raise RecoverableError(message)
 
 
 @operation(resumable=True)
+@metrics.collect
 def delete(**_):
     """Deletes a Inventory"""
     utils.task_resource_delete(Inventory())
@@ -18,17 +18,35 @@
     Ansible Tower Job interface
 """
 
+import re
+import time
+import random
+
 # Node properties and logger
 from cloudify import ctx
+# Exceptions
+from cloudify.exceptions import NonRecoverableError, RecoverableError
 # Lifecycle operation decorator
 from cloudify.decorators import operation
 # API version
-from cloudify_ansible_tower import utils
+from cloudify_ansible_tower import connection, constants, metrics, utils
 # Base resource class
-from cloudify_ansible_tower.resources.base import Resource
+from cloudify_ansible_tower.resources.base import (
+    Resource, resolve_references)
 # Resources
+from cloudify_ansible_tower.resources.inventory import Inventory
 from cloudify_ansible_tower.resources.job_template import JobTemplate
 
+# Terminal colors in job event output
+ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;]*m')
+
+# Job template launch-time parameters
+LAUNCH_FIELDS = [
+    'extra_vars', 'inventory', 'credentials', 'limit', 'job_tags',
+    'skip_tags', 'job_type', 'verbosity', 'diff_mode', 'scm_branch',
+    'forks', 'timeout', 'job_slice_count'
+]
+
 
 class Job(Resource):
     """
@@ -49,31 +67,485 @@ class Job(Resource):
             logger=logger,
             _ctx=_ctx)
 
+    def iter_events(self, cursor=0, filters=None, page_size=None):
+        """
+            Walks the job events newer than `cursor`, in order. Pages
+            are requested by ID (id__gt) rather than page number so that
+            events added while reading are neither skipped nor repeated,
+            and only one page is held in memory at a time.
+        :param int cursor: ID of the last event already seen
+        :param dict filters: Server-side filters (ie. event__in)
+        :param int page_size: Number of events to request per page
+        :returns: Generator of job events
+        :rtype: generator of dict
+        :raises: :exc:`cloudify.exceptions.RecoverableError`,
+                 :exc:`requests.RequestException`
+        """
+        params = dict(filters or dict())
+        params['order_by'] = 'id'
+        params['page_size'] = page_size or self.page_size
+        while True:
+            params['id__gt'] = cursor
+            page = next(self.iter_pages(
+                self.resource_url + 'job_events/', params))
+            results = page.get('results', list())
+            for event in results:
+                yield event
+            if not results or not page.get('next'):
+                return
+            cursor = results[-1]['id']
+
+    def wait(self, deadline,
+             poll_interval=constants.JOB_POLL_INTERVAL,
+             max_poll_interval=constants.JOB_MAX_POLL_INTERVAL,
+             on_poll=None):
+        """
+            Waits for the job to finish. The job is polled with an
+            exponentially growing, jittered, interval capped at
+            `max_poll_interval` so long jobs cost few requests.
+        :param float deadline: Time (epoch) to stop waiting at
+        :param float poll_interval: Initial seconds between polls
+        :param float max_poll_interval: Maximum seconds between polls
+        :param callable on_poll: Called with the job after every poll
+        :returns: Final state of the job
+        :rtype: dict
+        :raises: :exc:`cloudify.exceptions.RecoverableError`,
+                 :exc:`cloudify.exceptions.NonRecoverableError`,
+                 :exc:`requests.RequestException`
+        """
+        interval = poll_interval
+        while True:
+            job = self.get()
+            if on_poll:
+                on_poll(job)
+            status = job.get('status')
+            self.log.info('{0} "{1}" is {2}'.format(
+                self.name, self.resource_id, status))
+            if status == constants.JOB_SUCCESSFUL:
+                return job
+            if status in constants.JOB_FAILED_STATUSES:
+                raise NonRecoverableError(
+                    '{0} "{1}" {2}: {3}'.format(
+                        self.name, self.resource_id, status,
+                        job.get('job_explanation') or 'see Tower job output'))
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise NonRecoverableError(
+                    '{0} "{1}" still {2} at its deadline'.format(
+                        self.name, self.resource_id, status))
+            # Stops at the operation deadline as well
+            self.client.sleep(
+                min(remaining, random.uniform(interval / 2, interval)))
+            interval = min(interval * 2, max_poll_interval)
+
+
+class WorkflowJob(Job):
+    """
+        Ansible Tower Workflow Job interface. Sliced job template
+        launches run as a workflow job with one job per slice.
+    .. warning::
+        This interface should only be instantiated from
+        within a Cloudify Lifecycle Operation
+    :param `logging.Logger` logger:
+        Parent logger for the class to use. Defaults to `ctx.logger`
+    """
+    def __init__(self, logger=None, _ctx=ctx):
+        Resource.__init__(
+            self,
+            'WorkflowJob',
+            '/workflow_jobs',
+            lookup=['id', 'url', 'name'],
+            logger=logger,
+            _ctx=_ctx)
+
+    def slices(self):
+        """
+            Gets the jobs spawned by the workflow job
+        :returns: Job ID and status of every slice
+        :rtype: list of dict
+        :raises: :exc:`cloudify.exceptions.RecoverableError`,
+                 :exc:`requests.RequestException`
+        """
+        slices = list()
+        for page in self.iter_pages(
+                self.resource_url + 'workflow_nodes/',
+                dict(page_size=self.page_size)):
+            for node in page.get('results', list()):
+                job = node.get('summary_fields', dict()).get('job', dict())
+                slices.append(dict(
+                    job=node.get('job'), status=job.get('status')))
+        return slices
+
+
+JOB_TYPES = {
+    'job': Job,
+    'workflow_job': WorkflowJob
+}
+
+
+def get_job_object(job_id, job_type='job'):
+    """
+        Gets the interface of a launched job
+    :param int job_id: ID of the job
+    :param string job_type: "job", or "workflow_job" for sliced launches
+    :rtype: :class:`Job`
+    """
+    job_object = JOB_TYPES[job_type]()
+    job_object.resource_id = job_id
+    return job_object
+
+
+def get_launched_job(resource):
+    """
+        Finds the job started by a job template launch
+    :param dict resource: Response of the launch API
+    :returns: Job ID and job type
+    :rtype: tuple
+    """
+    if resource.get('workflow_job'):
+        return resource['workflow_job'], 'workflow_job'
+    return resource.get('job'), 'job'
+
+
+def get_launch_params(config):
+    """
+        Builds job template launch parameters from a node config.
+        Inventory names are resolved by :func:`resolve_launch`.
+    :param dict config: Launch parameters and "kwargs" passed as-is
+    :returns: Launch parameters
+    :rtype: dict
+    """
+    params = {k: config[k] for k in LAUNCH_FIELDS
+              if config.get(k) is not None}
+    return utils.dict_update(params, config.get('kwargs') or dict())
+
+
+def resolve_launch(job_template, params, rel_type=None):
+    """
+        Resolves a job template, and the inventory of its launch
+        parameters, to IDs concurrently
+    :param job_template: JobTemplate name or ID
+    :param dict params: Launch parameters, updated in place
+    :param string rel_type: Type of the relationship to the
+        JobTemplate node, if any
+    :returns: JobTemplate ID
+    :rtype: integer
+    """
+    references = dict(job_template=job_template)
+    if not isinstance(params.get('inventory'), (int, type(None))):
+        references['inventory'] = params['inventory']
+    resolve_references(references, [
+        ('job_template', JobTemplate, rel_type),
+        ('inventory', Inventory, None)])
+    if 'inventory' in references:
+        params['inventory'] = references['inventory']
+    return references['job_template']
+
+
+def log_slices(workflow_job, _ctx=ctx):
+    """
+        Records the status of every slice of a sliced launch in the
+        `slices` runtime property and logs a summary
+    :param `WorkflowJob` workflow_job: Workflow job of the launch
+    """
+    slices = workflow_job.slices()
+    counts = dict()
+    for job_slice in slices:
+        counts[job_slice['status']] = counts.get(job_slice['status'], 0) + 1
+    _ctx.logger.info('{0} slices: {1}'.format(len(slices), ', '.join(
+        '{0} {1}'.format(v, k) for k, v in sorted(counts.items(), key=str))))
+    _ctx.instance.runtime_properties['slices'] = slices
+
+
+def get_event_filters(events_config):
+    """
+        Builds the server-side job event filters
+    :param dict events_config: Job node event streaming settings
+    :returns: Query parameters
+    :rtype: dict
+    """
+    filters = dict()
+    if events_config.get('event_types'):
+        filters['event__in'] = ','.join(events_config['event_types'])
+    if events_config.get('failed_only'):
+        filters['failed'] = 'true'
+    if events_config.get('verbosity') is not None:
+        filters['verbosity__lte'] = events_config['verbosity']
+    return filters
+
+
+def forward_events(job_object, events_config, _ctx=ctx):
+    """
+        Logs the job events added since the last call. The cursor is
+        saved in the `event_cursor` runtime property after every page
+        so that a resumed operation doesn't log events twice.
+    :param `Job` job_object: Job to read events of
+    :param dict events_config: Job node event streaming settings
+    """
+    page_size = events_config.get('page_size', constants.JOB_EVENTS_PAGE_SIZE)
+    cursor = _ctx.instance.runtime_properties.get('event_cursor', 0)
+    count = 0
+    for event in job_object.iter_events(
+            cursor, get_event_filters(events_config), page_size):
+        stdout = ANSI_ESCAPE.sub('', event.get('stdout') or '').strip()
+        if stdout:
+            if event.get('failed'):
+                _ctx.logger.error(stdout)
+            else:
+                _ctx.logger.info(stdout)
+        cursor = event['id']
+        count += 1
+        if count % page_size == 0:
+            _ctx.instance.runtime_properties['event_cursor'] = cursor
+            _ctx.instance.update()
+    if count % page_size:
+        _ctx.instance.runtime_properties['event_cursor'] = cursor
+        _ctx.instance.update()
+
 
 @operation(resumable=True)
+@metrics.collect
 def create(**_):
     """Uses an existing, or creates a new, Job"""
     config = ctx.node.properties.get('resource_config')
+    wait_config = ctx.node.properties.get('wait_config') or dict()
+    events_config = ctx.node.properties.get('events_config') or dict()
 
-    # Get project reference
-    rel_template = utils.get_relationship_by_type(
-        ctx.instance.relationships,
-        'cloudify.ansible_tower.relationships.job_contained_in_job_template')
-    if rel_template:
-        job_template_id = utils.get_resource_name(rel_template.target)
-    elif config.get('job_template'):
-        job_template_id = \
-            JobTemplate().lookup_id(config['job_template'])
+    if ctx.instance.runtime_properties.get('resource_id'):
+        # Resumed operation, the job was already launched
+        ctx.logger.info('Re-attaching to Job "{0}"'.format(
+            ctx.instance.runtime_properties['resource_id']))
+    else:
+        # Get job template and inventory references
+        params = get_launch_params(config)
+        job_template_id = resolve_launch(
+            config.get('job_template'), params,
+            'cloudify.ansible_tower.relationships.'
+            'job_contained_in_job_template')
+        if not job_template_id:
+            raise NonRecoverableError(
+                'JobTemplate "{0}" not found'.format(
+                    config.get('job_template')))
 
-    resource = JobTemplate(_id=job_template_id).launch()
+        resource = JobTemplate(_id=job_template_id).launch(params)
 
-    ctx.instance.runtime_properties['resource'] = resource
-    ctx.instance.runtime_properties['resource_id'] = resource.get('job')
+        ctx.instance.runtime_properties['resource'] = \
+            utils.project_resource(resource, utils.get_resource_fields())
+        ctx.instance.runtime_properties['resource_id'], \
+            ctx.instance.runtime_properties['resource_type'] = \
+            get_launched_job(resource)
+        if ctx.node.properties.get('wait_for_completion'):
+            ctx.instance.runtime_properties['deadline'] = time.time() + \
+                wait_config.get('timeout', constants.JOB_WAIT_TIMEOUT)
+        # Persist the job ID so a resumed operation re-attaches to it
+        ctx.instance.update()
+
+    if not ctx.node.properties.get('wait_for_completion'):
+        return
+    job_object = get_job_object(
+        ctx.instance.runtime_properties['resource_id'],
+        ctx.instance.runtime_properties.get('resource_type', 'job'))
+    on_poll = None
+    if isinstance(job_object, WorkflowJob):
+        # Sliced launch, events belong to the slices
+        def on_poll(_):
+            log_slices(job_object)
+    elif events_config.get('enabled'):
+        def on_poll(_):
+            forward_events(job_object, events_config)
+    job = job_object.wait(
+        ctx.instance.runtime_properties['deadline'],
+        poll_interval=wait_config.get(
+            'poll_interval', constants.JOB_POLL_INTERVAL),
+        max_poll_interval=wait_config.get(
+            'max_poll_interval', constants.JOB_MAX_POLL_INTERVAL),
+        on_poll=on_poll)
+    ctx.instance.runtime_properties['status'] = job.get('status')
 
 
 @operation(resumable=True)
+@metrics.collect
 def delete(**_):
     """Deletes a Job"""
-    job_object = Job()
-    job_object.resource_id = ctx.instance.runtime_properties['resource_id']
+    job_object = get_job_object(
+        ctx.instance.runtime_properties['resource_id'],
+        ctx.instance.runtime_properties.get('resource_type', 'job'))
     utils.task_resource_delete(job_object)
+
+
+def get_batch_key(index, entry):
+    """Name of a JobBatch entry in the aggregated results"""
+    return entry.get('name') or '{0}-{1}'.format(index, entry['job_template'])
+
+
+def launch_entry(entry):
+    """
+        Launches the job template of a JobBatch entry
+    :param dict entry: Job template (name or ID) and launch overrides
+    :returns: Launched job
+    :rtype: dict
+    """
+    params = get_launch_params(entry.get('launch') or dict())
+    template = JobTemplate()
+    template.resource_id = resolve_launch(entry['job_template'], params)
+    if not template.resource_id:
+        raise NonRecoverableError(
+            'JobTemplate "{0}" not found'.format(entry['job_template']))
+    return template.launch(params)
+
+
+def wait_jobs(jobs, deadline,
+              poll_interval=constants.JOB_POLL_INTERVAL,
+              max_poll_interval=constants.JOB_MAX_POLL_INTERVAL,
+              limit=None):
+    """
+        Waits for many jobs to finish. All unfinished jobs are polled
+        concurrently each round, with the same backoff as `Job.wait`.
+    :param dict jobs: Job ID ("job") and type ("type") by key
+    :param float deadline: Time (epoch) to stop waiting at
+    :param float poll_interval: Initial seconds between polls
+    :param float max_poll_interval: Maximum seconds between polls
+    :param int limit: Maximum number of concurrent requests
+    :returns: Final job status by key ("timeout" if still running
+        at the deadline)
+    :rtype: dict
+    """
+    pending = dict()
+    for key, job in jobs.items():
+        pending[key] = get_job_object(job['job'], job.get('type', 'job'))
+    statuses = dict()
+    interval = poll_interval
+    while pending:
+        keys = list(pending)
+        results = connection.gather(
+            [pending[key].async_get() for key in keys],
+            return_exceptions=True, limit=limit)
+        for key, job in zip(keys, results):
+            # Errors are retried with the next round
+            if isinstance(job, Exception):
+                ctx.logger.warning('Job "{0}": {1}'.format(key, job))
+                continue
+            if job.get('status') == constants.JOB_SUCCESSFUL or \
+                    job.get('status') in constants.JOB_FAILED_STATUSES:
+                statuses[key] = job['status']
+                del pending[key]
+        remaining = deadline - time.time()
+        if pending and remaining <= 0:
+            for key in pending:
+                statuses[key] = 'timeout'
+            break
+        if pending:
+            ctx.logger.info('Waiting for {0} jobs'.format(len(pending)))
+            # Stops at the operation deadline as well
+            next(iter(pending.values())).client.sleep(
+                min(remaining, random.uniform(interval / 2, interval)))
+            interval = min(interval * 2, max_poll_interval)
+    return statuses
+
+
+@operation(resumable=True)
+@metrics.collect
+def launch_batch(**_):
+    """Launches many JobTemplates concurrently"""
+    config = ctx.node.properties.get('resource_config')
+    wait_config = ctx.node.properties.get('wait_config') or dict()
+    limit = config.get('concurrency') or \
+        utils.get_client_config().get(
+            'concurrency', constants.DEFAULT_CONCURRENCY)
+    jobs = ctx.instance.runtime_properties.get('jobs', dict())
+    if ctx.node.properties.get('wait_for_completion') and \
+            'deadline' not in ctx.instance.runtime_properties:
+        ctx.instance.runtime_properties['deadline'] = time.time() + \
+            wait_config.get('timeout', constants.JOB_WAIT_TIMEOUT)
+
+    # Launch the entries that weren't launched by a previous attempt
+    entries = dict()
+    for index, entry in enumerate(config.get('jobs', list())):
+        key = get_batch_key(index, entry)
+        if key in entries:
+            raise NonRecoverableError(
+                'JobBatch entry "{0}" is duplicated'.format(key))
+        entries[key] = entry
+    keys = [key for key in entries if not jobs.get(key, {}).get('job')]
+    launcher = JobTemplate()
+    results = connection.gather(
+        [launcher.async_client.call(launch_entry, entries[key])
+         for key in keys],
+        return_exceptions=True, limit=limit)
+    errors = dict()
+    for key, result in zip(keys, results):
+        if isinstance(result, Exception):
+            errors[key] = result
+            ctx.logger.error('Job "{0}": {1}'.format(key, result))
+            continue
+        job_id, job_type = get_launched_job(result)
+        jobs[key] = dict(
+            job_template=entries[key]['job_template'],
+            job=job_id,
+            type=job_type,
+            status=result.get('status'))
+    ctx.instance.runtime_properties['jobs'] = jobs
+    # Persist the job IDs so a resumed operation re-attaches to them
+    ctx.instance.update()
+    if errors:
+        message = '{0} of {1} jobs could not be launched: {2}'.format(
+            len(errors), len(entries), ', '.join(sorted(errors)))
+        if any(isinstance(e, NonRecoverableError) for e in errors.values()):
+            raise NonRecoverableError(message)
+        raise RecoverableError(message)
+
+    if not ctx.node.properties.get('wait_for_completion'):
+        return
+    statuses = wait_jobs(
+        jobs,
+        ctx.instance.runtime_properties['deadline'],
+        poll_interval=wait_config.get(
+            'poll_interval', constants.JOB_POLL_INTERVAL),
+        max_poll_interval=wait_config.get(
+            'max_poll_interval', constants.JOB_MAX_POLL_INTERVAL),
+        limit=limit)
+    for key, status in statuses.items():
+        jobs[key]['status'] = status
+    ctx.instance.runtime_properties['jobs'] = jobs
+    failed = sorted(k for k, v in statuses.items()
+                    if v != constants.JOB_SUCCESSFUL)
+    if failed:
+        raise NonRecoverableError(
+            '{0} of {1} jobs did not succeed: {2}'.format(
+                len(failed), len(jobs), ', '.join(
+                    '{0} ({1})'.format(k, statuses[k]) for k in failed)))
+
+
+@operation(resumable=True)
+@metrics.collect
+def delete_batch(**_):
+    """Deletes the Jobs launched by a JobBatch"""
+    jobs = ctx.instance.runtime_properties.get('jobs', dict())
+    keys = [key for key in jobs if jobs[key].get('job')]
+    job_objects = list()
+    for key in keys:
+        job_objects.append(get_job_object(
+            jobs[key]['job'], jobs[key].get('type', 'job')))
+    results = connection.gather(
+        [j.async_client.call(delete_job, j) for j in job_objects],
+        return_exceptions=True)
+    failed = list()
+    for key, result in zip(keys, results):
+        if isinstance(result, Exception):
+            ctx.logger.error('Job "{0}": {1}'.format(key, result))
+            failed.append(key)
+        else:
+            del jobs[key]
+    if failed:
+        ctx.instance.runtime_properties['jobs'] = jobs
+        ctx.instance.update()
+        raise RecoverableError(
+            '{0} jobs could not be deleted: {1}'.format(
+                len(failed), ', '.join(sorted(failed))))
+    utils.runtime_properties_cleanup()
+
+
+def delete_job(job_object):
+    """Deletes a Job, if it still exists"""
+    if job_object.exists():
+        job_object.delete()
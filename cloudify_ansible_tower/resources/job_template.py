@@ -27,9 +27,10 @@ from cloudify.exceptions import NonRecoverableError, RecoverableError
 # Lifecycle operation decorator
 from cloudify.decorators import operation
 # API version
-from cloudify_ansible_tower import utils
+from cloudify_ansible_tower import metrics, schema, utils
 # Base resource class
-from cloudify_ansible_tower.resources.base import Resource
+from cloudify_ansible_tower.resources.base import (
+    Resource, resolve_references)
 # Resources
 from cloudify_ansible_tower.resources.credential import Credential
 from cloudify_ansible_tower.resources.project import Project
@@ -74,7 +75,6 @@ class JobTemplate(Resource):
             method='post',
             url=self.resource_url + 'credentials/',
             json=dict(id=credential.resource_id))
-        self.log.debug('headers: {0}'.format(dict(res.headers)))
         # Check the response
         # If API sent a 400, we're sending bad data
         if res.status_code == http_codes.bad_request:
@@ -107,7 +107,6 @@ class JobTemplate(Resource):
             json=dict(
               id=credential.resource_id,
               disassociate=True))
-        self.log.debug('headers: {0}'.format(dict(res.headers)))
         # Check the response
         # If API sent a 400, we're sending bad data
         if res.status_code == http_codes.bad_request:
@@ -120,10 +119,11 @@ class JobTemplate(Resource):
                 'Expected HTTP status code {0}, recieved {1}'
                 .format(http_codes.no_content, res.status_code))
 
-    def launch(self):
+    def launch(self, params=None):
         """
             Launches job template
-        :param dict params: Parameters to be passed as-is to the API
+        :param dict params: Launch-time parameters to be passed
+            as-is to the API (extra_vars, limit, inventory, ...)
         :raises: :exc:`cloudify.exceptions.RecoverableError`,
                  :exc:`cloudify.exceptions.NonRecoverableError`
         """
@@ -134,8 +134,7 @@ class JobTemplate(Resource):
         res = self.client.request(
             method='post',
             url=self.resource_url + 'launch/',
-            json=dict())
-        self.log.debug('headers: {0}'.format(dict(res.headers)))
+            json=schema.normalize(params, 'Job') or dict())
         # Check the response
         # If API sent a 400, we're sending bad data
         if res.status_code == http_codes.bad_request:
@@ -147,52 +146,45 @@ class JobTemplate(Resource):
             raise RecoverableError(
                 'Expected HTTP status code {0}, recieved {1}'
                 .format(http_codes.created, res.status_code))
-        return res.json()
+        data = res.json()
+        # Fields not enabled with "ask_*_on_launch" are dropped by Tower
+        if data.get('ignored_fields'):
+            self.log.warning('{0} ({1}) ignored launch parameters: {2}'.format(
+                self.name, self.resource_id, data['ignored_fields']))
+        return data
 
 
 @operation(resumable=True)
+@metrics.collect
 def create(**_):
     """Uses an existing, or creates a new, JobTemplate"""
     config = ctx.node.properties.get('resource_config')
 
-    # Get project reference
-    rel_project = utils.get_relationship_by_type(
-        ctx.instance.relationships,
-        'cloudify.ansible_tower.relationships.contained_in_project')
-    if rel_project:
-        config['project'] = utils.get_resource_name(rel_project.target)
-    elif config.get('project'):
-        config['project'] = \
-            Project().lookup_id(config['project'])
-
-    # Get inventory reference
-    rel_inventory = utils.get_relationship_by_type(
-        ctx.instance.relationships,
-        'cloudify.ansible_tower.relationships.connected_to_inventory')
-    if rel_inventory:
-        config['inventory'] = utils.get_resource_name(rel_inventory.target)
-    elif config.get('inventory'):
-        config['inventory'] = \
-            Inventory().lookup_id(config['inventory'])
-
-    ctx.instance.runtime_properties['resource'] = \
-        utils.task_resource_create(JobTemplate(), config)
-    ctx.instance.runtime_properties['resource_id'] = \
-        ctx.instance.runtime_properties['resource'].get('id')
+    # Get project and inventory references
+    resolve_references(config, [
+        ('project', Project,
+         'cloudify.ansible_tower.relationships.contained_in_project'),
+        ('inventory', Inventory,
+         'cloudify.ansible_tower.relationships.connected_to_inventory')])
+
+    utils.set_resource(utils.task_resource_create(JobTemplate(), config))
 
 
 @operation(resumable=True)
+@metrics.collect
 def delete(**_):
     """Deletes a JobTemplate"""
     utils.task_resource_delete(JobTemplate())
 
 @operation(resumable=True)
+@metrics.collect
 def link_credential(**_):
     """Add Credential to JobTemplate"""
     JobTemplate(_ctx=ctx.source).add_credential(
         Credential(_ctx=ctx.target))
 
 @operation(resumable=True)
+@metrics.collect
 def unlink_credential(**_):
     """Remove Credential from JobTemplate"""
     JobTemplate(_ctx=ctx.source).remove_credential(
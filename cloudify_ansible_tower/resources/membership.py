@@ -0,0 +1,55 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    resources.Membership
+    ~~~~~~~~~~~~~~~~~~~~
+    Bulk user membership of Ansible Tower Teams and Organizations
+"""
+
+# Node properties and logger
+from cloudify import ctx
+# Lifecycle operation decorator
+from cloudify.decorators import operation
+# Request metrics
+from cloudify_ansible_tower import metrics
+# Resources
+from cloudify_ansible_tower.resources.team import Team
+from cloudify_ansible_tower.resources.user import User
+from cloudify_ansible_tower.resources.organization import Organization
+
+CLASS_MAP = {
+  'cloudify.ansible_tower.nodes.Team': Team,
+  'cloudify.ansible_tower.nodes.Organization': Organization
+}
+
+
+@operation(resumable=True)
+@metrics.collect
+def sync_users(users=None, prune=None, **_):
+    """
+        Makes the members of a Team or Organization the users of
+        its "users" property (or of the "users" input). Current
+        members are fetched once, and only the difference is applied.
+    """
+    if users is None:
+        users = ctx.node.properties.get('users')
+    if users is None:
+        return
+    if prune is None:
+        prune = ctx.node.properties.get('prune_users', True)
+    added, removed = CLASS_MAP[ctx.node.type]().sync_members(
+        'users', users, User, prune=prune)
+    ctx.logger.info('Added {0} and removed {1} users'.format(
+        len(added), len(removed)))
@@ -19,16 +19,14 @@
     Ansible Tower Organization interface
 """
 
-from requests import codes as http_codes
 # Node properties and logger
 from cloudify import ctx
-from cloudify.exceptions import NonRecoverableError, RecoverableError
 # Lifecycle operation decorator
 from cloudify.decorators import operation
 # Base resource class
 from cloudify_ansible_tower.resources.base import Resource
 # API version
-from cloudify_ansible_tower import utils
+from cloudify_ansible_tower import metrics, utils
 
 
 class Organization(Resource):
@@ -61,23 +59,7 @@ class Organization(Resource):
         self.log.info('Adding User({0}) to Organization({1})'.format(
             user.resource_id, self.resource_id))
 
-        # Make the request
-        res = self.client.request(
-            method='post',
-            url=self.resource_url + 'users/',
-            json=dict(id=user.resource_id))
-        self.log.debug('headers: {0}'.format(dict(res.headers)))
-        # Check the response
-        # If API sent a 400, we're sending bad data
-        if res.status_code == http_codes.bad_request:
-            self.log.info('BAD REQUEST: response: {}'.format(res.content))
-            raise NonRecoverableError(
-                '{0} BAD REQUEST'.format(self.name))
-        # All other errors will be treated as recoverable
-        if res.status_code != http_codes.no_content:
-            raise RecoverableError(
-                'Expected HTTP status code {0}, recieved {1}'
-                .format(http_codes.no_content, res.status_code))
+        self.associate(self.resource_url + 'users/', user.resource_id)
 
     def remove_user(self, user):
         """
@@ -90,39 +72,22 @@ class Organization(Resource):
         self.log.info('Removing User({0}) from Organization({1})'.format(
             user.resource_id, self.resource_id))
 
-        # Make the request
-        res = self.client.request(
-            method='post',
-            url=self.resource_url + 'users/',
-            json=dict(
-                id=user.resource_id,
-                disassociate=True))
-        self.log.debug('headers: {0}'.format(dict(res.headers)))
-        # Check the response
-        # If API sent a 400, we're sending bad data
-        if res.status_code == http_codes.bad_request:
-            self.log.info('BAD REQUEST: response: {}'.format(res.content))
-            raise NonRecoverableError(
-                '{0} BAD REQUEST'.format(self.name))
-        # All other errors will be treated as recoverable
-        if res.status_code != http_codes.no_content:
-            raise RecoverableError(
-                'Expected HTTP status code {0}, recieved {1}'
-                .format(http_codes.no_content, res.status_code))
+        self.associate(
+            self.resource_url + 'users/', user.resource_id,
+            disassociate=True)
 
 
 @operation(resumable=True)
+@metrics.collect
 def create(**_):
     """Uses an existing, or creates a new, Organization"""
-    ctx.instance.runtime_properties['resource'] = \
-        utils.task_resource_create(
-            Organization(),
-            ctx.node.properties.get('resource_config'))
-    ctx.instance.runtime_properties['resource_id'] = \
-        ctx.instance.runtime_properties['resource'].get('id')
+    utils.set_resource(utils.task_resource_create(
+        Organization(),
+        ctx.node.properties.get('resource_config')))
 
 
 @operation(resumable=True)
+@metrics.collect
 def delete(**_):
     """Deletes a Organization"""
     utils.task_resource_delete(Organization())
@@ -24,7 +24,7 @@ from cloudify import ctx
 # Lifecycle operation decorator
 from cloudify.decorators import operation
 # API version
-from cloudify_ansible_tower import utils
+from cloudify_ansible_tower import metrics, utils
 # Base resource class
 from cloudify_ansible_tower.resources.base import Resource
 # Resources
@@ -52,6 +52,7 @@ class Project(Resource):
 
 
 @operation(resumable=True)
+@metrics.collect
 def create(**_):
     """Uses an existing, or creates a new, Project"""
     config = ctx.node.properties.get('resource_config')
@@ -66,13 +67,11 @@ def create(**_):
         config['organization'] = \
             Organization().lookup_id(config['organization'])
 
-    ctx.instance.runtime_properties['resource'] = \
-        utils.task_resource_create(Project(), config)
-    ctx.instance.runtime_properties['resource_id'] = \
-        ctx.instance.runtime_properties['resource'].get('id')
+    utils.set_resource(utils.task_resource_create(Project(), config))
 
 
 @operation(resumable=True)
+@metrics.collect
 def delete(**_):
     """Deletes a Project"""
     utils.task_resource_delete(Project())
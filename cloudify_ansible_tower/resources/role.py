@@ -19,20 +19,26 @@
     Ansible Tower Role interface
 """
 
-from requests import codes as http_codes
+from collections import defaultdict
+
 # Node properties and logger
 from cloudify import ctx
 # Exceptions
-from cloudify.exceptions import NonRecoverableError, RecoverableError
+from cloudify.exceptions import NonRecoverableError
 # Lifecycle operation decorator
 from cloudify.decorators import operation
+# Request metrics
+from cloudify_ansible_tower import connection, constants, metrics, utils
 # Base resource class
 from cloudify_ansible_tower.resources.base import Resource
 # Resources
 from cloudify_ansible_tower.resources.team import Team
 from cloudify_ansible_tower.resources.user import User
 from cloudify_ansible_tower.resources.project import Project
+from cloudify_ansible_tower.resources.inventory import Inventory
+from cloudify_ansible_tower.resources.credential import Credential
 from cloudify_ansible_tower.resources.job_template import JobTemplate
+from cloudify_ansible_tower.resources.organization import Organization
 
 
 class Role(Resource):
@@ -54,6 +60,23 @@ class Role(Resource):
             logger=logger,
             _ctx=_ctx)
 
+    def get_role_url(self, target, principal, role):
+        """
+            Gets the URL associating users or teams with a role
+        :param target: Resource the role belongs to
+        :param principal: User or Team resource
+        :param str role: Role name (Admin, Use, Execute, Read, ...)
+        :returns: URL of the role's users (or teams)
+        :rtype: string
+        :raises: :exc:`cloudify.exceptions.NonRecoverableError` if
+            the target has no such role
+        """
+        r_obj = target.lookup_role(role)
+        if not r_obj:
+            raise NonRecoverableError('{0}({1}) has no "{2}" role'.format(
+                target.name, target.resource_id, role))
+        return r_obj['related'][principal.name.lower() + 's']
+
     def add(self, target, user, role):
         """
             Adds permission
@@ -66,27 +89,9 @@ class Role(Resource):
         self.log.info('Adding {0}({1}) to {2}({3})'.format(
             user.name, user.resource_id,
             target.name, target.resource_id))
-
-        self.log.debug('Calling {0}'.format(
-            target.lookup_role(role)['related'][user.name.lower() + 's']))
-
-        # Make the request
-        res = target.client.request(
-            method='post',
-            url=target.lookup_role(role)['related'][user.name.lower() + 's'],
-            json=dict(id=user.resource_id))
-        self.log.debug('headers: {0}'.format(dict(res.headers)))
-        # Check the response
-        # If API sent a 400, we're sending bad data
-        if res.status_code == http_codes.bad_request:
-            self.log.info('BAD REQUEST: response: {}'.format(res.content))
-            raise NonRecoverableError(
-                '{0} BAD REQUEST'.format(target.name))
-        # All other errors will be treated as recoverable
-        if res.status_code != http_codes.no_content:
-            raise RecoverableError(
-                'Expected HTTP status code {0}, recieved {1}'
-                .format(http_codes.no_content, res.status_code))
+        url = self.get_role_url(target, user, role)
+        self.log.debug('Calling {0}'.format(url))
+        target.associate(url, user.resource_id)
 
     def remove(self, target, user, role):
         """
@@ -100,35 +105,163 @@ class Role(Resource):
         self.log.info('Removing {0}({1}) from {2}({3})'.format(
             user.name, user.resource_id,
             target.name, target.resource_id))
+        target.associate(
+            self.get_role_url(target, user, role),
+            user.resource_id, disassociate=True)
 
-        # Make the request
-        res = target.client.request(
-            method='post',
-            url=target.lookup_role(role)['related'][user.name.lower() + 's'],
-            json=dict(
-                id=user.resource_id,
-                disassociate=True))
-        self.log.debug('headers: {0}'.format(dict(res.headers)))
-        # Check the response
-        # If API sent a 400, we're sending bad data
-        if res.status_code == http_codes.bad_request:
-            self.log.info('BAD REQUEST: response: {}'.format(res.content))
-            raise NonRecoverableError(
-                '{0} BAD REQUEST'.format(target.name))
-        # All other errors will be treated as recoverable
-        if res.status_code != http_codes.no_content:
-            raise RecoverableError(
-                'Expected HTTP status code {0}, recieved {1}'
-                .format(http_codes.no_content, res.status_code))
+    def assign(self, target, members, disassociate=False, limit=None):
+        """
+            Adds (or removes) many users and teams to roles of one
+            resource concurrently. Principal IDs and the current
+            members of every role are fetched first, so that
+            principals already holding (or, when removing, not
+            holding) a role are skipped. Principals without a known
+            ID are resolved by the names of their nodes, with one
+            bulk lookup per principal type.
+        Example::
+            users = [(User(_ctx=rel.target), 'Execute')
+                     for rel in ctx.instance.relationships]
+            Role().assign(JobTemplate(), users)
+        :param target: Resource the roles belong to
+        :param list members: (User or Team resource, role name) pairs
+        :param bool disassociate: Remove the principals from the roles
+        :param int limit: Maximum number of concurrent requests.
+            Defaults to `client_config.concurrency`.
+        :returns: Number of associations changed
+        :rtype: integer
+        :raises: :exc:`cloudify.exceptions.RecoverableError`,
+                 :exc:`cloudify.exceptions.NonRecoverableError`
+        """
+        limit = limit or self.client.config.get(
+            'concurrency', constants.DEFAULT_CONCURRENCY)
+        # Resolve the role URLs once per target, from its role index
+        members = [(principal, self.get_role_url(target, principal, role))
+                   for principal, role in members]
+        principals = list(dict(
+            (id(principal), principal) for principal, _ in members).values())
+        # Principals to resolve, by type and node resource name
+        unresolved = defaultdict(lambda: defaultdict(list))
+        for principal in principals:
+            if not principal._id:
+                unresolved[principal.name][utils.get_resource_name(
+                    _ctx=principal.ctx)].append(principal)
+        groups = list(unresolved.values())
+        urls = sorted(set(url for _, url in members))
+        results = connection.gather(
+            [self.async_client.call(
+                list(group.values())[0][0].lookup_ids, list(group))
+             for group in groups] +
+            [self.async_client.call(self.get_member_ids, url)
+             for url in urls],
+            limit=limit)
+        missing = list()
+        for group, ids in zip(groups, results[:len(groups)]):
+            for name, named in group.items():
+                if ids[name] is None:
+                    missing.append('{0} "{1}"'.format(named[0].name, name))
+                for principal in named:
+                    principal.resource_id = ids[name]
+        if missing:
+            raise NonRecoverableError('{0} role members not found ({1})'
+                                      .format(len(missing), ', '.join(
+                                          sorted(missing))))
+        ids = dict((id(principal), principal.resource_id)
+                   for principal in principals)
+        current = dict(zip(urls, results[len(groups):]))
+        changes = sorted(set(
+            (url, ids[id(principal)]) for principal, url in members
+            if (ids[id(principal)] in current[url]) == disassociate))
+        self.log.info('{0} {1} role memberships of {2}({3}), {4} '
+                      'unchanged'.format(
+                          'Removing' if disassociate else 'Adding',
+                          len(changes), target.name, target.resource_id,
+                          len(members) - len(changes)))
+        connection.gather(
+            [self.async_client.call(
+                target.associate, url, principal_id, disassociate)
+             for url, principal_id in changes],
+            limit=limit)
+        return len(changes)
 
 
 CLASS_MAP = {
   'cloudify.ansible_tower.nodes.JobTemplate': JobTemplate,
-  'cloudify.ansible_tower.nodes.Project': Project
+  'cloudify.ansible_tower.nodes.Project': Project,
+  'cloudify.ansible_tower.nodes.Inventory': Inventory,
+  'cloudify.ansible_tower.nodes.Credential': Credential,
+  'cloudify.ansible_tower.nodes.Organization': Organization,
+  'cloudify.ansible_tower.nodes.Team': Team
 }
 
+PRINCIPALS = [('users', User), ('teams', Team)]
+
+
+def get_batch_target(config, _ctx=ctx):
+    """Gets the resource a RoleBatch assigns the roles of"""
+    rel_target = utils.get_relationship_by_type(
+        _ctx.instance.relationships,
+        'cloudify.ansible_tower.relationships.roles_assigned_to')
+    if rel_target:
+        return CLASS_MAP[rel_target.target.node.type](_ctx=rel_target.target)
+    classes = dict(
+        (node_type.split('.')[-1], resource_class)
+        for node_type, resource_class in CLASS_MAP.items())
+    target_type = config.get('target_type')
+    if target_type not in classes:
+        raise NonRecoverableError(
+            'Role target type "{0}" is not one of {1}'.format(
+                target_type, ', '.join(sorted(classes))))
+    target = classes[target_type]()
+    target.resource_id = target.lookup_id(config.get('target'))
+    if target.resource_id is None:
+        raise NonRecoverableError('{0} "{1}" not found'.format(
+            target_type, config.get('target')))
+    return target
+
+
+def get_batch_members(config):
+    """
+        Gets the (principal, role name) pairs of a RoleBatch, with the
+        users and teams resolved by name in bulk
+    """
+    grants = config.get('roles') or list()
+    members = list()
+    for key, principal_class in PRINCIPALS:
+        names = [name for grant in grants for name in grant.get(key) or []]
+        if not names:
+            continue
+        ids = principal_class().lookup_ids(names)
+        missing = sorted(str(name) for name in ids if ids[name] is None)
+        if missing:
+            raise NonRecoverableError('{0} {1} not found ({2})'.format(
+                len(missing), key, ', '.join(missing)))
+        for grant in grants:
+            for name in grant.get(key) or []:
+                principal = principal_class()
+                principal.resource_id = ids[name]
+                members.append((principal, grant['role']))
+    return members
+
+
+@operation(resumable=True)
+@metrics.collect
+def assign_batch(**_):
+    """Grants roles of one resource to many Users and Teams"""
+    config = ctx.node.properties.get('resource_config') or dict()
+    Role().assign(get_batch_target(config), get_batch_members(config))
+
+
+@operation(resumable=True)
+@metrics.collect
+def unassign_batch(**_):
+    """Revokes the roles granted by a RoleBatch"""
+    config = ctx.node.properties.get('resource_config') or dict()
+    Role().assign(get_batch_target(config), get_batch_members(config),
+                  disassociate=True)
+
 
 @operation(resumable=True)
+@metrics.collect
 def add_user(role, **_):
     """Add User to Role"""
     Role(_ctx=ctx.source).add(
@@ -136,6 +269,7 @@ def add_user(role, **_):
         User(_ctx=ctx.target), role)
 
 @operation(resumable=True)
+@metrics.collect
 def remove_user(role, **_):
     """Remove User from Role"""
     Role(_ctx=ctx.source).remove(
@@ -144,6 +278,7 @@ def remove_user(role, **_):
 
 
 @operation(resumable=True)
+@metrics.collect
 def add_team(role, **_):
     """Add Team to Role"""
     Role(_ctx=ctx.source).add(
@@ -152,6 +287,7 @@ def add_team(role, **_):
 
 
 @operation(resumable=True)
+@metrics.collect
 def remove_team(role, **_):
     """Remove Team from Role"""
     Role(_ctx=ctx.source).remove(
@@ -19,15 +19,12 @@
     Ansible Tower Team interface
 """
 
-from requests import codes as http_codes
 # Node properties and logger
 from cloudify import ctx
-# Exceptions
-from cloudify.exceptions import NonRecoverableError, RecoverableError
 # Lifecycle operation decorator
 from cloudify.decorators import operation
 # API version
-from cloudify_ansible_tower import utils
+from cloudify_ansible_tower import metrics, utils
 # Base resource class
 from cloudify_ansible_tower.resources.base import Resource
 # Resources
@@ -64,23 +61,7 @@ class Team(Resource):
         self.log.info('Adding User({0}) to Team({1})'.format(
             user.resource_id, self.resource_id))
 
-        # Make the request
-        res = self.client.request(
-            method='post',
-            url=self.resource_url + 'users/',
-            json=dict(id=user.resource_id))
-        self.log.debug('headers: {0}'.format(dict(res.headers)))
-        # Check the response
-        # If API sent a 400, we're sending bad data
-        if res.status_code == http_codes.bad_request:
-            self.log.info('BAD REQUEST: response: {}'.format(res.content))
-            raise NonRecoverableError(
-                '{0} BAD REQUEST'.format(self.name))
-        # All other errors will be treated as recoverable
-        if res.status_code != http_codes.no_content:
-            raise RecoverableError(
-                'Expected HTTP status code {0}, recieved {1}'
-                .format(http_codes.no_content, res.status_code))
+        self.associate(self.resource_url + 'users/', user.resource_id)
 
     def remove_user(self, user):
         """
@@ -93,28 +74,13 @@ class Team(Resource):
         self.log.info('Removing User({0}) from Team({1})'.format(
             user.resource_id, self.resource_id))
 
-        # Make the request
-        res = self.client.request(
-            method='post',
-            url=self.resource_url + 'users/',
-            json=dict(
-                id=user.resource_id,
-                disassociate=True))
-        self.log.debug('headers: {0}'.format(dict(res.headers)))
-        # Check the response
-        # If API sent a 400, we're sending bad data
-        if res.status_code == http_codes.bad_request:
-            self.log.info('BAD REQUEST: response: {}'.format(res.content))
-            raise NonRecoverableError(
-                '{0} BAD REQUEST'.format(self.name))
-        # All other errors will be treated as recoverable
-        if res.status_code != http_codes.no_content:
-            raise RecoverableError(
-                'Expected HTTP status code {0}, recieved {1}'
-                .format(http_codes.no_content, res.status_code))
+        self.associate(
+            self.resource_url + 'users/', user.resource_id,
+            disassociate=True)
 
 
 @operation(resumable=True)
+@metrics.collect
 def create(**_):
     """Uses an existing, or creates a new, Team"""
     config = ctx.node.properties.get('resource_config')
@@ -129,13 +95,11 @@ def create(**_):
         config['organization'] = \
             Organization().lookup_id(config['organization'])
 
-    ctx.instance.runtime_properties['resource'] = \
-        utils.task_resource_create(Team(), config)
-    ctx.instance.runtime_properties['resource_id'] = \
-        ctx.instance.runtime_properties['resource'].get('id')
+    utils.set_resource(utils.task_resource_create(Team(), config))
 
 
 @operation(resumable=True)
+@metrics.collect
 def delete(**_):
     """Deletes a Team"""
     utils.task_resource_delete(Team())
@@ -25,7 +25,7 @@ from cloudify.decorators import operation
 # Base resource class
 from cloudify_ansible_tower.resources.base import Resource
 # API version
-from cloudify_ansible_tower import utils
+from cloudify_ansible_tower import connection, metrics, utils
 # Resources
 from cloudify_ansible_tower.resources.organization import Organization
 from cloudify_ansible_tower.resources.team import Team
@@ -51,31 +51,35 @@ class User(Resource):
 
 
 @operation(resumable=True)
+@metrics.collect
 def create(**_):
     """Uses an existing, or creates a new, User"""
-    ctx.instance.runtime_properties['resource'] = \
-        utils.task_resource_create(
-            User(),
-            ctx.node.properties.get('resource_config'))
-    ctx.instance.runtime_properties['resource_id'] = \
-        ctx.instance.runtime_properties['resource'].get('id')
+    utils.set_resource(utils.task_resource_create(
+        User(),
+        ctx.node.properties.get('resource_config')))
 
-    # Get team reference
+    # Get team and org references, and add the user to both at once
+    groups = list()
     rel_team = utils.get_relationship_by_type(
         ctx.instance.relationships,
         'cloudify.ansible_tower.relationships.connected_to_team')
     if rel_team:
-        Team(_ctx=rel_team.target).add_user(User())
-
-    # Get org reference
+        groups.append(Team(_ctx=rel_team.target))
     rel_org = utils.get_relationship_by_type(
         ctx.instance.relationships,
         'cloudify.ansible_tower.relationships.contained_in_organization')
     if rel_org:
-        Organization(_ctx=rel_org.target).add_user(User())
+        groups.append(Organization(_ctx=rel_org.target))
+    if groups:
+        user = User()
+        user.resource_id = ctx.instance.runtime_properties['resource_id']
+        connection.gather(
+            [group.async_client.call(group.add_user, user)
+             for group in groups])
 
 
 @operation(resumable=True)
+@metrics.collect
 def delete(**_):
     """Deletes a User"""
     # Get team reference
@@ -0,0 +1,311 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Schema
+    ~~~~~~
+    Payload normalization driven by the data types of plugin.yaml
+"""
+
+import os
+import re
+import json
+import threading
+
+import yaml
+
+from cloudify.exceptions import NonRecoverableError
+
+from cloudify_ansible_tower import constants
+
+# Type hint ending a property description, e.g. "(integer, default=0)"
+TYPE_HINT = re.compile(r'\(([^()]*)\)\s*$')
+RANGE_HINT = re.compile(r'^(\d+)-(\d+)$')
+BOOLEANS = {
+    'true': True, 'yes': True, 'on': True, '1': True,
+    'false': False, 'no': False, 'off': False, '0': False}
+SCALARS = (str, int, float, bool, type(None))
+
+_SCHEMAS = None
+_SCHEMAS_LOCK = threading.Lock()
+
+
+class Invalid(ValueError):
+    """Raised by coercers for values that can't be coerced"""
+
+
+def to_string(value):
+    """Coerces a scalar (but not a boolean) to a string"""
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise Invalid('expected a string')
+    return value if isinstance(value, str) else str(value)
+
+
+def to_integer(value):
+    """Coerces an integral number, or a string of digits, to an int"""
+    if isinstance(value, bool):
+        raise Invalid('expected an integer')
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value.strip().lstrip('-').isdigit():
+        return int(value)
+    raise Invalid('expected an integer')
+
+
+def to_boolean(value):
+    """Coerces 0/1 and strings such as "yes" or "off" to a bool"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in BOOLEANS:
+        return BOOLEANS[value.strip().lower()]
+    raise Invalid('expected a boolean')
+
+
+def to_id(value):
+    """
+        Coerces a numeric ID to an int. Names are left as is, to be
+        resolved by the operations.
+    """
+    if isinstance(value, str):
+        return int(value) if value.strip().isdigit() else value
+    return to_integer(value)
+
+
+def to_json(value):
+    """
+        Checks for an object, a list or a string. Strings are left
+        as is, Tower parses JSON or YAML strings itself.
+    """
+    if not isinstance(value, (dict, list, str)):
+        raise Invalid('expected an object, a list or a JSON/YAML string')
+    return value
+
+
+def to_list(coerce):
+    """Gets a coercer of lists, coercing their items with `coerce`"""
+    def coercer(value):
+        if not isinstance(value, list):
+            raise Invalid('expected a list')
+        return [coerce(item) for item in value]
+    return coercer
+
+
+def to_dict(value):
+    """Checks for a dictionary"""
+    if not isinstance(value, dict):
+        raise Invalid('expected a dictionary')
+    return value
+
+
+def to_choice(choices):
+    """Gets a coercer accepting only the values in `choices`"""
+    def coercer(value):
+        if value in choices:
+            return value
+        raise Invalid('expected one of {0}'.format(
+            ', '.join(json.dumps(choice) for choice in choices)))
+    return coercer
+
+
+def to_range(low, high):
+    """Gets a coercer of integers from `low` to `high` (inclusive)"""
+    def coercer(value):
+        value = to_integer(value)
+        if not low <= value <= high:
+            raise Invalid('expected an integer from {0} to {1}'.format(
+                low, high))
+        return value
+    return coercer
+
+
+COERCERS = {
+    'string': to_string,
+    'integer': to_integer,
+    'boolean': to_boolean,
+    'id': to_id,
+    'name or id': to_id,
+    'json': to_json,
+    'list': to_list(lambda item: item),
+    'list of id': to_list(to_id),
+    'dict': to_dict,
+}
+
+
+def compile_property(definition):
+    """
+        Gets the coercer of a data type property, from its "type" or
+        else from the type hint ending its description
+    :param dict definition: Property definition
+    :returns: Coercer, or None for properties of any type
+    :rtype: callable
+    """
+    if definition.get('type') in COERCERS:
+        return COERCERS[definition['type']]
+    match = TYPE_HINT.search(str(definition.get('description') or ''))
+    if not match:
+        return None
+    hint = match.group(1).strip()
+    if hint.startswith('['):
+        return to_choice([
+            choice.strip().strip('"\'')
+            for choice in hint[1:hint.find(']')].split(',')])
+    hint = hint.split(',')[0].strip()
+    match = RANGE_HINT.match(hint)
+    if match:
+        return to_range(int(match.group(1)), int(match.group(2)))
+    return COERCERS.get(hint)
+
+
+def compile_schemas(data_types):
+    """
+        Compiles the data types of a plugin definition
+    :param dict data_types: "data_types" section of plugin.yaml
+    :returns: Coercers by property, by data type name
+    :rtype: dict
+    """
+    schemas = dict()
+    for name, data_type in (data_types or dict()).items():
+        schema = dict()
+        for prop, definition in (
+                data_type.get('properties') or dict()).items():
+            coercer = compile_property(definition or dict())
+            if coercer and prop != 'kwargs':
+                schema[prop] = coercer
+        schemas[name] = schema
+    return schemas
+
+
+def load_schemas(paths=None):
+    """
+        Loads and compiles the data types of the first plugin.yaml found
+    :param list paths: Candidate plugin.yaml paths
+    :returns: Coercers by property, by data type name (empty if
+        no plugin.yaml was found)
+    :rtype: dict
+    """
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    for path in paths or constants.PLUGIN_YAML_PATHS:
+        if os.path.isfile(path):
+            with open(path) as plugin_file:
+                plugin = yaml.load(plugin_file, Loader=loader) or dict()
+            return compile_schemas(plugin.get('data_types'))
+    return dict()
+
+
+def get_schema(name):
+    """
+        Gets the compiled schema of a resource configuration. Schemas
+        are compiled once per process.
+    :param string name: Resource name, e.g. "JobTemplate" for the
+        "cloudify.datatypes.ansible_tower.JobTemplate.config" data type
+    :returns: Coercers by property (empty for unknown resources)
+    :rtype: dict
+    """
+    global _SCHEMAS
+    if _SCHEMAS is None:
+        with _SCHEMAS_LOCK:
+            if _SCHEMAS is None:
+                _SCHEMAS = load_schemas()
+    return _SCHEMAS.get(constants.RESOURCE_CONFIG_TYPE.format(
+        name.replace(' ', '')), dict())
+
+
+def to_key(key, path):
+    """Converts a dictionary key to a string, as JSON encoding does"""
+    if isinstance(key, str):
+        return str.__str__(key)
+    if not isinstance(key, SCALARS):
+        raise Invalid('{0}: key {1!r} is not a string'.format(path, key))
+    return json.dumps(key)
+
+
+def walk(value, path):
+    """
+        Copies a payload as plain JSON types: tuples become lists,
+        bytes are decoded and dictionary keys become strings
+    """
+    cls = type(value)
+    if cls is str or cls is int or cls is bool or value is None or \
+            cls is float:
+        return value
+    if isinstance(value, dict):
+        return dict(
+            (key if type(key) is str else to_key(key, path),
+             walk(item, path))
+            for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return [walk(item, path) for item in value]
+    # Subclasses of the JSON scalar types
+    for scalar in (bool, int, float, str):
+        if isinstance(value, scalar):
+            return scalar(value) if scalar is not str \
+                else str.__str__(value)
+    if isinstance(value, bytes):
+        try:
+            return value.decode('utf-8')
+        except UnicodeDecodeError:
+            raise Invalid('{0}: bytes are not UTF-8'.format(path))
+    raise Invalid('{0}: {1} is not JSON serializable'.format(
+        path, cls.__name__))
+
+
+def normalize(payload, name=None):
+    """
+        Normalizes a request payload in a single pass, coercing the
+        top-level fields declared by the resource's data type
+    Example::
+        normalize(dict(name=5, forks='10'), 'JobTemplate')
+        # {'name': '5', 'forks': 10}
+    :param payload: Payload (dict or list), or None
+    :param string name: Resource name, selecting the data type
+    :returns: Normalized copy of the payload
+    :raises: :exc:`cloudify.exceptions.NonRecoverableError` listing
+        every field that can't be coerced
+    """
+    if payload is None:
+        return None
+    if not isinstance(payload, (dict, list, tuple)):
+        raise NonRecoverableError(
+            'Expected a dictionary or list payload, got {0}'.format(
+                type(payload).__name__))
+    schema = get_schema(name) if name else dict()
+    errors = list()
+    if not isinstance(payload, dict):
+        try:
+            return walk(payload, '[]')
+        except Invalid as ex:
+            raise NonRecoverableError('Invalid payload: {0}'.format(ex))
+    normalized = dict()
+    for key, value in payload.items():
+        try:
+            key = to_key(key, '(payload)')
+            value = walk(value, key)
+            if value is not None and key in schema:
+                try:
+                    value = schema[key](value)
+                except Invalid as ex:
+                    raise Invalid('{0}: {1}, got {2}'.format(
+                        key, ex, json.dumps(value)[:64]))
+        except Invalid as ex:
+            errors.append(str(ex))
+            continue
+        normalized[key] = value
+    if errors:
+        raise NonRecoverableError('Invalid {0} fields: {1}'.format(
+            name or 'payload', '; '.join(errors)))
+    return normalized
@@ -0,0 +1,136 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Tracing
+    ~~~~~~~
+    Request/response tracing for the Ansible Tower REST API client
+"""
+
+import re
+import json
+import random
+import logging
+
+from cloudify_ansible_tower import constants, utils
+
+
+class Tracer(object):
+    """
+        Logs API requests at INFO and responses (status, headers and
+        body) at DEBUG, down to the configured level (by default,
+        both). Nothing is serialized unless the level is
+        enabled and the request is sampled. Logged payloads are
+        truncated and the values of secret-looking keys are redacted.
+    Example::
+        # Import
+        from cloudify_ansible_tower.tracing import Tracer
+        # Trace 10% of the requests, including response bodies
+        tracer = Tracer(log, dict(level='debug', sample_rate=0.1))
+    :param `logging.Logger` logger: Parent logger
+    :param dict config: Tracing configuration, with the keys "level",
+        "max_body", "sample_rate" and "redact"
+    """
+    def __init__(self, logger, config=None):
+        config = config or dict()
+        self.log = utils.create_child_logger('trace', plogger=logger)
+        self.level = logging.getLevelName(
+            str(config.get('level', constants.TRACE_LEVEL)).upper())
+        self.max_body = config.get('max_body', constants.TRACE_MAX_BODY)
+        self.sample_rate = config.get(
+            'sample_rate', constants.TRACE_SAMPLE_RATE)
+        self.encoder = json.JSONEncoder(default=str)
+        self.secrets = [key.lower() for key in config.get(
+            'redact', constants.TRACE_REDACT)]
+        self.redact_pattern = re.compile(
+            r'("[^"]*(?:{0})[^"]*"\s*:\s*)'
+            r'("(?:[^"\\]|\\.)*"?|[^,}}\]\s]+)'.format(
+                '|'.join(re.escape(key) for key in self.secrets)),
+            re.IGNORECASE)
+
+    def is_enabled(self, level):
+        """Checks if messages of `level` are traced"""
+        return level >= self.level and self.log.isEnabledFor(level)
+
+    def sample(self):
+        """
+            Decides if a request is traced
+        :returns: True if the request should be traced
+        :rtype: boolean
+        """
+        if not self.is_enabled(logging.INFO):
+            return False
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def truncate(self, chunks):
+        """
+            Joins string `chunks`, up to `max_body` characters
+        :returns: (text, truncated) tuple
+        :rtype: tuple
+        """
+        text = ''
+        for chunk in chunks:
+            text += chunk
+            if len(text) > self.max_body:
+                return text[:self.max_body], True
+        return text, False
+
+    def redact(self, text):
+        """Masks the values of secret-looking keys in JSON `text`"""
+        lowered = text.lower()
+        if not any(key in lowered for key in self.secrets):
+            return text
+        return self.redact_pattern.sub(r'\1"$redacted$"', text)
+
+    def dumps(self, obj):
+        """
+            Serializes, truncates and redacts an object. Encoding
+            stops as soon as `max_body` characters are produced.
+        """
+        text, truncated = self.truncate(self.encoder.iterencode(obj))
+        text = self.redact(text)
+        if truncated:
+            text += '... (truncated)'
+        return text
+
+    def request(self, kwargs):
+        """
+            Traces an outgoing request
+        :param dict kwargs: requests.Session.request() arguments
+        :returns: True if the request was sampled, in which case
+            its response should be traced as well
+        :rtype: boolean
+        """
+        if not self.sample():
+            return False
+        self.log.info('request({0})'.format(self.dumps(kwargs)))
+        return True
+
+    def response(self, res):
+        """
+            Traces a received response
+        :param `requests.Response` res: Response to trace
+        """
+        if not self.is_enabled(logging.DEBUG):
+            return
+        body = self.redact(
+            res.content[:self.max_body].decode('utf-8', 'replace'))
+        if len(res.content) > self.max_body:
+            body += '... ({0} more bytes)'.format(
+                len(res.content) - self.max_body)
+        self.log.debug(
+            'response: (status={0}, headers={1}, data={2})'.format(
+                res.status_code,
+                self.dumps(dict(res.headers)),
+                body))
@@ -20,14 +20,25 @@
 
 # Py3 Compatibility
 
+import os
+import json
+import stat
+import fcntl
 from logging import DEBUG
+from functools import wraps
 from collections import namedtuple
 
 from cloudify import ctx
+from cloudify.state import current_ctx, NotInContext
+from cloudify.exceptions import NonRecoverableError
 
+from cloudify_ansible_tower import constants
+
+# "endpoints" lists every node of a Tower cluster, "endpoint" is the first
 APICredentials = namedtuple(
     'APICredentials',
-    ['endpoint', 'endpoint_verify', 'access_token'])
+    ['endpoint', 'endpoint_verify', 'access_token', 'endpoints'],
+    defaults=[None])
 
 
 def create_child_logger(name,
@@ -57,6 +68,27 @@ def create_child_logger(name,
     return log
 
 
+def bind_current_ctx(func):
+    """
+        Binds the Cloudify context of the calling thread to `func`
+        so that it can be called from worker threads, where the
+        global `ctx` proxy isn't set.
+    :param callable func: Function to bind
+    :returns: Function running under the caller's context
+    :rtype: callable
+    """
+    try:
+        _ctx = current_ctx.get_ctx()
+    except NotInContext:
+        return func
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with current_ctx.push(_ctx):
+            return func(*args, **kwargs)
+    return wrapper
+
+
 def dict_update(orig, updates):
     """Recursively merges two objects"""
     for key, val in updates.items():
@@ -79,9 +111,77 @@ def get_credentials(_ctx=ctx):
     props = _ctx.node.properties.get('client_config')
     properties = {
         k: props[k] for k in cred_keys if props.get(k) is not None }
+    # A list of endpoints is a cluster, whose first node is the primary
+    endpoints = properties.get('endpoint')
+    if isinstance(endpoints, list):
+        endpoints = [endpoint.rstrip('/') for endpoint in endpoints]
+        properties['endpoint'] = endpoints[0] if endpoints else None
+    else:
+        endpoints = [endpoints]
+    properties['endpoints'] = tuple(endpoints)
     return APICredentials(**properties)
 
 
+def get_client_config(_ctx=ctx):
+    """
+        Gets the client configuration (credentials and tuning
+        options) from the current node properties.
+    :returns: Client configuration
+    :rtype: dict
+    """
+    return _ctx.node.properties.get('client_config') or dict()
+
+
+def project_resource(r_obj, fields):
+    """
+        Keeps only some fields of an API object
+    Example::
+        project_resource(job_template, [
+            'id', 'name', 'summary_fields.project.name'])
+    :param dict r_obj: API object
+    :param list fields: Fields to keep, dotted fields select nested
+        values. "*" keeps the whole object.
+    :returns: Projected copy of the object
+    :rtype: dict
+    """
+    if not isinstance(r_obj, dict) or '*' in fields:
+        return r_obj
+    projected = dict()
+    for field in fields:
+        keys = field.split('.')
+        value = r_obj
+        for key in keys:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            target = projected
+            for key in keys[:-1]:
+                target = target.setdefault(key, dict())
+            target[keys[-1]] = value
+    return projected
+
+
+def get_resource_fields(_ctx=ctx):
+    """Fields of API objects kept in the "resource" runtime property"""
+    return get_client_config(_ctx=_ctx).get('resource_fields') or \
+        constants.RESOURCE_FIELDS
+
+
+def set_resource(r_obj, _ctx=ctx):
+    """
+        Stores an API object in the "resource" runtime property, keeping
+        only the fields of `client_config.resource_fields`, and its ID
+        in "resource_id". Use
+        :meth:`cloudify_ansible_tower.resources.base.Resource.get_object`
+        to get the other fields.
+    :param dict r_obj: API object
+    """
+    _ctx.instance.runtime_properties['resource'] = \
+        project_resource(r_obj, get_resource_fields(_ctx=_ctx))
+    _ctx.instance.runtime_properties['resource_id'] = r_obj.get('id')
+
+
 def runtime_properties_cleanup(_ctx=ctx):
     """
         Deletes all runtime properties
@@ -196,3 +296,82 @@ def get_relationships_by_type(rels, rel_type):
         if rel_type in rel.type_hierarchy:
             ret.append(rel)
     return ret
+
+
+def read_state_file(path):
+    """
+        Reads a JSON document written by :func:`update_state_file`,
+        without locking. Concurrent updates may be missed.
+    :returns: State, or None if the file is missing or unreadable
+    """
+    try:
+        with open(path, 'rb') as state_file:
+            return json.loads(state_file.read() or b'null')
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def update_state_file(path, func):
+    """
+        Updates a small JSON document under an exclusive file lock,
+        so that every process sharing the file sees consistent state
+    Example::
+        # Count calls across processes
+        def increment(state):
+            state = state or dict(calls=0)
+            state['calls'] += 1
+            return state, state['calls']
+        calls = utils.update_state_file('/tmp/calls.json', increment)
+    :param string path: Path to the state file
+    :param callable func: Called with the current state (None if the
+        file is new or unreadable), returns a (new state, result) tuple
+    :returns: Result returned by `func`
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            state = json.loads(os.read(fd, 65536) or b'null')
+        except ValueError:
+            state = None
+        state, result = func(state)
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.ftruncate(fd, 0)
+        os.write(fd, json.dumps(state).encode('utf-8'))
+        return result
+    finally:
+        os.close(fd)
+
+
+def make_private(path, directory=False):
+    """
+        Creates a file (or directory) only the current user can access,
+        unless it exists, and checks that it is private. State shared
+        by the operation processes of an agent must not be planted or
+        altered by other users.
+    :param string path: Path to the file or directory
+    :param bool directory: True if `path` is a directory
+    :returns: `path`
+    :rtype: string
+    :raises: :exc:`cloudify.exceptions.NonRecoverableError` if `path`
+        belongs to another user, is writable by other users or is
+        a symbolic link
+    """
+    parent = path if directory else os.path.dirname(path)
+    if parent and not os.path.isdir(parent):
+        os.makedirs(parent, mode=0o700, exist_ok=True)
+    if not directory:
+        try:
+            os.close(os.open(
+                path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+        except FileExistsError:
+            pass
+    info = os.lstat(path)
+    is_kind = stat.S_ISDIR if directory else stat.S_ISREG
+    if info.st_uid != os.getuid() or info.st_mode & 0o022 or \
+            not is_kind(info.st_mode):
+        raise NonRecoverableError(
+            '{0} must be a {1} owned, and only writable, by the current '
+            'user (uid {2})'.format(
+                path, 'directory' if directory else 'file', os.getuid()))
+    return path
@@ -16,6 +16,7 @@
 
 import os
 from setuptools import setup
+from setuptools.command.build_py import build_py
 
 
 def read(rel_path):
@@ -35,6 +36,16 @@ def get_version(rel_file='plugin.yaml'):
     raise RuntimeError('Unable to find version string.')
 
 
+class BuildPy(build_py):
+    '''Ships plugin.yaml, which holds the resource schemas, in the package'''
+    def run(self):
+        build_py.run(self)
+        self.copy_file(
+            'plugin.yaml',
+            os.path.join(self.build_lib, 'cloudify_ansible_tower',
+                         'plugin.yaml'))
+
+
 setup(
     name='cloudify-ansible-tower-plugin',
     version=get_version(),
@@ -47,5 +58,6 @@ setup(
     install_requires=[
         'cloudify-common>=4.5',
         'requests~=2.23.0'
-    ]
+    ],
+    cmdclass={'build_py': BuildPy}
 )
@@ -0,0 +1,91 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Test fixtures
+    ~~~~~~~~~~~~~
+    Stand-in Tower servers and mocked Cloudify operation contexts
+"""
+
+import pytest
+
+from cloudify.state import current_ctx
+
+from cloudify_ansible_tower import connection
+from cloudify_ansible_tower.cache import RESOLUTION_CACHE
+
+from benchmarks.load import make_ctx
+from benchmarks.server import StandIn
+
+
+@pytest.fixture
+def stand_in():
+    """
+        Starts stand-in Tower servers, with the given fault
+        injection settings, stopping them when the test ends
+    Example::
+        def test_throttled(stand_in):
+            server = stand_in(throttle_rate=1.0)
+    """
+    servers = list()
+
+    def start(**kwargs):
+        server = StandIn(seed=0, **kwargs)
+        server.start()
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def server(stand_in):
+    """Stand-in Tower server without injected faults"""
+    return stand_in()
+
+
+@pytest.fixture
+def context(server):
+    """
+        Builds operation contexts for the stand-in server, with the
+        given client configuration, and sets the last one built as
+        the current Cloudify context
+    Example::
+        def test_cached(context):
+            ctx = context(response_cache=dict(enabled=True))
+    """
+    def build(endpoint=None, properties=None, relationships=None,
+              **client_config):
+        _ctx = make_ctx(endpoint or server.endpoint, properties,
+                        relationships, **client_config)
+        current_ctx.set(_ctx)
+        return _ctx
+    yield build
+    current_ctx.clear()
+
+
+@pytest.fixture
+def ctx(context):
+    """Operation context, set as the current Cloudify context"""
+    return context()
+
+
+@pytest.fixture(autouse=True)
+def isolated():
+    """Tests share no cached lookups, sessions or clusters"""
+    RESOLUTION_CACHE.clear()
+    yield
+    RESOLUTION_CACHE.clear()
+    connection.close_sessions()
@@ -0,0 +1,162 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Circuit breaker tests
+    ~~~~~~~~~~~~~~~~~~~~~
+    Circuit states against a stand-in failing with 503s, then
+    recovering, and against a Tower that can't be reached
+"""
+
+import time
+
+import pytest
+import requests
+
+from cloudify.exceptions import NonRecoverableError, RecoverableError
+
+from cloudify_ansible_tower import breaker, utils
+from cloudify_ansible_tower.connection import Connection
+
+THRESHOLD = 3
+RESET_TIMEOUT = 1
+
+
+@pytest.fixture
+def guarded(context, tmp_path):
+    """Builds contexts with the circuit breaker enabled"""
+    def build(endpoint=None):
+        return context(endpoint, circuit_breaker=dict(
+            enabled=True, failure_threshold=THRESHOLD,
+            reset_timeout=RESET_TIMEOUT, path=str(tmp_path / 'breaker')))
+    return build
+
+
+def get():
+    return Connection().request(method='get', url='/api/v2/')
+
+
+def state():
+    return utils.read_state_file(Connection().circuit_breaker.path)
+
+
+def fail():
+    # 503s exhaust urllib3's retries
+    with pytest.raises(requests.exceptions.RetryError):
+        get()
+
+
+def open_circuit(server):
+    for _ in range(THRESHOLD):
+        fail()
+    assert state()['state'] == breaker.OPEN
+
+
+def test_closed(server, guarded):
+    guarded(server.endpoint)
+    assert get().status_code == 200
+    assert not state() or state()['state'] == breaker.CLOSED
+
+
+def test_opens_after_threshold(stand_in, guarded):
+    server = stand_in(error_rate=1.0)
+    guarded(server.endpoint)
+    started = time.time()
+    for count in range(THRESHOLD):
+        fail()
+        assert state()['failures'] == count + 1
+    # Only one urllib3 retry behind each failure
+    assert sum(server.calls.values()) == 2 * THRESHOLD
+    assert time.time() - started < 5
+    assert state()['state'] == breaker.OPEN
+    # Requests now fail fast, without reaching Tower
+    with pytest.raises(RecoverableError) as error:
+        get()
+    assert 'circuit open' in str(error.value)
+    assert error.value.retry_after >= 1
+    assert sum(server.calls.values()) == 2 * THRESHOLD
+
+
+def test_success_resets_count(stand_in, guarded):
+    server = stand_in(error_rate=1.0)
+    guarded(server.endpoint)
+    for _ in range(THRESHOLD - 1):
+        fail()
+    server.error_rate = 0
+    assert get().status_code == 200
+    assert state()['failures'] == 0
+    assert state()['state'] == breaker.CLOSED
+
+
+def test_half_open_closes_on_recovery(stand_in, guarded):
+    server = stand_in(error_rate=1.0)
+    guarded(server.endpoint)
+    open_circuit(server)
+    server.error_rate = 0
+    time.sleep(RESET_TIMEOUT)
+    # The next request probes /api/v2/ping/ (half-open), then goes on
+    assert get().status_code == 200
+    assert server.calls[('GET', '/api/v2/ping/')] == 1
+    assert state()['state'] == breaker.CLOSED
+    assert state()['failures'] == 0
+
+
+def test_half_open_reopens_on_failure(stand_in, guarded):
+    server = stand_in(error_rate=1.0)
+    guarded(server.endpoint)
+    open_circuit(server)
+    time.sleep(RESET_TIMEOUT)
+    with pytest.raises(RecoverableError) as error:
+        get()
+    assert 'probe failed' in str(error.value)
+    assert state()['state'] == breaker.OPEN
+    # Open again, for a whole reset_timeout
+    with pytest.raises(RecoverableError) as error:
+        get()
+    assert 'circuit open' in str(error.value)
+
+
+def test_probe_in_progress(stand_in, guarded):
+    server = stand_in(error_rate=1.0)
+    guarded(server.endpoint)
+    open_circuit(server)
+    time.sleep(RESET_TIMEOUT)
+
+    def probing(state, now):
+        state.update(state=breaker.HALF_OPEN, until=now + 5)
+    Connection().circuit_breaker.update(probing)
+    # Another process is probing, this one keeps failing fast
+    with pytest.raises(RecoverableError) as error:
+        get()
+    assert 'probe in progress' in str(error.value)
+
+
+def test_unreachable_opens_within_seconds(guarded):
+    guarded('http://127.0.0.1:1')
+    started = time.time()
+    for _ in range(THRESHOLD):
+        with pytest.raises(requests.ConnectionError):
+            get()
+    with pytest.raises(RecoverableError):
+        get()
+    assert time.time() - started < 5
+
+
+def test_shared_directory_refused(server, context, tmp_path):
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    shared.chmod(0o777)
+    context(circuit_breaker=dict(enabled=True, path=str(shared)))
+    with pytest.raises(NonRecoverableError):
+        Connection()
@@ -0,0 +1,92 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Resolution cache tests
+    ~~~~~~~~~~~~~~~~~~~~~~
+    Name-to-ID resolutions served from, and dropped from, the cache
+"""
+
+import time
+
+from cloudify_ansible_tower.cache import RESOLUTION_CACHE, ResolutionCache
+from cloudify_ansible_tower.resources.organization import Organization
+
+
+def requests_made(server):
+    return sum(server.calls.values())
+
+
+def test_lookup_cached(ctx, server):
+    org = server.add('organizations', name='cached')
+    assert Organization().lookup_id('cached') == org['id']
+    made = requests_made(server)
+    assert Organization().lookup_id('cached') == org['id']
+    assert requests_made(server) == made
+    assert RESOLUTION_CACHE.stats()['hits'] == 1
+
+
+def test_missing_cached(ctx, server):
+    assert Organization().lookup_id('missing') is None
+    made = requests_made(server)
+    assert Organization().lookup_id('missing') is None
+    assert requests_made(server) == made
+    assert RESOLUTION_CACHE.stats()['negative_hits'] == 1
+
+
+def test_create_invalidates(ctx, server):
+    assert Organization().lookup_id('created') is None
+    created = Organization().create(dict(name='created'))
+    assert Organization().lookup_id('created') == created['id']
+
+
+def test_delete_invalidates(ctx, server):
+    org = server.add('organizations', name='deleted')
+    resource = Organization()
+    assert resource.lookup_id('deleted') == org['id']
+    resource.resource_id = org['id']
+    resource.delete()
+    assert Organization().lookup_id('deleted') is None
+
+
+def test_collections_invalidated_separately():
+    cache = ResolutionCache()
+    cache.set(('tower', '/projects'), 'web', 1)
+    cache.set(('tower', '/teams'), 'web', 2)
+    cache.invalidate(('tower', '/projects'))
+    assert cache.get(('tower', '/projects'), 'web') == (False, None)
+    assert cache.get(('tower', '/teams'), 'web') == (True, 2)
+
+
+def test_ttls():
+    cache = ResolutionCache(ttls={'/jobs': 0}, default_ttl=60,
+                            negative_ttl=0.05)
+    cache.set(('tower', '/jobs'), 'job', 1)
+    assert cache.get(('tower', '/jobs'), 'job') == (False, None)
+    cache.set(('tower', '/projects'), 'missing', None)
+    assert cache.get(('tower', '/projects'), 'missing') == (True, None)
+    time.sleep(0.1)
+    assert cache.get(('tower', '/projects'), 'missing') == (False, None)
+
+
+def test_lru_eviction():
+    cache = ResolutionCache(maxsize=2)
+    namespace = ('tower', '/projects')
+    cache.set(namespace, 'a', 1)
+    cache.set(namespace, 'b', 2)
+    cache.get(namespace, 'a')
+    cache.set(namespace, 'c', 3)
+    assert cache.get(namespace, 'b') == (False, None)
+    assert cache.get(namespace, 'a') == (True, 1)
+    assert cache.stats()['evictions'] == 1
@@ -0,0 +1,126 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Cluster tests
+    ~~~~~~~~~~~~~
+    Routing and failover across stand-in Tower nodes
+"""
+
+import time
+
+import pytest
+import requests
+
+from cloudify_ansible_tower.connection import Connection
+
+# Nothing listens there, connections are refused
+UNREACHABLE = 'http://127.0.0.1:1'
+
+
+@pytest.fixture
+def clustered(context):
+    """Builds contexts for a cluster of the given node endpoints"""
+    def build(endpoints, **cluster):
+        cluster.setdefault('health_interval', 0)
+        return context(endpoints, cluster=cluster)
+    return build
+
+
+def get(url='/api/v2/'):
+    return Connection().request(method='get', url=url)
+
+
+def post():
+    return Connection().request(
+        method='post', url='/api/v2/labels/', json=dict(name='label'))
+
+
+def nodes():
+    return dict((node.url, node) for node in Connection().cluster.nodes)
+
+
+def test_read_fails_over_unreachable(server, clustered):
+    clustered([UNREACHABLE, server.endpoint])
+    assert get().status_code == 200
+    assert not nodes()[UNREACHABLE].healthy
+    # Later reads skip the node that is down
+    started = time.time()
+    for _ in range(5):
+        assert get().status_code == 200
+    assert time.time() - started < 1
+    assert sum(server.calls.values()) == 6
+
+
+def test_read_fails_over_server_error(stand_in, clustered):
+    failing, healthy = stand_in(error_rate=1.0), stand_in()
+    clustered([failing.endpoint, healthy.endpoint], routing='outstanding')
+    assert get().status_code == 200
+    assert failing.faults[503] and healthy.calls
+    # The failing node answered, so it stays in rotation
+    assert nodes()[failing.endpoint].healthy
+
+
+def test_write_fails_over_and_sticks(stand_in, clustered):
+    second, third = stand_in(), stand_in()
+    clustered([UNREACHABLE, second.endpoint, third.endpoint])
+    for _ in range(3):
+        assert post().status_code == 201
+    assert len(second.collections['labels']) == 3
+    assert not third.collections['labels']
+
+
+def test_write_not_retried_on_server_error(stand_in, clustered):
+    failing, healthy = stand_in(error_rate=1.0), stand_in()
+    clustered([failing.endpoint, healthy.endpoint])
+    assert post().status_code == 503
+    assert not healthy.calls
+    assert nodes()[failing.endpoint].healthy
+
+
+def test_every_node_unreachable(clustered):
+    clustered([UNREACHABLE, 'http://127.0.0.1:2'])
+    with pytest.raises(requests.ConnectionError):
+        get()
+
+
+def test_retried_without_health_checks(server, clustered):
+    clustered([UNREACHABLE, server.endpoint], retry_interval=0.2)
+    get()
+    assert not nodes()[UNREACHABLE].healthy
+    time.sleep(0.3)
+    # Tried again (and marked down again) on the next request
+    get()
+    assert not nodes()[UNREACHABLE].healthy
+    assert nodes()[UNREACHABLE].failed_at > time.time() - 0.2
+
+
+def test_back_after_health_check(stand_in, clustered):
+    first, second = stand_in(), stand_in()
+    clustered([first.endpoint, second.endpoint], health_interval=0.1)
+    cluster = Connection().cluster
+    cluster.mark_down(nodes()[first.endpoint], 'test')
+    time.sleep(0.5)
+    assert nodes()[first.endpoint].healthy
+    assert nodes()[first.endpoint].latency is not None
+
+
+def test_ping_through_any_node(server, clustered):
+    clustered([UNREACHABLE, server.endpoint])
+    assert Connection().ping()
+
+
+def test_ping_no_node(clustered):
+    clustered([UNREACHABLE, 'http://127.0.0.1:2'])
+    assert not Connection().ping()
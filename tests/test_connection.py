@@ -0,0 +1,106 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Connection tests
+    ~~~~~~~~~~~~~~~~
+    Pooled sessions and the asyncio client layer
+"""
+
+import pytest
+
+from cloudify_ansible_tower import connection
+from cloudify_ansible_tower.connection import AsyncConnection, Connection
+from cloudify_ansible_tower.resources.organization import Organization
+
+
+def add_organizations(server, count):
+    return [server.add('organizations', name='organization-{0}'.format(i))
+            for i in range(count)]
+
+
+def test_sessions_pooled(ctx):
+    assert Connection().session is Connection().session
+
+
+def test_close_sessions(ctx):
+    session = Connection().session
+    connection.close_sessions()
+    assert Connection().session is not session
+
+
+def test_gather_keeps_order(ctx, server):
+    organizations = add_organizations(server, 20)
+    client = AsyncConnection(Connection())
+    responses = connection.gather(
+        [client.request(method='get', url=org['url'])
+         for org in organizations])
+    assert [res.json()['id'] for res in responses] == \
+        [org['id'] for org in organizations]
+
+
+def test_gather_limit(ctx, server):
+    organizations = add_organizations(server, 20)
+    ids = connection.gather(
+        [Organization().async_lookup_id(org['name'])
+         for org in organizations], limit=3)
+    assert ids == [org['id'] for org in organizations]
+
+
+def test_gather_return_exceptions(ctx):
+    async def fail():
+        raise ValueError('failed')
+
+    async def succeed():
+        return 1
+    results = connection.gather(
+        [succeed(), fail(), succeed()], return_exceptions=True)
+    assert results[0] == results[2] == 1
+    assert isinstance(results[1], ValueError)
+    with pytest.raises(ValueError):
+        connection.gather([succeed(), fail()])
+
+
+def test_async_calls_keep_context(ctx, server):
+    # Worker threads run under the caller's Cloudify context
+    org = add_organizations(server, 1)[0]
+    resource = Organization()
+    resource.resource_id = org['id']
+    assert connection.run_until_complete(resource.async_get())['name'] == \
+        org['name']
+
+
+def test_async_exists(ctx, server):
+    org = add_organizations(server, 1)[0]
+    resource = Organization()
+    resource.resource_id = org['id']
+    assert connection.run_until_complete(resource.async_exists())
+    resource.resource_id = org['id'] + 1000
+    assert not connection.run_until_complete(resource.async_exists())
+
+
+def test_async_create_delete(ctx, server):
+    resource = Organization()
+    created = connection.run_until_complete(
+        resource.async_create(dict(name='created')))
+    assert created['id'] in server.collections['organizations']
+    resource.resource_id = created['id']
+    connection.run_until_complete(resource.async_delete())
+    assert created['id'] not in server.collections['organizations']
+
+
+def test_async_list(ctx, server):
+    add_organizations(server, 3)
+    page = connection.run_until_complete(Organization().async_list())
+    assert page['count'] == 3
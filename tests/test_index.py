@@ -0,0 +1,130 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Object index tests
+    ~~~~~~~~~~~~~~~~~~
+    Lookups served from the on-disk index, its invalidation and the
+    privacy of its files
+"""
+
+import os
+import stat
+
+import pytest
+
+from cloudify.exceptions import NonRecoverableError
+
+from cloudify_ansible_tower import utils
+from cloudify_ansible_tower.cache import RESOLUTION_CACHE
+from cloudify_ansible_tower.index import ObjectIndex
+from cloudify_ansible_tower.resources.organization import Organization
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    return str(tmp_path / 'state' / 'index.sqlite')
+
+
+@pytest.fixture
+def indexed(context, index_path):
+    """Operation context with the object index enabled"""
+    return context(object_index=dict(enabled=True, path=index_path))
+
+
+def requests_made(server):
+    return sum(server.calls.values())
+
+
+def test_lookup_indexed(indexed, server):
+    orgs = [server.add('organizations', name='org-{0}'.format(i))
+            for i in range(5)]
+    assert Organization().lookup_id('org-0') == orgs[0]['id']
+    # The whole collection was swept, in a fresh process (no
+    # in-process cache) the other names resolve without requests
+    RESOLUTION_CACHE.clear()
+    made = requests_made(server)
+    assert [Organization().lookup_id(org['name']) for org in orgs] == \
+        [org['id'] for org in orgs]
+    assert requests_made(server) == made
+
+
+def test_create_invalidates(indexed, server):
+    server.add('organizations', name='existing')
+    assert Organization().lookup_id('created') is None
+    created = Organization().create(dict(name='created'))
+    RESOLUTION_CACHE.clear()
+    assert Organization().lookup_id('created') == created['id']
+
+
+def test_delete_invalidates(indexed, server):
+    org = server.add('organizations', name='deleted')
+    resource = Organization()
+    assert resource.lookup_id('deleted') == org['id']
+    resource.resource_id = org['id']
+    resource.delete()
+    RESOLUTION_CACHE.clear()
+    assert Organization().lookup_id('deleted') is None
+
+
+def test_ambiguous_names_not_indexed(index_path):
+    index = ObjectIndex(index_path)
+    index.sweep('tower', '/projects', ['id', 'name'], [dict(results=[
+        dict(id=1, name='web'), dict(id=2, name='web'),
+        dict(id=3, name='db')])])
+    assert index.get('tower', '/projects', ['name'], 'web') is None
+    assert index.get('tower', '/projects', ['name'], 'db') == 3
+    assert index.get('tower', '/projects', ['id'], 2) == 2
+
+
+def test_files_private(index_path):
+    ObjectIndex(index_path)
+    assert stat.S_IMODE(os.stat(os.path.dirname(index_path)).st_mode) == \
+        0o700
+    for path in [index_path, index_path + '.lock']:
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+
+def test_shared_directory_refused(tmp_path):
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    shared.chmod(0o777)
+    with pytest.raises(NonRecoverableError):
+        ObjectIndex(str(shared / 'index.sqlite'))
+
+
+def test_planted_file_refused(index_path):
+    utils.make_private(os.path.dirname(index_path), directory=True)
+    with open(index_path, 'w'):
+        pass
+    os.chmod(index_path, 0o666)
+    with pytest.raises(NonRecoverableError):
+        ObjectIndex(index_path)
+
+
+@pytest.mark.skipif(os.getuid() != 0, reason='needs to change owners')
+def test_foreign_file_refused(index_path):
+    utils.make_private(os.path.dirname(index_path), directory=True)
+    with open(index_path, 'w'):
+        pass
+    os.chown(index_path, 4242, 4242)
+    with pytest.raises(NonRecoverableError):
+        ObjectIndex(index_path)
+
+
+def test_symlink_refused(tmp_path, index_path):
+    utils.make_private(os.path.dirname(index_path), directory=True)
+    os.symlink(str(tmp_path / 'elsewhere.sqlite'), index_path)
+    with pytest.raises(NonRecoverableError):
+        ObjectIndex(index_path)
@@ -0,0 +1,97 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Metrics tests
+    ~~~~~~~~~~~~~
+    Request metrics exported when operations end
+"""
+
+import os
+import stat
+
+import pytest
+
+from cloudify_ansible_tower import metrics
+from cloudify_ansible_tower.connection import Connection
+
+
+@pytest.fixture
+def prom_path(tmp_path):
+    return str(tmp_path / 'state' / 'metrics.prom')
+
+
+@pytest.fixture
+def measured(context, prom_path):
+    """Operation context with metrics enabled"""
+    return context(metrics=dict(enabled=True, path=prom_path))
+
+
+@metrics.collect
+def create(**_):
+    Connection().request(method='get', url='/api/v2/ping/')
+
+
+@metrics.collect
+def delete(**_):
+    Connection().request(method='get', url='/api/v2/ping/')
+
+
+def test_exported(measured, prom_path):
+    create()
+    create()
+    summary = measured.instance.runtime_properties['metrics']
+    assert summary
+    with open(prom_path) as prom_file:
+        text = prom_file.read()
+    # Totals accumulate across operations
+    assert 'cloudify_ansible_tower_requests_total{' \
+        'method="GET",endpoint="/api/v2/ping/",status="200"} 2' in text
+    assert stat.S_IMODE(os.stat(prom_path).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(os.path.dirname(prom_path)).st_mode) == \
+        0o700
+
+
+def test_delete_not_stored(measured, prom_path):
+    delete()
+    assert 'metrics' not in measured.instance.runtime_properties
+    assert os.path.exists(prom_path)
+
+
+def test_shared_directory_refused(context, tmp_path):
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    shared.chmod(0o777)
+    _ctx = context(metrics=dict(
+        enabled=True, path=str(shared / 'metrics.prom')))
+    # The operation succeeds, without writing the file
+    create()
+    assert not os.listdir(str(shared))
+    assert _ctx.instance.runtime_properties['metrics']
+
+
+def test_export_failure_ignored(measured, monkeypatch):
+    def fail(**_):
+        raise RuntimeError('conflict')
+    monkeypatch.setattr(metrics, 'export', fail)
+    create()
+
+
+def test_operation_error_kept(measured, monkeypatch):
+    @metrics.collect
+    def failing(**_):
+        raise ValueError('failed')
+    monkeypatch.setattr(metrics, 'export', lambda **_: 1 / 0)
+    with pytest.raises(ValueError):
+        failing()
@@ -0,0 +1,99 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Rate limiting tests
+    ~~~~~~~~~~~~~~~~~~~
+    Token buckets and the handling of throttled (429) responses
+"""
+
+import time
+
+import pytest
+
+from cloudify.exceptions import NonRecoverableError
+
+from cloudify_ansible_tower.connection import Connection
+
+
+@pytest.fixture
+def rate_limited(context, tmp_path):
+    """Builds contexts with rate limiting enabled"""
+    def build(endpoint=None, **rate_limit):
+        rate_limit.update(enabled=True, path=str(tmp_path / 'ratelimit'))
+        return context(endpoint, rate_limit=rate_limit)
+    return build
+
+
+def ping():
+    return Connection().request(method='get', url='/api/v2/ping/')
+
+
+def test_throttled_retried_by_limiter_only(stand_in, rate_limited):
+    server = stand_in(throttle_rate=1.0, retry_after=1)
+    rate_limited(server.endpoint, max_retries=2)
+    started = time.time()
+    assert ping().status_code == 429
+    # urllib3 doesn't retry 429s on its own, the limiter does
+    assert sum(server.calls.values()) == 3
+    # ...after the Retry-After delay each time
+    assert time.time() - started >= 2
+
+
+def test_throttling_blocks_other_connections(stand_in, rate_limited):
+    server = stand_in(throttle_rate=1.0, retry_after=1)
+    rate_limited(server.endpoint, max_retries=0)
+    assert ping().status_code == 429
+    server.throttle_rate = 0
+    started = time.time()
+    assert ping().status_code == 200
+    assert time.time() - started >= 0.9
+
+
+def test_throttled_then_served(stand_in, rate_limited):
+    server = stand_in(throttle_rate=0.5, retry_after=0)
+    rate_limited(server.endpoint, max_retries=20)
+    assert all(ping().status_code == 200 for _ in range(10))
+    assert sum(server.calls.values()) == 10 + server.faults[429]
+
+
+def test_rate(server, rate_limited):
+    rate_limited(server.endpoint, rate=10, burst=2, jitter=0)
+    started = time.time()
+    for _ in range(7):
+        ping()
+    # Two requests from the burst, then 10 per second
+    assert time.time() - started >= 0.45
+
+
+def test_endpoint_bucket(server, rate_limited):
+    rate_limited(server.endpoint, jitter=0, endpoints={
+        '/ping/': dict(rate=5, burst=1)})
+    started = time.time()
+    for _ in range(3):
+        ping()
+    assert time.time() - started >= 0.35
+    started = time.time()
+    for _ in range(3):
+        Connection().request(method='get', url='/api/v2/')
+    assert time.time() - started < 0.35
+
+
+def test_shared_directory_refused(server, context, tmp_path):
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    shared.chmod(0o777)
+    context(rate_limit=dict(enabled=True, path=str(shared)))
+    with pytest.raises(NonRecoverableError):
+        Connection()
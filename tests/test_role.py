@@ -0,0 +1,121 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Role assignment tests
+    ~~~~~~~~~~~~~~~~~~~~~
+    Batched grants of the roles of one resource, with the users
+    and teams resolved in bulk
+"""
+
+import pytest
+
+from cloudify.exceptions import NonRecoverableError
+
+from cloudify_ansible_tower.resources import role
+from cloudify_ansible_tower.resources.job_template import JobTemplate
+from cloudify_ansible_tower.resources.user import User
+
+from benchmarks.load import make_relationship, make_subject
+
+
+@pytest.fixture
+def directory(server):
+    """Job template, 30 users and 2 teams on the stand-in"""
+    return dict(
+        template=server.add('job_templates', name='deploy'),
+        users=[server.add('users', username='user-{0}'.format(i))
+               for i in range(30)],
+        teams=[server.add('teams', name='team-{0}'.format(i))
+               for i in range(2)])
+
+
+def batch(context, users, teams=(), relationships=None, **target):
+    """Current context of a RoleBatch granting Execute and Read"""
+    return context(properties=dict(resource_config=dict(
+        target_type=target.get('target_type', 'JobTemplate'),
+        target=target.get('target', 'deploy'),
+        roles=[dict(role='Execute', users=list(users)),
+               dict(role='Read', teams=list(teams))])),
+        relationships=relationships)
+
+
+def role_members(server, template, name, sub):
+    field = name.lower() + '_role'
+    role_id = template['summary_fields']['object_roles'][field]['id']
+    return server.members[('roles', role_id, sub)]
+
+
+def test_assign_batch(context, server, directory):
+    users = [user['username'] for user in directory['users']]
+    batch(context, users, [team['name'] for team in directory['teams']])
+    role.assign_batch()
+    template = directory['template']
+    assert role_members(server, template, 'Execute', 'users') == \
+        set(user['id'] for user in directory['users'])
+    assert role_members(server, template, 'Read', 'teams') == \
+        set(team['id'] for team in directory['teams'])
+    # One bulk lookup per principal type, not one per principal
+    assert server.calls[('GET', '/api/v2/users/')] == 1
+    assert server.calls[('GET', '/api/v2/teams/')] == 1
+
+
+def test_assign_batch_rerun(context, server, directory):
+    batch(context, [user['username'] for user in directory['users']])
+    role.assign_batch()
+    posted = server.calls[('POST', '/api/v2/roles/{id}/users/')]
+    assert posted == 30
+    role.assign_batch()
+    assert server.calls[('POST', '/api/v2/roles/{id}/users/')] == posted
+
+
+def test_unassign_batch(context, server, directory):
+    batch(context, [user['username'] for user in directory['users']])
+    role.assign_batch()
+    role.unassign_batch()
+    assert not role_members(
+        server, directory['template'], 'Execute', 'users')
+
+
+def test_assign_batch_missing(context, server, directory):
+    batch(context, ['user-0', 'nobody', 'user-1'])
+    with pytest.raises(NonRecoverableError, match='nobody'):
+        role.assign_batch()
+    assert not server.calls[('POST', '/api/v2/roles/{id}/users/')]
+
+
+def test_assign_batch_target_type(context, directory):
+    batch(context, ['user-0'], target_type='Host')
+    with pytest.raises(NonRecoverableError, match='not one of'):
+        role.assign_batch()
+
+
+def test_assign_batch_relationship(context, server, directory):
+    template = directory['template']
+    batch(context, ['user-0'], target='', relationships=[
+        make_relationship(server.endpoint, 'roles_assigned_to',
+                          'JobTemplate', template['id'])])
+    role.assign_batch()
+    assert role_members(server, template, 'Execute', 'users') == \
+        set([directory['users'][0]['id']])
+
+
+def test_assign_resolves_in_bulk(ctx, server, directory):
+    users = [(User(_ctx=make_subject(server.endpoint, 'User',
+                                     user['username'])), 'Execute')
+             for user in directory['users']]
+    target = JobTemplate()
+    target.resource_id = directory['template']['id']
+    assert role.Role().assign(target, users) == 30
+    assert server.calls[('GET', '/api/v2/users/')] == 1
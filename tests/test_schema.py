@@ -0,0 +1,90 @@
+# #######
+# Copyright (c) 2020 Cloudify Platform Ltd. All rights reserved
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+    Schema tests
+    ~~~~~~~~~~~~
+    Payload coercion by the data types of plugin.yaml, and the
+    errors reported for values that can't be coerced
+"""
+
+import pytest
+
+from cloudify.exceptions import NonRecoverableError
+
+from cloudify_ansible_tower import schema
+from cloudify_ansible_tower.resources.job_template import JobTemplate
+
+
+def test_schema_loaded():
+    coercers = schema.get_schema('JobTemplate')
+    assert {'name', 'forks', 'verbosity', 'job_type',
+            'become_enabled'} <= set(coercers)
+
+
+def test_coerced():
+    assert schema.normalize(dict(
+        name=5, forks='10', verbosity=2.0, become_enabled='yes',
+        job_type='check', project='12', inventory='web'),
+        'JobTemplate') == dict(
+        name='5', forks=10, verbosity=2, become_enabled=True,
+        job_type='check', project=12, inventory='web')
+
+
+def test_undeclared_fields_kept():
+    assert schema.normalize(
+        dict(custom=('a', b'b'), forks=None), 'JobTemplate') == \
+        dict(custom=['a', 'b'], forks=None)
+
+
+@pytest.mark.parametrize('field,value', [
+    ('forks', 'ten'),
+    ('forks', 1.5),
+    ('forks', True),
+    ('verbosity', 9),
+    ('become_enabled', 'maybe'),
+    ('job_type', 'deploy'),
+    ('name', dict(a=1)),
+])
+def test_invalid_field(field, value):
+    with pytest.raises(NonRecoverableError) as error:
+        schema.normalize({field: value}, 'JobTemplate')
+    assert field in str(error.value)
+
+
+def test_every_error_reported():
+    with pytest.raises(NonRecoverableError) as error:
+        schema.normalize(
+            dict(forks='ten', verbosity=9, name='ok'), 'JobTemplate')
+    message = str(error.value)
+    assert 'forks: expected an integer' in message
+    assert 'verbosity: expected an integer from 0 to 5' in message
+    assert 'name' not in message
+
+
+def test_unserializable_value():
+    with pytest.raises(NonRecoverableError) as error:
+        schema.normalize(dict(extra_vars=dict(x=object())))
+    assert 'extra_vars' in str(error.value)
+
+
+def test_invalid_payload_type():
+    with pytest.raises(NonRecoverableError):
+        schema.normalize('name=web')
+
+
+def test_invalid_create_not_sent(ctx, server):
+    with pytest.raises(NonRecoverableError):
+        JobTemplate().create(dict(name='web', forks='ten'))
+    assert not server.calls